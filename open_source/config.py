@@ -29,6 +29,16 @@ class BaseConfig(object):
     SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'DoNotReply@osource.co.za')
     SENDER_PASSWORD = os.environ.get('SENDER_PASSWORD', 'BbJoQ~@4*$i)')
 
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'mail.osource.co.za')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 465))
+    SMTP_SSL = os.environ.get('SMTP_SSL', '1') == '1'
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))
+
+    # certificates, receipts and uploads; absolute so it does not depend on the working directory
+    UPLOADS_DIR = os.path.abspath(os.environ.get(
+        'UPLOADS_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'uploads')
+    ))
+
     MYSQL_HOST = os.environ.get('MYSQL_HOST', '127.0.0.1')
     MYSQL_USER = os.environ.get('MYSQL_USER', 'osource')
     MYSQL_PORT = os.environ.get('MYSQL_PORT', 3306)
@@ -2,7 +2,7 @@ from datetime import datetime
 
 
 from sqlalchemy import event, DDL
-from open_source.core import parlours, consultants, plans, applicants, main_members, extended_members, audit, certificate, admins, notifications
+from open_source.core import parlours, consultants, plans, applicants, main_members, extended_members, audit, certificate, admins, notifications, member_counters, member_identities, age_limits, jobs
 from open_source import db
 
 
@@ -24,4 +24,17 @@ def before_insert(mapper, connection, target):
 # register before_update on all table classes
 for clazz in db.Base.__subclasses__():
     event.listen(clazz, 'before_update', before_update)
-    event.listen(clazz, 'before_insert', before_insert)
\ No newline at end of file
+    event.listen(clazz, 'before_insert', before_insert)
+
+# keep the dashboard member counters in step with member writes
+event.listen(db.Session, 'after_flush', member_counters.record_flush)
+event.listen(db.Session, 'before_commit', member_counters.refresh_dirty)
+event.listen(db.Session, 'after_rollback', member_counters.forget_dirty)
+
+# keep the per parlour ID number index used by the duplicate checks in step
+event.listen(db.Session, 'after_flush', member_identities.sync)
+
+# keep the indexed birthday used by the incremental age limit run in step
+for clazz in (main_members.MainMember, extended_members.ExtendedMember):
+    event.listen(clazz, 'before_insert', age_limits.set_birthday)
+    event.listen(clazz, 'before_update', age_limits.set_birthday)
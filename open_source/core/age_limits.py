@@ -0,0 +1,327 @@
+"""
+Precomputes ``age_limit_exceeded`` for main and extended members.
+
+List endpoints only read the flag; it is recomputed in bulk by the daily
+``scripts/update_age_limit.py`` run and whenever a plan's age limits change.
+Members are read as plain columns in batches and the flag is written back
+with one set based UPDATE per chunk of ids whose value actually changed.
+
+An age only changes on a birthday, so the daily run is incremental: members
+carry their 'MMDD' birthday in an indexed column and run_incremental only
+re-evaluates the members whose birthday fell since the last recorded run.
+
+Usage::
+
+    with db.transaction() as session:
+        age_limits.recompute(session, parlour_id=parlour.id)
+        >> {'main_members': 12, 'extended_members': 40}
+
+        age_limits.run_incremental(session)
+        >> {'main_members': 1, 'extended_members': 3}
+"""
+import logging
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from open_source import db, id_numbers
+from open_source.core.applicants import Applicant
+from open_source.core.extended_members import ExtendedMember
+from open_source.core.main_members import MainMember
+from open_source.core.plans import Plan
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Column, Integer, Date, DateTime, bindparam, func, select
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# past this many days since the last run a full sweep is cheaper than listing birthdays
+FULL_SWEEP_DAYS = 180
+
+EXTENDED_LIMIT_COLUMNS = (
+    Plan.dependant_minimum_age, Plan.dependant_maximum_age,
+    Plan.extended_minimum_age, Plan.extended_maximum_age,
+    Plan.additional_extended_minimum_age, Plan.additional_extended_maximum_age,
+    Plan.spouse_minimum_age, Plan.spouse_maximum_age,
+)
+
+# ExtendedMember.type -> offsets of its (minimum, maximum) ages in EXTENDED_LIMIT_COLUMNS
+EXTENDED_LIMITS = {1: (0, 1), 2: (2, 3), 3: (4, 5), 4: (6, 7)}
+
+
+def birthday(id_number=None, date_of_birth=None) -> Optional[str]:
+    """ 'MMDD' of a member's date of birth, or None when it is unknown. """
+    dob = id_numbers.parse_date_of_birth(date_of_birth, id_number)
+    return dob.strftime('%m%d') if dob else None
+
+
+def set_birthday(mapper, connection, target):
+    """ before_insert/before_update: keeps the indexed birthday column in step. """
+    target.birthday = birthday(target.id_number, target.date_of_birth)
+
+
+def backfill_birthdays(connection, table) -> int:
+    """
+    Fills the birthday column of the rows of a member table that have none,
+    parsed in Python the same way set_birthday does so it works on any
+    database. Runs core statements only; the caller commits.
+    """
+    rows = connection.execute(select(
+        table.c.id, table.c.id_number, table.c.date_of_birth
+    ).where(table.c.birthday.is_(None))).fetchall()
+
+    values = [
+        {'member_id': id, 'birthday': value}
+        for id, id_number, date_of_birth in rows
+        for value in [birthday(id_number, date_of_birth)] if value
+    ]
+    update = table.update().where(table.c.id == bindparam('member_id')).values(birthday=bindparam('birthday'))
+    for i in range(0, len(values), BATCH_SIZE):
+        connection.execute(update, values[i:i + BATCH_SIZE])
+    return len(values)
+
+
+def birthdays_between(start: date, end: date) -> List[str]:
+    """
+    'MMDD' birthdays in (start, end]. Members born on 29 February age on
+    1 March in common years, so 0229 joins the days that include 1 March.
+    """
+    result = set()
+    day = start + timedelta(days=1)
+    while day <= end:
+        result.add(day.strftime('%m%d'))
+        if day.month == 3 and day.day == 1:
+            result.add('0229')
+        day += timedelta(days=1)
+    return sorted(result)
+
+
+class AgeLimitRun(db.Base):
+    """ One row per incremental age limit run; the latest run_date bounds the next run. """
+    __tablename__ = 'age_limit_runs'
+
+    id = Column(Integer, primary_key=True)
+    run_date = Column(Date, nullable=False)
+    main_members = Column(Integer, default=0)
+    extended_members = Column(Integer, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
+    @classmethod
+    def last_run_date(cls, session) -> Optional[date]:
+        return session.query(func.max(cls.run_date)).scalar()
+
+
+def _limit(value) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def exceeds(dob: Optional[date], minimum, maximum, today: date = None) -> Optional[bool]:
+    """ True when the age on dob falls outside the plan limits, None when dob is unknown. """
+    if not dob:
+        return None
+
+    years = relativedelta(today or date.today(), dob).years
+    minimum, maximum = _limit(minimum), _limit(maximum)
+
+    return bool((maximum and years > maximum) or (minimum and years < minimum))
+
+
+def _chunks(ids: List[int], size: int = BATCH_SIZE) -> Iterable[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _write(session, entity, changes: Dict[int, bool]) -> int:
+    for value in (True, False):
+        ids = [id for id, exceeded in changes.items() if exceeded is value]
+        for chunk in _chunks(ids):
+            session.query(entity).filter(entity.id.in_(chunk)).update(
+                {entity.age_limit_exceeded: value}, synchronize_session=False
+            )
+    return len(changes)
+
+
+def _scope(query, parlour_id=None, plan_id=None, applicant_ids=None):
+    query = query.filter(Applicant.state.in_((Applicant.STATE_ACTIVE, Applicant.STATE_ARCHIVED)))
+    if parlour_id:
+        query = query.filter(Applicant.parlour_id == parlour_id)
+    if plan_id:
+        query = query.filter(Applicant.plan_id == plan_id)
+    if applicant_ids is not None:
+        query = query.filter(Applicant.id.in_(applicant_ids))
+    return query
+
+
+def _main_member_rows(session, birthdays=None, **scope):
+    query = _scope(session.query(
+        MainMember.id,
+        MainMember.id_number,
+        MainMember.date_of_birth,
+        MainMember.age_limit_exceeded,
+        Plan.member_minimum_age,
+        Plan.member_maximum_age
+    ).join(
+        Applicant, MainMember.applicant_id == Applicant.id
+    ).join(
+        Plan, Applicant.plan_id == Plan.id
+    ).filter(
+        MainMember.state != MainMember.STATE_DELETED
+    ), **scope)
+
+    if birthdays is not None:
+        query = query.filter(MainMember.birthday.in_(birthdays))
+    return query
+
+
+def main_member_changes(session, today: date = None, **scope) -> Dict[int, bool]:
+    changes = {}
+    for id, id_number, date_of_birth, current, minimum, maximum in _main_member_rows(session, **scope).yield_per(BATCH_SIZE):
+        exceeded = exceeds(id_numbers.parse_date_of_birth(date_of_birth, id_number, today), minimum, maximum, today)
+        if exceeded is not None and exceeded != bool(current):
+            changes[id] = exceeded
+    return changes
+
+
+def _extended_member_rows(session, birthdays=None, **scope):
+    query = _scope(session.query(
+        ExtendedMember.id,
+        ExtendedMember.type,
+        ExtendedMember.id_number,
+        ExtendedMember.date_of_birth,
+        ExtendedMember.age_limit_exceeded,
+        *EXTENDED_LIMIT_COLUMNS
+    ).join(
+        Applicant, ExtendedMember.applicant_id == Applicant.id
+    ).join(
+        Plan, Applicant.plan_id == Plan.id
+    ).filter(
+        ExtendedMember.state != ExtendedMember.STATE_DELETED
+    ), **scope)
+
+    if birthdays is not None:
+        query = query.filter(ExtendedMember.birthday.in_(birthdays))
+    return query
+
+
+def extended_member_changes(session, today: date = None, **scope) -> Dict[int, bool]:
+    changes = {}
+    for row in _extended_member_rows(session, **scope).yield_per(BATCH_SIZE):
+        id, type, id_number, date_of_birth, current = row[:5]
+        limits = row[5:]
+
+        minimum, maximum = None, None
+        if type in EXTENDED_LIMITS:
+            minimum, maximum = (limits[offset] for offset in EXTENDED_LIMITS[type])
+
+        exceeded = exceeds(id_numbers.parse_date_of_birth(date_of_birth, id_number, today), minimum, maximum, today)
+        if exceeded is not None and exceeded != bool(current):
+            changes[id] = exceeded
+    return changes
+
+
+def _exceeds(dob: pd.Series, minimum: pd.Series, maximum: pd.Series, today: date) -> pd.Series:
+    """ Vectorized exceeds: computes every age and limit breach in one pass over the arrays. """
+    before_birthday = (dob.dt.month > today.month) | ((dob.dt.month == today.month) & (dob.dt.day > today.day))
+    years = today.year - dob.dt.year - before_birthday.astype(int)
+
+    minimum = pd.to_numeric(minimum, errors='coerce').fillna(0)
+    maximum = pd.to_numeric(maximum, errors='coerce').fillna(0)
+
+    return ((maximum > 0) & (years > maximum)) | ((minimum > 0) & (years < minimum))
+
+
+def _dates_of_birth(frame: pd.DataFrame, today: date) -> pd.Series:
+    """ The stored dates of birth, falling back to the ones in the ID numbers; NaT where neither parses. """
+    from_id_numbers = pd.Series(id_numbers.dates_of_birth(frame['id_number'], today), index=frame.index, dtype=object)
+    return pd.to_datetime(frame['date_of_birth'], errors='coerce').fillna(pd.to_datetime(from_id_numbers, errors='coerce'))
+
+
+def _changes(frame: pd.DataFrame, dob: pd.Series, exceeded: pd.Series) -> Dict[int, bool]:
+    current = frame['current'].fillna(False).astype(bool)
+    changed = dob.notna() & (exceeded != current)
+    return {int(id): bool(value) for id, value in zip(frame['id'][changed], exceeded[changed])}
+
+
+def main_member_changes_vectorized(session, today: date = None, **scope) -> Dict[int, bool]:
+    today = today or date.today()
+    frame = pd.DataFrame.from_records(
+        _main_member_rows(session, **scope).all(),
+        columns=['id', 'id_number', 'date_of_birth', 'current', 'minimum', 'maximum']
+    )
+    if frame.empty:
+        return {}
+
+    dob = _dates_of_birth(frame, today)
+    return _changes(frame, dob, _exceeds(dob, frame['minimum'], frame['maximum'], today))
+
+
+def extended_member_changes_vectorized(session, today: date = None, **scope) -> Dict[int, bool]:
+    today = today or date.today()
+    limit_names = ['limit_{}'.format(i) for i in range(len(EXTENDED_LIMIT_COLUMNS))]
+    frame = pd.DataFrame.from_records(
+        _extended_member_rows(session, **scope).all(),
+        columns=['id', 'type', 'id_number', 'date_of_birth', 'current'] + limit_names
+    )
+    if frame.empty:
+        return {}
+
+    dob = _dates_of_birth(frame, today)
+    limits = frame[limit_names].apply(pd.to_numeric, errors='coerce')
+
+    types = [frame['type'] == type for type in EXTENDED_LIMITS]
+    minimum = np.select(types, [limits[limit_names[low]] for low, _ in EXTENDED_LIMITS.values()], default=np.nan)
+    maximum = np.select(types, [limits[limit_names[high]] for _, high in EXTENDED_LIMITS.values()], default=np.nan)
+
+    return _changes(frame, dob, _exceeds(dob, pd.Series(minimum, index=frame.index), pd.Series(maximum, index=frame.index), today))
+
+
+def recompute(session, parlour_id=None, plan_id=None, applicant_ids=None, birthdays=None, today: date = None, vectorized=False) -> Dict[str, int]:
+    """
+    Recomputes the age limit flags of every member in scope (all members by
+    default) and returns how many rows changed. The caller commits.
+
+    With vectorized set the scope is loaded into a DataFrame and evaluated
+    with NumPy in one pass, which is what the nightly run uses per parlour.
+    """
+    scope = {'parlour_id': parlour_id, 'plan_id': plan_id, 'applicant_ids': applicant_ids, 'birthdays': birthdays}
+
+    if vectorized:
+        main_member_changes_for, extended_member_changes_for = main_member_changes_vectorized, extended_member_changes_vectorized
+    else:
+        main_member_changes_for, extended_member_changes_for = main_member_changes, extended_member_changes
+
+    main_members = _write(session, MainMember, main_member_changes_for(session, today, **scope))
+    extended_members = _write(session, ExtendedMember, extended_member_changes_for(session, today, **scope))
+
+    logger.info("Age limits recomputed: {} main and {} extended members changed.".format(main_members, extended_members))
+
+    return {'main_members': main_members, 'extended_members': extended_members}
+
+
+def run_incremental(session, today: date = None) -> Dict[str, int]:
+    """
+    Re-evaluates only the members whose birthday fell since the last run and
+    records this run. Falls back to a vectorized full sweep on the first run or
+    after a long gap. Plan limit changes are handled by recompute(plan_id=...).
+    """
+    today = today or date.today()
+    last_run_date = AgeLimitRun.last_run_date(session)
+
+    if last_run_date and last_run_date >= today:
+        return {'main_members': 0, 'extended_members': 0}
+
+    if last_run_date is None or (today - last_run_date).days > FULL_SWEEP_DAYS:
+        changed = recompute(session, today=today, vectorized=True)
+    else:
+        changed = recompute(session, birthdays=birthdays_between(last_run_date, today), today=today)
+
+    session.add(AgeLimitRun(run_date=today, **changed))
+    return changed
@@ -1,12 +1,17 @@
 from sqlalchemy.sql.sqltypes import Boolean
 from open_source import db
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, func
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, Text, func
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
 
 class Applicant(db.Base):
     __tablename__ = 'applicants'
+    __table_args__ = (
+        Index('ix_applicants_parlour_id_state_status_consultant_id', 'parlour_id', 'state', 'status', 'consultant_id'),
+        Index('ix_applicants_certificate_dirty_at', 'certificate_dirty_at'),
+        Index('ix_applicants_parlour_id_paid_through_month', 'parlour_id', 'paid_through_month'),
+    )
 
     STATE_ARCHIVED= 2
     STATE_ACTIVE = 1
@@ -37,6 +42,13 @@ class Applicant(db.Base):
     created_at = Column(DateTime, server_default=func.now())
     modified_at = Column(DateTime, server_default=func.now())
     canceled = Column(Integer, default=0)
+    # set when the certificate no longer matches the members; cleared once it is rendered again
+    certificate_dirty_at = Column(DateTime)
+    # content hash of the rendered certificate, see certificate.content_hash
+    certificate_hash = Column(String(length=64))
+    # capture time of the latest payment and first day of the last month it covers, see payment_status.refresh_paid_through
+    last_payment_date = Column(DateTime)
+    paid_through_month = Column(Date)
 
     @declared_attr
     def parlour_id(cls):
@@ -2,46 +2,126 @@ from reportlab.lib import pagesizes
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
-
-import os
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+import hashlib
+import io
+import json
+
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from open_source import storage
+
+
+# parlours and plans laid out at once; keys are their printed content, so an edit is a new entry
+TEMPLATE_CACHE_SIZE = 512
+
+# bump when the layout changes so every certificate renders again
+LAYOUT_VERSION = 1
+
+
+def content_hash(parlour, plan, applicant, main_member, extended_members) -> str:
+    """
+    sha256 of everything a membership certificate prints. Two renders with
+    the same hash produce the same document, so an unchanged one is skipped.
+    """
+    content = [
+        LAYOUT_VERSION,
+        [parlour.parlourname, parlour.address, parlour.number, parlour.email],
+        [
+            main_member.first_name, main_member.last_name, main_member.id_number, main_member.date_joined,
+            main_member.created_at.date() if main_member.created_at else None,
+            main_member.waiting_period, main_member.contact
+        ],
+        [plan.plan, plan.premium, plan.benefits],
+        applicant.address,
+        [
+            [
+                member.type, member.first_name, member.last_name, member.id_number, member.date_of_birth,
+                member.date_joined, member.waiting_period, member.relation_to_main_member, member.number
+            ]
+            for member in extended_members
+        ]
+    ]
+    return hashlib.sha256(json.dumps(content, default=str).encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def header_template(parlourname: str, address: str, number: str, email: str) -> Tuple[Tuple[str, int, float, int, str], ...]:
+    """
+    The parlour header and banner every certificate of a parlour shares, as
+    (font, size, x, y, text) with the centring measured once per parlour.
+    This only saves the five string width measurements; the strings are
+    still drawn on every certificate, since a reportlab form cannot be
+    shared between canvases. Most of a render goes to building and saving
+    the PDF, which only the content_hash check avoids.
+    """
+    lines = (
+        ('Helvetica-Bold', 16, 60, parlourname.title()),
+        ('Helvetica', 10, 75, (address or '').title()),
+        ('Helvetica', 10, 90, number or ''),
+        ('Helvetica', 10, 105, (email or '').lower()),
+        ('Helvetica-Bold', 10, 130, "Membership Certificate / Application Form"),
+    )
+    return tuple((font, size, 300 - stringWidth(text, font, size) / 2.0, y, text) for font, size, y, text in lines)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def benefit_lines(benefits: str) -> Tuple[Optional[str], ...]:
+    """ A plan's benefits as printed, one entry per source line, None for the blank ones. """
+    return tuple(
+        "- {}".format(line.replace("-", "").strip()) if len(line.split()) > 0 else None
+        for line in benefits.split("\n")
+    )
+
+
+def draw(file_name: str, parlour, plan, applicant, main_member, extended_members) -> str:
+    """
+    Renders a membership certificate and returns its path. Only reads the
+    attributes of its arguments, so plain snapshots work as well as models.
+    """
+    canvas = Certificate(file_name)
+    canvas.set_header(header_template(parlour.parlourname, parlour.address, parlour.number, parlour.email))
+    canvas.set_member("Main Member")
+    canvas.set_name(' '.join([main_member.first_name, main_member.last_name]))
+    canvas.set_id_number(main_member.id_number)
+    canvas.set_date_joined(main_member.date_joined)
+    canvas.set_date_created(main_member.created_at.date())
+    canvas.set_waiting_period(main_member.waiting_period)
+    canvas.set_member_contact(main_member.contact)
+    canvas.set_current_plan(plan.plan)
+    canvas.set_current_premium(plan.premium)
+    canvas.set_physical_address(applicant.address if applicant.address else '')
+
+    for extended_member in extended_members:
+        canvas.add_other_members(extended_member)
+
+    if plan.benefits:
+        canvas.set_benefits(plan.benefits)
+    canvas.save()
+    return canvas.get_file_path()
 
 
 class Certificate:
     can = None
 
     def __init__(self, file_name: str):
-        os.chdir('./assets/uploads/certificates')
-
         self.y_position = 0
-        self.file_path = "{}/{}.pdf".format(os.getcwd(), file_name)
-        if os.path.exists(self.file_path):
-            os.remove(self.file_path)
+        self.file_name = "{}.pdf".format(file_name)
+        self.file_path = None
+        self.buffer = io.BytesIO()
 
-        self.can = canvas.Canvas(self.file_path, pagesize=A4, bottomup=0)
-        os.chdir('../../..')
+        self.can = canvas.Canvas(self.buffer, pagesize=A4, bottomup=0)
 
     def get_file_path(self):
         return self.file_path
 
-    def set_title(self, title: str):
-        self.can.setFont('Helvetica-Bold', 16)
-        self.can.drawCentredString(300, 60, title.title())
-
-    def set_address(self, address: str):
-        self.can.setFont('Helvetica', 10)
-        self.can.drawCentredString(300, 75, address.title())
-
-    def set_contact(self, contact: str):
-        self.can.setFont('Helvetica', 10)
-        self.can.drawCentredString(300, 90, contact)
-
-    def set_email(self, email: str):
-        self.can.setFont('Helvetica', 10)
-        self.can.drawCentredString(300, 105, email.lower())
-
-    def membership_certificate(self):
-        self.can.setFont('Helvetica-Bold', 10)
-        self.can.drawCentredString(300, 130, "Membership Certificate / Application Form")
+    def set_header(self, template):
+        """ Draws a header_template; the per member fields are drawn on top of it. """
+        for font, size, x, y, text in template:
+            self.can.setFont(font, size)
+            self.can.drawString(x, y, text)
 
     def set_member(self, member: str):
         self.can.setFont('Helvetica-Bold', 10)
@@ -135,16 +215,18 @@ class Certificate:
         self.can.drawString(30, self.y_position, "Benefits:")
         self.can.setFont('Helvetica', 10)
 
-        for s in benefits.split("\n"):
+        for line in benefit_lines(benefits):
             self.y_position = sum([self.y_position, 15])
-            if len(s.split()) > 0:
+            if line:
                 if self.y_position > 820:
                     self.showPage()
                     self.y_position = 60
-                self.can.drawString(30, self.y_position, "- {}".format(s.replace("-", "").strip()))
+                self.can.drawString(30, self.y_position, line)
 
     def showPage(self):
         self.can.showPage()
 
     def save(self):
+        """ Finishes the PDF in memory and stores it; get_file_path is its path from then on. """
         self.can.save()
+        self.file_path = storage.certificates.save(self.file_name, self.buffer.getvalue())
@@ -0,0 +1,208 @@
+"""
+Batch rendering of membership certificates across processes.
+
+Applicants are walked by id in chunks. Each chunk is read with one joined
+query for the applicants, main members, plans and parlours plus one for
+their extended members, and turned into plain snapshots. Snapshots whose
+content hash matches the stored one are skipped; the rest are rendered in
+a process pool, which is pure CPU work, and written back with one batched
+UPDATE per chunk.
+
+A run commits after every chunk and logs the last applicant id before
+which everything rendered, so an interrupted run resumes with
+``start_after`` and anything already rendered is skipped by its hash
+anyway. The id stops advancing at the first failure, which keeps that
+applicant in the resumed range. Written certificates clear the deferred
+render mark set by ``rest.extended_members.defer_certificates`` unless it
+was set again after the chunk was read.
+
+Usage::
+
+    certificate_batches.render_all(parlour_id=parlour.id, workers=8)
+    >> {'rendered': 930, 'skipped': 70, 'failed': 1, 'last_id': 1187, 'failed_ids': [1188]}
+"""
+import logging
+import multiprocessing
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from open_source import db, storage
+from open_source.core import certificate
+from open_source.core.applicants import Applicant
+from open_source.core.extended_members import ExtendedMember
+from open_source.core.main_members import MainMember
+from open_source.core.parlours import Parlour
+from open_source.core.plans import Plan
+from open_source.utils import collect
+from sqlalchemy import and_, bindparam, case
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 200
+
+
+def _snapshot(applicant, main_member, plan, parlour, extended_members) -> SimpleNamespace:
+    """ The picklable subset of the models that certificate.draw and content_hash read. """
+    return SimpleNamespace(
+        applicant=SimpleNamespace(id=applicant.id, address=applicant.address),
+        document=applicant.document,
+        certificate_hash=applicant.certificate_hash,
+        certificate_dirty_at=applicant.certificate_dirty_at,
+        parlour=SimpleNamespace(
+            parlourname=parlour.parlourname, address=parlour.address, number=parlour.number, email=parlour.email
+        ),
+        plan=SimpleNamespace(plan=plan.plan, premium=plan.premium, benefits=plan.benefits),
+        main_member=SimpleNamespace(
+            first_name=main_member.first_name, last_name=main_member.last_name, id_number=main_member.id_number,
+            date_joined=main_member.date_joined, created_at=main_member.created_at,
+            waiting_period=main_member.waiting_period, contact=main_member.contact
+        ),
+        extended_members=[
+            SimpleNamespace(
+                type=member.type, type_text=member.type_text, first_name=member.first_name,
+                last_name=member.last_name, id_number=member.id_number, date_of_birth=member.date_of_birth,
+                date_joined=member.date_joined, waiting_period=member.waiting_period,
+                relation_to_main_member=member.relation_to_main_member, relation_text=member.relation_text,
+                number=member.number
+            )
+            for member in extended_members
+        ]
+    )
+
+
+def snapshots(session, applicant_ids: List[int]) -> List[SimpleNamespace]:
+    """ Snapshots of the applicants in applicant_ids that have an active main member. """
+    rows = session.query(Applicant, MainMember, Plan, Parlour).join(
+        MainMember, and_(MainMember.applicant_id == Applicant.id, MainMember.state == MainMember.STATE_ACTIVE)
+    ).join(
+        Plan, Plan.id == Applicant.plan_id
+    ).join(
+        Parlour, Parlour.id == Applicant.parlour_id
+    ).filter(
+        Applicant.id.in_(applicant_ids)
+    ).order_by(Applicant.id, MainMember.id).all()
+
+    extended_by_applicant = collect('applicant_id', session.query(ExtendedMember).filter(
+        ExtendedMember.applicant_id.in_(applicant_ids),
+        ExtendedMember.state == ExtendedMember.STATE_ACTIVE
+    ).order_by(ExtendedMember.id).all())
+
+    result, seen = [], set()
+    for applicant, main_member, plan, parlour in rows:
+        if applicant.id not in seen:
+            seen.add(applicant.id)
+            result.append(_snapshot(applicant, main_member, plan, parlour, extended_by_applicant.get(applicant.id, [])))
+    return result
+
+
+def render(snapshot: SimpleNamespace):
+    """ Process pool task: draws one certificate, returning (applicant_id, path or None). """
+    try:
+        return snapshot.applicant.id, certificate.draw(
+            uuid.uuid4(), snapshot.parlour, snapshot.plan, snapshot.applicant,
+            snapshot.main_member, snapshot.extended_members
+        )
+    except Exception:
+        logger.exception("Error, experienced an error while creating certificate for applicant {}.".format(snapshot.applicant.id))
+        return snapshot.applicant.id, None
+
+
+def _write(session, rendered: List[Dict], read_at: datetime):
+    """ Stores the certificates and clears the marks set before read_at, when the chunk was read. """
+    table = Applicant.__table__
+    session.execute(
+        table.update().where(table.c.id == bindparam('applicant_id')).values(
+            document=bindparam('document'),
+            certificate_hash=bindparam('certificate_hash'),
+            certificate_dirty_at=case(
+                (table.c.certificate_dirty_at <= bindparam('read_at'), None),
+                else_=table.c.certificate_dirty_at
+            )
+        ),
+        [dict(row, read_at=read_at) for row in rendered]
+    )
+
+
+def render_all(parlour_id=None, workers: int = None, start_after: int = 0, force=False,
+               progress: Optional[Callable[[int, int], None]] = None, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Renders the certificates of every applicant that is not deleted, or of
+    one parlour, whose content changed since its last render; all of them
+    with force.
+    """
+    with db.no_transaction() as session:
+        query = session.query(Applicant.id).filter(
+            Applicant.state != Applicant.STATE_DELETED,
+            Applicant.id > start_after
+        )
+        if parlour_id:
+            query = query.filter(Applicant.parlour_id == parlour_id)
+        applicant_ids = [applicant_id for applicant_id, in query.order_by(Applicant.id)]
+
+    totals = {'rendered': 0, 'skipped': 0, 'failed': 0, 'last_id': start_after, 'failed_ids': []}
+
+    # spawn keeps the parent's database connections out of the workers
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for i in range(0, len(applicant_ids), chunk_size):
+            chunk = applicant_ids[i:i + chunk_size]
+
+            with db.transaction() as session:
+                read_at = datetime.now()
+                pending, current = [], []
+                for snapshot in snapshots(session, chunk):
+                    snapshot.content_hash = certificate.content_hash(
+                        snapshot.parlour, snapshot.plan, snapshot.applicant, snapshot.main_member, snapshot.extended_members
+                    )
+                    unchanged = snapshot.content_hash == snapshot.certificate_hash and storage.certificates.exists(snapshot.document)
+                    if unchanged and not force:
+                        totals['skipped'] += 1
+                        if snapshot.certificate_dirty_at:
+                            # marked but nothing on it changed, so the stored file stands
+                            current.append({
+                                'applicant_id': snapshot.applicant.id,
+                                'document': snapshot.document,
+                                'certificate_hash': snapshot.certificate_hash
+                            })
+                    else:
+                        pending.append(snapshot)
+
+                by_id = {snapshot.applicant.id: snapshot for snapshot in pending}
+                rendered = []
+                for applicant_id, path in executor.map(render, pending):
+                    if path:
+                        rendered.append({
+                            'applicant_id': applicant_id,
+                            'document': path,
+                            'certificate_hash': by_id[applicant_id].content_hash
+                        })
+                    else:
+                        totals['failed'] += 1
+                        totals['failed_ids'].append(applicant_id)
+
+                if rendered or current:
+                    _write(session, rendered + current, read_at)
+
+            for row in rendered:
+                old_file = by_id[row['applicant_id']].document
+                if old_file != row['document']:
+                    storage.certificates.delete(old_file)
+
+            totals['rendered'] += len(rendered)
+            if totals['failed_ids']:
+                # resume from the first failure rather than past it
+                first = applicant_ids.index(min(totals['failed_ids']))
+                totals['last_id'] = applicant_ids[first - 1] if first else start_after
+            else:
+                totals['last_id'] = chunk[-1]
+            logger.info("Certificates: {} of {} applicants done, {} failed, resume after applicant {}.".format(
+                i + len(chunk), len(applicant_ids), totals['failed'], totals['last_id']
+            ))
+            if progress:
+                progress(i + len(chunk), len(applicant_ids))
+
+    return totals
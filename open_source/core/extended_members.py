@@ -1,13 +1,17 @@
 from typing import Text
 from sqlalchemy.sql.sqltypes import Boolean, DECIMAL
 from open_source import db
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, func
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, Text, func
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
 
 class ExtendedMember(db.Base):
     __tablename__ = 'extended_members'
+    __table_args__ = (
+        Index('ix_extended_members_applicant_id_state', 'applicant_id', 'state'),
+        Index('ix_extended_members_birthday', 'birthday'),
+    )
 
     STATE_ARCHIVED= 2
     STATE_ACTIVE = 1
@@ -83,6 +87,8 @@ class ExtendedMember(db.Base):
 
     id = Column(Integer, primary_key=True)
     date_of_birth = Column(Date())
+    # 'MMDD' of the date of birth, kept by open_source.core.age_limits.set_birthday
+    birthday = Column(String(length=4))
     state = Column(Integer, default=1)
     first_name = Column(String(length=50))
     last_name = Column(String(length=50))
@@ -0,0 +1,269 @@
+"""
+Daily and monthly collection totals for the finance screens and reports.
+
+Rows are keyed by period ('day' or 'month'), the first day of the period,
+parlour, consultant, branch and payment type, and hold the amount
+collected, the number of payments and the number of months paid. A receipt
+counts while both its invoice and its payment are active, on the day it was
+issued, under the consultant stored on the invoice then.
+
+Totals are kept up to date incrementally: ``add`` when a receipt is issued,
+``remove`` when its invoice or payment is deleted, each with one atomic
+UPDATE per period inside the caller's transaction. ``refresh`` recomputes a
+parlour from its invoices and ``rebuild`` every parlour, for the migration
+and ``scripts/rebuild_financial_rollups.py``.
+
+Usage::
+
+    FinancialRollup.totals(session, parlour.id, FinancialRollup.PERIOD_MONTH, group_by=['consultant_id'])
+    >> [{'period_start': date(2021, 11, 1), 'consultant_id': 3, 'amount': Decimal('5400.00'), 'payments': 31, 'months': 36}]
+
+    FinancialRollup.collected(session, parlour.id, date.today(), consultant_id=consultant.id)
+    >> Decimal('900.00')
+"""
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List
+
+from open_source import db
+from open_source.core.invoices import Invoice
+from open_source.core.payments import Payment
+from sqlalchemy import Column, Date, DateTime, DECIMAL, Integer, String, UniqueConstraint, and_, delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+import pandas as pd
+
+
+# consultant_id of receipts whose applicant has no consultant
+NO_CONSULTANT = 0
+
+DIMENSIONS = ('consultant_id', 'branch', 'payment_type')
+
+
+def _amount(value) -> Decimal:
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01')) if value not in (None, '') else Decimal('0.00')
+    except InvalidOperation:
+        return Decimal('0.00')
+
+
+def _months(value) -> int:
+    try:
+        return int(value) if value not in (None, '') else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class FinancialRollup(db.Base):
+    __tablename__ = 'financial_rollups'
+    __table_args__ = (
+        UniqueConstraint(
+            'parlour_id', 'period', 'period_start', 'consultant_id', 'branch', 'payment_type',
+            name='uq_financial_rollups'
+        ),
+    )
+
+    PERIOD_DAY = 'day'
+    PERIOD_MONTH = 'month'
+
+    PERIODS = (PERIOD_DAY, PERIOD_MONTH)
+
+    id = Column(Integer, primary_key=True)
+    parlour_id = Column(Integer, nullable=False)
+    period = Column(String(length=5), nullable=False)
+    period_start = Column(Date, nullable=False)
+    consultant_id = Column(Integer, nullable=False, default=NO_CONSULTANT)
+    branch = Column(String(length=100), nullable=False, default='')
+    payment_type = Column(String(length=10), nullable=False, default='')
+    amount = Column(DECIMAL(12, 2), nullable=False, default=0)
+    payments = Column(Integer, nullable=False, default=0)
+    months = Column(Integer, nullable=False, default=0)
+    modified_at = Column(DateTime, server_default=func.now())
+
+    @classmethod
+    def period_start_of(cls, period: str, day: date) -> date:
+        return day.replace(day=1) if period == cls.PERIOD_MONTH else day
+
+    @classmethod
+    def _record(cls, session, invoice, sign: int):
+        table = cls.__table__
+        issued = (invoice.created or datetime.now()).date()
+        amount, months = _amount(invoice.amount) * sign, _months(invoice.number_of_months) * sign
+
+        for period in cls.PERIODS:
+            key = {
+                'parlour_id': invoice.parlour_id,
+                'period': period,
+                'period_start': cls.period_start_of(period, issued),
+                'consultant_id': invoice.consultant_id or NO_CONSULTANT,
+                'branch': invoice.branch or '',
+                'payment_type': invoice.payment_type or ''
+            }
+            increment = table.update().where(and_(*[table.c[name] == value for name, value in key.items()])).values(
+                amount=table.c.amount + amount,
+                payments=table.c.payments + sign,
+                months=table.c.months + months,
+                modified_at=datetime.now()
+            )
+
+            if session.execute(increment).rowcount:
+                continue
+
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert().values(
+                        amount=amount, payments=sign, months=months, modified_at=datetime.now(), **key
+                    ))
+            except IntegrityError:
+                # another receipt created the row first
+                session.execute(increment)
+
+    @classmethod
+    def add(cls, session, invoice):
+        """ Counts a receipt that was just issued. """
+        cls._record(session, invoice, 1)
+
+    @classmethod
+    def remove(cls, session, invoice):
+        """
+        Takes back a counted receipt whose invoice or payment is being deleted,
+        from the consultant it was counted under even if the applicant moved since.
+        """
+        cls._record(session, invoice, -1)
+
+    @classmethod
+    def remove_payment(cls, session, payment):
+        """ Takes back the active receipts of a payment that is being deleted. """
+        if payment.is_deleted():
+            return
+
+        invoices = session.query(Invoice).filter(
+            Invoice.payment_id == payment.id,
+            Invoice.state == Invoice.STATE_ACTIVE
+        ).all()
+        for invoice in invoices:
+            cls.remove(session, invoice)
+
+    @classmethod
+    def compute(cls, connection, parlour_id) -> List[Dict]:
+        """
+        Sums a parlour's counted receipts into rollup rows with one query and
+        a pandas group by. Runs core statements only, so connection may also
+        be a session.
+        """
+        invoices, payments = Invoice.__table__, Payment.__table__
+
+        rows = connection.execute(select([
+            invoices.c.created, invoices.c.amount, invoices.c.number_of_months,
+            invoices.c.branch, invoices.c.payment_type, invoices.c.consultant_id
+        ]).select_from(
+            invoices.join(payments, payments.c.id == invoices.c.payment_id)
+        ).where(and_(
+            invoices.c.parlour_id == parlour_id,
+            invoices.c.state == Invoice.STATE_ACTIVE,
+            payments.c.state == Payment.STATE_ACTIVE
+        ))).fetchall()
+
+        frame = pd.DataFrame.from_records(
+            rows, columns=['created', 'amount', 'months', 'branch', 'payment_type', 'consultant_id']
+        )
+        if frame.empty:
+            return []
+
+        frame['created'] = pd.to_datetime(frame['created'], errors='coerce')
+        frame = frame[frame['created'].notna()]
+        frame['amount'] = frame['amount'].map(_amount)
+        frame['months'] = frame['months'].map(_months)
+        frame['payments'] = 1
+        frame['consultant_id'] = pd.to_numeric(frame['consultant_id'], errors='coerce').fillna(NO_CONSULTANT).astype(int)
+        frame['branch'] = frame['branch'].fillna('')
+        frame['payment_type'] = frame['payment_type'].fillna('')
+
+        starts = {
+            cls.PERIOD_DAY: frame['created'].dt.date,
+            cls.PERIOD_MONTH: frame['created'].dt.to_period('M').dt.start_time.dt.date
+        }
+
+        result = []
+        for period, period_start in starts.items():
+            grouped = frame.assign(period_start=period_start).groupby(
+                ['period_start'] + list(DIMENSIONS), as_index=False
+            )[['amount', 'payments', 'months']].sum()
+
+            for row in grouped.to_dict('records'):
+                row.update({
+                    'parlour_id': parlour_id,
+                    'period': period,
+                    'consultant_id': int(row['consultant_id']),
+                    'payments': int(row['payments']),
+                    'months': int(row['months']),
+                    'modified_at': datetime.now()
+                })
+                result.append(row)
+        return result
+
+    @classmethod
+    def refresh(cls, connection, parlour_id):
+        """ Replaces the stored rollups of a parlour inside the current transaction. """
+        rows = cls.compute(connection, parlour_id)
+
+        connection.execute(delete(cls.__table__).where(cls.__table__.c.parlour_id == parlour_id))
+        if rows:
+            connection.execute(cls.__table__.insert(), rows)
+
+    @classmethod
+    def rebuild(cls, connection):
+        """ Recomputes the rollups of every parlour that issued receipts. """
+        connection.execute(delete(cls.__table__))
+        parlour_ids = connection.execute(
+            select([Invoice.__table__.c.parlour_id]).where(Invoice.__table__.c.parlour_id.isnot(None)).distinct()
+        ).fetchall()
+
+        for parlour_id, in parlour_ids:
+            cls.refresh(connection, parlour_id)
+
+    @classmethod
+    def totals(cls, session, parlour_id, period: str = PERIOD_MONTH, start: date = None, end: date = None,
+               consultant_id=None, group_by=()) -> List[Dict]:
+        """
+        Collections of a parlour per period between start and end, both
+        inclusive, split by the DIMENSIONS named in group_by.
+        """
+        group_by = [name for name in group_by if name in DIMENSIONS]
+        columns = [cls.period_start] + [getattr(cls, name) for name in group_by]
+
+        query = session.query(
+            *columns,
+            func.sum(cls.amount),
+            func.sum(cls.payments),
+            func.sum(cls.months)
+        ).filter(
+            cls.parlour_id == parlour_id,
+            cls.period == period
+        )
+
+        if start:
+            query = query.filter(cls.period_start >= cls.period_start_of(period, start))
+        if end:
+            query = query.filter(cls.period_start <= end)
+        if consultant_id:
+            query = query.filter(cls.consultant_id == consultant_id)
+
+        names = ['period_start'] + group_by + ['amount', 'payments', 'months']
+        return [
+            dict(zip(names, row))
+            for row in query.group_by(*columns).order_by(*columns)
+        ]
+
+    @classmethod
+    def collected(cls, session, parlour_id, day: date, consultant_id=None) -> Decimal:
+        """ The amount a parlour, or one of its consultants, collected on day. """
+        query = session.query(func.sum(cls.amount)).filter(
+            cls.parlour_id == parlour_id,
+            cls.period == cls.PERIOD_DAY,
+            cls.period_start == day
+        )
+        if consultant_id:
+            query = query.filter(cls.consultant_id == consultant_id)
+
+        return query.scalar() or Decimal('0.00')
@@ -1,11 +1,16 @@
 from open_source import db
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, func, String
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index, func, String, cast, select
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
 
 class Invoice(db.Base):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        Index('ix_invoices_parlour_id_id', 'parlour_id', 'id'),
+    )
 
     STATE_ACTIVE = 1
     STATE_DELETED = 0
@@ -30,6 +35,8 @@ class Invoice(db.Base):
     branch = Column(String(length=100))
     months_paid = Column(String(length=255))
     payment_type = Column(String(length=10))
+    # the applicant's consultant when the receipt was issued, which its collection totals count under
+    consultant_id = Column(Integer)
 
     @declared_attr
     def payment_id(cls):
@@ -85,3 +92,69 @@ class Invoice(db.Base):
     def delete(self, session):
         self.make_deleted()
         session.commit()
+
+
+class InvoiceSequence(db.Base):
+    """
+    The last invoice number handed out per parlour.
+
+    ``next_number`` increments the parlour's row with one UPDATE, whose row
+    lock holds until the payment's transaction ends, so concurrent payments
+    queue on it and never share a number, and nothing scans ``invoices``.
+    A rolled back payment rolls its number back with it.
+
+    On MySQL the row is created and incremented by a single INSERT ... ON
+    DUPLICATE KEY UPDATE that hands the number back through LAST_INSERT_ID,
+    so two first payments of a parlour never hold gap locks on the missing
+    row while both try to insert it, which deadlocks.
+    """
+    __tablename__ = 'invoice_sequences'
+
+    parlour_id = Column(Integer, primary_key=True, autoincrement=False)
+    last_number = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def issued():
+        """ The highest number already on the invoices of each parlour. """
+        return select([Invoice.parlour_id, func.max(cast(Invoice.number, Integer))]).where(
+            Invoice.parlour_id.isnot(None)
+        ).group_by(Invoice.parlour_id)
+
+    @classmethod
+    def rebuild(cls, connection):
+        """ Seeds the sequences from the numbers already issued. """
+        connection.execute(cls.__table__.delete())
+        connection.execute(cls.__table__.insert().from_select(['parlour_id', 'last_number'], cls.issued()))
+
+    @classmethod
+    def next_number(cls, session, parlour_id) -> str:
+        """ Takes the next invoice number of a parlour inside the caller's transaction. """
+        if session.get_bind().dialect.name == 'mysql':
+            return cls._next_number_mysql(session, parlour_id)
+
+        table = cls.__table__
+        increment = table.update().where(table.c.parlour_id == parlour_id).values(last_number=table.c.last_number + 1)
+
+        if not session.execute(increment).rowcount:
+            # first invoice since the sequences were seeded, carry on from what was issued
+            try:
+                with session.begin_nested():
+                    issued = session.execute(cls.issued().where(Invoice.parlour_id == parlour_id)).first()
+                    session.execute(table.insert().values(
+                        parlour_id=parlour_id, last_number=(issued[1] or 0) + 1 if issued else 1
+                    ))
+            except IntegrityError:
+                # another payment created it first
+                session.execute(increment)
+
+        number = session.execute(select([table.c.last_number]).where(table.c.parlour_id == parlour_id)).scalar()
+        return str(number)
+
+    @classmethod
+    def _next_number_mysql(cls, session, parlour_id) -> str:
+        table = cls.__table__
+        # rebuild seeded every parlour that had issued numbers, so a missing row starts at 1
+        upsert = mysql.insert(table).values(parlour_id=parlour_id, last_number=func.last_insert_id(1))
+        session.execute(upsert.on_duplicate_key_update(last_number=func.last_insert_id(table.c.last_number + 1)))
+
+        return str(session.execute(select([func.last_insert_id()])).scalar())
@@ -0,0 +1,295 @@
+"""
+Background jobs for work that outlives a request worker.
+
+Imports, exports and certificate runs are submitted as rows in ``jobs`` and
+picked up by ``scripts/job_worker.py``. The queue lives in the application
+database, so a worker needs nothing beyond the MySQL (or SQLite) connection
+the service already has. Uploads and generated files are stored on the job
+row, so the worker does not have to share a disk with the web process.
+
+Handlers are plain functions registered per kind. They get the detached job
+and its params, manage their own transactions, report progress through
+``job.set_progress`` and attach a downloadable file with ``job.attach``.
+Whatever they return is stored as the job's JSON result.
+
+While a handler runs, its worker renews the job's ``modified_at`` every
+HEARTBEAT_INTERVAL from a background thread, so a long import that reports
+no progress is not mistaken for one whose worker died and run twice.
+
+Usage::
+
+    @jobs.handler('export_members')
+    def export_members(job, params):
+        ...
+        job.attach('members.xlsx', XLSX_CONTENT_TYPE, content)
+        return {'rows': len(rows)}
+
+    with db.transaction() as session:
+        job = Job.submit(session, 'export_members', {'id': parlour.id})
+
+    jobs.work()
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from open_source import db
+from sqlalchemy import Column, Integer, String, DateTime, Index, LargeBinary, Text, func
+from sqlalchemy.dialects.mysql import LONGBLOB
+
+
+logger = logging.getLogger(__name__)
+
+# kind -> fn(job, params) returning the JSON result
+HANDLERS: Dict[str, Callable] = {}
+
+POLL_INTERVAL = 2
+
+# a running job that has not reported progress for this long lost its worker
+STALE_AFTER = timedelta(minutes=30)
+
+# how often a worker renews the jobs it runs, well within STALE_AFTER
+HEARTBEAT_INTERVAL = timedelta(minutes=5)
+
+MAX_ATTEMPTS = 3
+
+Blob = LargeBinary().with_variant(LONGBLOB(), 'mysql')
+
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class Job(db.Base):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        Index('ix_jobs_state_id', 'state', 'id'),
+    )
+
+    STATE_PENDING = 1
+    STATE_RUNNING = 2
+    STATE_DONE = 3
+    STATE_FAILED = 4
+
+    state_to_text = {
+        STATE_PENDING: 'Pending',
+        STATE_RUNNING: 'Running',
+        STATE_DONE: 'Done',
+        STATE_FAILED: 'Failed'
+    }
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(length=50), nullable=False)
+    state = Column(Integer, default=STATE_PENDING)
+    params = Column(Text)
+    payload = Column(Blob)
+    progress = Column(Integer, default=0)
+    result = Column(Text)
+    error = Column(Text)
+    output = Column(Blob)
+    output_name = Column(String(length=250))
+    output_type = Column(String(length=100))
+    parlour_id = Column(Integer)
+    consultant_id = Column(Integer)
+    worker = Column(String(length=100))
+    attempts = Column(Integer, default=0)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+    modified_at = Column(DateTime, server_default=func.now())
+
+    @property
+    def state_text(self):
+        return self.state_to_text.get(self.state, 'Undefined')
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in (self.STATE_DONE, self.STATE_FAILED)
+
+    def get_params(self) -> Dict[str, Any]:
+        return json.loads(self.params) if self.params else {}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state_text,
+            'progress': self.progress,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'has_output': bool(self.output_name),
+            'output_name': self.output_name,
+            'attempts': self.attempts,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'created_at': self.created_at,
+            'modified_at': self.modified_at
+        }
+
+    def save(self, session):
+        session.add(self)
+        session.commit()
+
+    @classmethod
+    def submit(cls, session, kind: str, params: Dict[str, Any] = None, payload: bytes = None,
+               parlour_id=None, consultant_id=None) -> 'Job':
+        """ Queues a job of a registered kind; the caller's transaction commits it. """
+        if kind not in HANDLERS:
+            raise ValueError("Unknown job kind {}.".format(kind))
+
+        job = cls(
+            kind=kind,
+            state=cls.STATE_PENDING,
+            params=json.dumps(params or {}, default=str),
+            payload=payload,
+            parlour_id=parlour_id,
+            consultant_id=consultant_id,
+            progress=0,
+            attempts=0,
+            created_at=datetime.now(),
+            modified_at=datetime.now()
+        )
+        session.add(job)
+        session.flush()
+        return job
+
+    @classmethod
+    def claim(cls, session, worker: str) -> Optional[int]:
+        """
+        Moves the oldest pending job to running and returns its id. The state
+        guard on the UPDATE makes the claim atomic, so concurrent workers
+        never run the same job, without relying on SKIP LOCKED.
+        """
+        candidates = [job_id for job_id, in session.query(cls.id).filter(
+            cls.state == cls.STATE_PENDING
+        ).order_by(cls.id).limit(10)]
+
+        for job_id in candidates:
+            now = datetime.now()
+            claimed = session.query(cls).filter(
+                cls.id == job_id,
+                cls.state == cls.STATE_PENDING
+            ).update({
+                cls.state: cls.STATE_RUNNING,
+                cls.worker: worker,
+                cls.attempts: cls.attempts + 1,
+                cls.started_at: now,
+                cls.modified_at: now
+            }, synchronize_session=False)
+            session.commit()
+
+            if claimed:
+                return job_id
+
+        return None
+
+    @classmethod
+    def requeue_stale(cls, session, stale_after: timedelta = STALE_AFTER) -> int:
+        """ Returns jobs whose worker died to the queue, or fails them after MAX_ATTEMPTS. """
+        cutoff = datetime.now() - stale_after
+        stale = session.query(cls).filter(cls.state == cls.STATE_RUNNING, cls.modified_at < cutoff).all()
+
+        for job in stale:
+            if job.attempts >= MAX_ATTEMPTS:
+                job.state = cls.STATE_FAILED
+                job.error = "Worker {} stopped responding.".format(job.worker)
+                job.finished_at = datetime.now()
+            else:
+                job.state = cls.STATE_PENDING
+            logger.warning("Job {} on {} went stale, now {}.".format(job.id, job.worker, job.state_text))
+
+        session.commit()
+        return len(stale)
+
+    def set_progress(self, done: int, total: int):
+        """ Records progress in its own short transaction so pollers see it mid run. """
+        progress = min(100, int(done * 100 / total)) if total else 100
+        with db.transaction() as session:
+            session.query(Job).filter(Job.id == self.id).update(
+                {Job.progress: progress, Job.modified_at: datetime.now()}, synchronize_session=False
+            )
+        self.progress = progress
+
+    def attach(self, name: str, content_type: str, content: bytes):
+        """ The file the result endpoint serves, stored when the job finishes. """
+        self.output_name = name
+        self.output_type = content_type
+        self.output = content
+
+
+def heartbeat(job: Job, stop: threading.Event, interval: timedelta = HEARTBEAT_INTERVAL):
+    """ Renews job until stop is set, as long as it is still running on this worker. """
+    while not stop.wait(interval.total_seconds()):
+        try:
+            with db.transaction() as session:
+                session.query(Job).filter(
+                    Job.id == job.id,
+                    Job.state == Job.STATE_RUNNING,
+                    Job.worker == job.worker
+                ).update({Job.modified_at: datetime.now()}, synchronize_session=False)
+        except Exception:
+            logger.exception("Error, failed to renew job {}.".format(job.id))
+
+
+def run(job_id: int):
+    """ Runs a claimed job and records its outcome. Handler errors fail the job, not the worker. """
+    with db.no_transaction() as session:
+        job = session.query(Job).get(job_id)
+        session.expunge(job)
+
+    stop = threading.Event()
+    renewer = threading.Thread(target=heartbeat, args=(job, stop), name='job-{}-heartbeat'.format(job.id), daemon=True)
+    renewer.start()
+
+    state, result, error = Job.STATE_DONE, None, None
+    try:
+        result = HANDLERS[job.kind](job, job.get_params())
+    except Exception as e:
+        logger.exception("Job {} ({}) failed.".format(job.id, job.kind))
+        state, error = Job.STATE_FAILED, getattr(e, 'description', None) or str(e) or e.__class__.__name__
+    finally:
+        stop.set()
+        renewer.join()
+
+    now = datetime.now()
+    with db.transaction() as session:
+        session.query(Job).filter(Job.id == job.id).update({
+            Job.state: state,
+            Job.progress: 100 if state == Job.STATE_DONE else job.progress,
+            Job.result: json.dumps(result, default=str) if result is not None else None,
+            Job.error: error,
+            Job.output: job.output,
+            Job.output_name: job.output_name,
+            Job.output_type: job.output_type,
+            Job.finished_at: now,
+            Job.modified_at: now
+        }, synchronize_session=False)
+
+    logger.info("Job {} ({}) {}.".format(job.id, job.kind, Job.state_to_text[state].lower()))
+
+
+def work(worker: str = None, poll_interval: float = POLL_INTERVAL, once=False):
+    """ Claims and runs jobs until interrupted; with once, until the queue is empty. """
+    worker = worker or '{}:{}'.format(socket.gethostname(), os.getpid())
+    logger.info("Job worker {} started for {}.".format(worker, ', '.join(sorted(HANDLERS))))
+
+    while True:
+        with db.transaction() as session:
+            Job.requeue_stale(session)
+            job_id = Job.claim(session, worker)
+
+        if job_id:
+            run(job_id)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
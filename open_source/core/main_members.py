@@ -1,13 +1,22 @@
-from typing import Dict, Any, Text
+from typing import Dict, Any, Iterable, List, Text
 from sqlalchemy.sql.sqltypes import Boolean, DECIMAL
 from open_source import db
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, func
+from open_source.core import pagination
+from open_source.core.extended_members import ExtendedMember
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, Text, func
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session
 
 
 class MainMember(db.Base):
     __tablename__ = 'main_members'
+    __table_args__ = (
+        Index('ix_main_members_parlour_id_state', 'parlour_id', 'state'),
+        Index('ix_main_members_applicant_id_state', 'applicant_id', 'state'),
+        Index('ix_main_members_id_number', 'id_number'),
+        Index('ix_main_members_modified_at_id', 'modified_at', 'id'),
+        Index('ix_main_members_birthday', 'birthday'),
+    )
 
     STATE_ARCHIVED= 2
     STATE_ACTIVE = 1
@@ -16,6 +25,8 @@ class MainMember(db.Base):
     id = Column(Integer, primary_key=True)
     id_number = Column(String(length=15))
     date_of_birth = Column(Date())
+    # 'MMDD' of the date of birth, kept by open_source.core.age_limits.set_birthday
+    birthday = Column(String(length=4))
     age_limit_exceeded = Column(Boolean(), default=False)
     age_limit_exception = Column(Boolean(), default=False)
     state = Column(Integer, default=1)
@@ -51,7 +62,10 @@ class MainMember(db.Base):
             return ''.join(['+27', self.contact])
         return self.contact
 
-    def to_dict(self):
+    def to_dict(self, extended_member_limit=None):
+        if extended_member_limit is None:
+            extended_member_limit = self.extended_member_limit()
+
         return {
             'id': self.id,
             'id_number': self.id_number,
@@ -67,12 +81,15 @@ class MainMember(db.Base):
             'waiting_period': self.waiting_period,
             'age_limit_exceeded': self.age_limit_exceeded,
             'age_limit_exception': self.age_limit_exception,
-            'extended_member_limit': self.extended_member_limit(),
+            'extended_member_limit': extended_member_limit,
             'parlour': self.parlour.to_dict()  if self.parlour else {} ,
             'applicant': self.applicant.to_short_dict() if self.applicant else {} 
         }
 
-    def to_short_dict(self):
+    def to_short_dict(self, extended_member_limit=None):
+        if extended_member_limit is None:
+            extended_member_limit = self.extended_member_limit()
+
         return {
             'id': self.id,
             'id_number': self.id_number,
@@ -83,7 +100,7 @@ class MainMember(db.Base):
             'waiting_period': self.waiting_period,
             'age_limit_exceeded': self.age_limit_exceeded,
             'age_limit_exception': self.age_limit_exception,
-            'extended_member_limit': self.extended_member_limit(),
+            'extended_member_limit': extended_member_limit,
             'date_joined': self.date_joined,
             'is_deceased': self.is_deceased,
             'created_at': self.created_at,
@@ -95,60 +112,20 @@ class MainMember(db.Base):
         return cls._paginated_result(params, user, cls.get_many_query)
 
     @classmethod
-    def _paginated_results(cls, params: Dict[str, Any],result_query) -> Dict[str, Any]:
-
-        offset = params.pop('offset', 0)
-        limit = params.pop('limit', 20)
-        total = 0
-
-        is_lookup = params.pop('is_lookup', 'no')
-        is_lookup = is_lookup in ('yes', 'y', 't', 'true', '1')
-
-        if result_query:
-            total = len([entity for entity in result_query])
-            result_query = result_query.offset(offset)
-            result_query = result_query.limit(limit)
+    def _paginated_results(cls, params: Dict[str, Any],result_query, keys=None) -> Dict[str, Any]:
+        if result_query is None:
+            return pagination.paginate_empty(params)
 
-            result = [entity.to_dict() for entity in result_query]
-
-        else:
-            result = []
-
-        return {
-            "offset": offset,
-            "limit": limit,
-            "count": len(result),
-            "total": total,
-            "result": result
-        }
+        session = result_query.session
+        return pagination.paginate(result_query, params, lambda rows: cls.to_dicts(session, rows), keys or (cls.id,))
 
     @classmethod
-    def _paginated_search_results(cls, params: Dict[str, Any],result_query) -> Dict[str, Any]:
+    def _paginated_search_results(cls, params: Dict[str, Any],result_query, keys=None) -> Dict[str, Any]:
+        if result_query is None:
+            return pagination.paginate_empty(params)
 
-        offset = params.pop('offset', 0)
-        limit = params.pop('limit', 20)
-        total = 0
-
-        is_lookup = params.pop('is_lookup', 'no')
-        is_lookup = is_lookup in ('yes', 'y', 't', 'true', '1')
-
-        if result_query:
-            total = len([entity for entity in result_query])
-            result_query = result_query.offset(offset)
-            result_query = result_query.limit(limit)
-
-            result = [entity[0].to_dict() for entity in result_query if entity]
-
-        else:
-            result = []
-
-        return {
-            "offset": offset,
-            "limit": limit,
-            "count": len(result),
-            "total": total,
-            "result": result
-        }
+        session = result_query.session
+        return pagination.paginate(result_query, params, lambda rows: cls.to_dicts(session, [row[0] for row in rows if row]), keys or (cls.id,))
 
     def save(self, session):
         session.add(self)
@@ -177,10 +154,45 @@ class MainMember(db.Base):
         session.commit()
 
     def extended_member_limit(self):
-        with db.no_transaction() as session:
-            sql = "select * from extended_members where applicant_id={} and age_limit_exceeded=1 AND age_limit_exception=0 AND state=1".format(self.applicant_id)
-            result = session.execute(sql)
-            return result.rowcount
+        session = object_session(self)
+        if session is None:
+            with db.no_transaction() as session:
+                return self.extended_member_limits(session, [self.applicant_id]).get(self.applicant_id, 0)
+        return self.extended_member_limits(session, [self.applicant_id]).get(self.applicant_id, 0)
+
+    @staticmethod
+    def extended_member_limits(session, applicant_ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Returns the number of active extended members over the plan age limit,
+        without an exception, for each applicant in applicant_ids.
+
+        Applicants without any such member are left out of the result.
+        """
+        applicant_ids = {applicant_id for applicant_id in applicant_ids if applicant_id}
+        if not applicant_ids:
+            return {}
+
+        rows = session.query(ExtendedMember.applicant_id, func.count(ExtendedMember.id)).filter(
+            ExtendedMember.applicant_id.in_(applicant_ids),
+            ExtendedMember.age_limit_exceeded == True,
+            ExtendedMember.age_limit_exception == False,
+            ExtendedMember.state == ExtendedMember.STATE_ACTIVE
+        ).group_by(ExtendedMember.applicant_id).all()
+
+        return {applicant_id: count for applicant_id, count in rows}
+
+    @classmethod
+    def to_dicts(cls, session, main_members: Iterable['MainMember'], short=False) -> List[Dict[str, Any]]:
+        """
+        Serializes a page of main members, counting the over-age extended
+        members of every applicant on the page in a single grouped query.
+        """
+        main_members = list(main_members)
+        limits = cls.extended_member_limits(session, [m.applicant_id for m in main_members])
+
+        if short:
+            return [m.to_short_dict(limits.get(m.applicant_id, 0)) for m in main_members]
+        return [m.to_dict(limits.get(m.applicant_id, 0)) for m in main_members]
 
     def on_delete_clean_up(self, session):
         self.applicant.delete(session)
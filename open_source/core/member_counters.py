@@ -0,0 +1,320 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from open_source import db
+from open_source.core.applicants import Applicant
+from open_source.core.main_members import MainMember
+from open_source.core.parlours import Parlour
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint, and_, delete, func, or_, select
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+
+# consultant_id used for the parlour wide rows
+ALL_CONSULTANTS = 0
+
+DIRTY_PARLOURS = 'member_counters_dirty_parlours'
+
+BATCH_SIZE = 1000
+
+
+class MemberCounter(db.Base):
+    """
+    Per parlour member counts read by the dashboard.
+
+    Rows are keyed by (parlour_id, consultant_id, name) where consultant_id is
+    ALL_CONSULTANTS for the parlour wide count and name is one of
+    NAME_ACTIVE, NAME_ARCHIVED or 'status:<applicant status>'.
+
+    Writes through the ORM move the rows involved by their difference in the
+    same flush (record_flush); bulk UPDATEs report theirs with record_changes.
+    refresh recounts a parlour from scratch, for bulk inserts and the refresh
+    script.
+    """
+    __tablename__ = 'member_counters'
+    __table_args__ = (
+        UniqueConstraint('parlour_id', 'consultant_id', 'name', name='uq_member_counters'),
+    )
+
+    NAME_ACTIVE = 'active'
+    NAME_ARCHIVED = 'archived'
+    NAME_STATUS = 'status:{}'
+
+    id = Column(Integer, primary_key=True)
+    parlour_id = Column(Integer, nullable=False)
+    consultant_id = Column(Integer, nullable=False, default=ALL_CONSULTANTS)
+    name = Column(String(length=30), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    modified_at = Column(DateTime, server_default=func.now())
+
+    @staticmethod
+    def active_count(session, parlour_id, consultant_id=None) -> int:
+        """ Active main members whose applicant is active, counted with one join. """
+        query = session.query(func.count(MainMember.id)).join(
+            Applicant, MainMember.applicant_id == Applicant.id
+        ).filter(
+            MainMember.state == MainMember.STATE_ACTIVE,
+            Applicant.state == Applicant.STATE_ACTIVE,
+            Applicant.parlour_id == parlour_id
+        )
+
+        if consultant_id:
+            query = query.filter(Applicant.consultant_id == consultant_id)
+
+        return query.scalar() or 0
+
+    @staticmethod
+    def archived_count(session, parlour_id, consultant_id=None) -> int:
+        """ Main members of archived or lapsed applicants, counted with one join. """
+        query = session.query(func.count(MainMember.id)).join(
+            Applicant, MainMember.applicant_id == Applicant.id
+        ).filter(
+            or_(Applicant.state == Applicant.STATE_ARCHIVED, Applicant.status == "lapsed"),
+            Applicant.parlour_id == parlour_id
+        )
+
+        if consultant_id:
+            query = query.filter(Applicant.consultant_id == consultant_id)
+
+        return query.scalar() or 0
+
+    @classmethod
+    def get(cls, session, parlour_id, name, consultant_id=None) -> Optional[int]:
+        """ Returns the stored counter, or None when the parlour has not been counted yet. """
+        return session.query(cls.count).filter(
+            cls.parlour_id == parlour_id,
+            cls.consultant_id == (consultant_id or ALL_CONSULTANTS),
+            cls.name == name
+        ).scalar()
+
+    @classmethod
+    def compute(cls, session, parlour_id) -> Dict[tuple, int]:
+        """
+        Counts a parlour's members with two grouped queries and returns
+        {(consultant_id, name): count}, including the ALL_CONSULTANTS totals.
+        Runs core statements only, so session may also be a plain connection.
+        """
+        counts = defaultdict(int)
+        members = MainMember.__table__.join(Applicant.__table__, MainMember.applicant_id == Applicant.id)
+
+        active = session.execute(select(
+            Applicant.consultant_id,
+            Applicant.status,
+            func.count(MainMember.id)
+        ).select_from(members).where(
+            MainMember.state == MainMember.STATE_ACTIVE,
+            Applicant.state == Applicant.STATE_ACTIVE,
+            Applicant.parlour_id == parlour_id
+        ).group_by(Applicant.consultant_id, Applicant.status))
+
+        for consultant_id, status, count in active:
+            for key in {consultant_id or ALL_CONSULTANTS, ALL_CONSULTANTS}:
+                counts[(key, cls.NAME_ACTIVE)] += count
+                if status:
+                    counts[(key, cls.NAME_STATUS.format(status.lower()))] += count
+
+        archived = session.execute(select(
+            Applicant.consultant_id,
+            func.count(MainMember.id)
+        ).select_from(members).where(
+            or_(Applicant.state == Applicant.STATE_ARCHIVED, Applicant.status == "lapsed"),
+            Applicant.parlour_id == parlour_id
+        ).group_by(Applicant.consultant_id))
+
+        for consultant_id, count in archived:
+            for key in {consultant_id or ALL_CONSULTANTS, ALL_CONSULTANTS}:
+                counts[(key, cls.NAME_ARCHIVED)] += count
+
+        # the parlour wide rows always exist so an empty parlour reads 0, not "not counted"
+        counts[(ALL_CONSULTANTS, cls.NAME_ACTIVE)] += 0
+        counts[(ALL_CONSULTANTS, cls.NAME_ARCHIVED)] += 0
+
+        return counts
+
+    @classmethod
+    def rebuild(cls, connection):
+        """ Recounts every parlour, for the migration that creates the table. """
+        connection.execute(delete(cls.__table__))
+        for parlour_id, in connection.execute(select(Parlour.id)).fetchall():
+            cls.refresh(connection, parlour_id)
+
+    @classmethod
+    def refresh(cls, session, parlour_id):
+        """ Replaces the stored counters of a parlour inside the current transaction. """
+        counts = cls.compute(session, parlour_id)
+
+        session.execute(delete(cls.__table__).where(cls.__table__.c.parlour_id == parlour_id))
+        session.execute(cls.__table__.insert(), [
+            {'parlour_id': parlour_id, 'consultant_id': consultant_id, 'name': name, 'count': count}
+            for (consultant_id, name), count in counts.items()
+        ])
+
+
+def _changed(target, *names) -> bool:
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+def _before(target, name):
+    """ The value an attribute had before this flush. """
+    history = inspect(target).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else getattr(target, name)
+
+
+def counted_under(main_member_state, applicant) -> Set[tuple]:
+    """
+    The (parlour_id, consultant_id, name) counters a main member adds one to,
+    given its state and its applicant's (state, status, consultant_id,
+    parlour_id), or None for no applicant. Mirrors MemberCounter.compute.
+    """
+    if not applicant or not applicant[3]:
+        return set()
+
+    state, status, consultant_id, parlour_id = applicant
+    names = []
+    if main_member_state == MainMember.STATE_ACTIVE and state == Applicant.STATE_ACTIVE:
+        names.append(MemberCounter.NAME_ACTIVE)
+        if status:
+            names.append(MemberCounter.NAME_STATUS.format(status.lower()))
+    if state == Applicant.STATE_ARCHIVED or status == "lapsed":
+        names.append(MemberCounter.NAME_ARCHIVED)
+
+    return {
+        (parlour_id, key, name)
+        for name in names
+        for key in {consultant_id or ALL_CONSULTANTS, ALL_CONSULTANTS}
+    }
+
+
+def _applicants(connection, applicant_ids) -> Dict[int, tuple]:
+    rows = connection.execute(select(
+        Applicant.id, Applicant.state, Applicant.status, Applicant.consultant_id, Applicant.parlour_id
+    ).where(Applicant.id.in_(applicant_ids))) if applicant_ids else []
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def record_changes(session, applicants: Dict[int, tuple], main_members: Dict[int, tuple]):
+    """
+    Moves the stored counts by the difference the given changes make.
+
+    applicants maps an applicant id to its (before, after) values as taken by
+    counted_under, None for one that did not exist or no longer does.
+    main_members maps a main member id to ((state, applicant_id) before,
+    (state, applicant_id) after), None likewise. The unchanged main members
+    of changed applicants are looked up here.
+    """
+    connection = session.connection()
+    applicant_ids = list(applicants)
+    for i in range(0, len(applicant_ids), BATCH_SIZE):
+        members = connection.execute(select(MainMember.id, MainMember.state, MainMember.applicant_id).where(
+            MainMember.applicant_id.in_(applicant_ids[i:i + BATCH_SIZE])
+        ))
+        for id, state, applicant_id in members:
+            main_members.setdefault(id, ((state, applicant_id), (state, applicant_id)))
+
+    referenced = {member[1] for change in main_members.values() for member in change if member}
+    current = _applicants(connection, [id for id in referenced if id not in applicants])
+
+    def applicant_values(applicant_id, when):
+        if applicant_id in applicants:
+            return applicants[applicant_id][when]
+        return current.get(applicant_id)
+
+    deltas = defaultdict(int)
+    for before, after in main_members.values():
+        if before:
+            for key in counted_under(before[0], applicant_values(before[1], 0)):
+                deltas[key] -= 1
+        if after:
+            for key in counted_under(after[0], applicant_values(after[1], 1)):
+                deltas[key] += 1
+
+    _apply(session, connection, {key: delta for key, delta in deltas.items() if delta})
+
+
+def _apply(session, connection, deltas: Dict[tuple, int]):
+    """
+    Adds each delta to its counter row, creating the row at the delta when it
+    is missing. Parlours that were never counted are recounted in full at
+    commit instead, after which their deltas apply.
+    """
+    if not deltas:
+        return
+
+    table = MemberCounter.__table__
+    counted = {parlour_id for parlour_id, in connection.execute(select(table.c.parlour_id).where(
+        table.c.parlour_id.in_({parlour_id for parlour_id, _, _ in deltas}),
+        table.c.consultant_id == ALL_CONSULTANTS,
+        table.c.name == MemberCounter.NAME_ACTIVE
+    ))}
+
+    # a fixed order keeps concurrent writers from locking the same rows the other way round
+    for (parlour_id, consultant_id, name), delta in sorted(deltas.items()):
+        if parlour_id not in counted:
+            mark_parlour_dirty(session, parlour_id)
+            continue
+
+        row = and_(table.c.parlour_id == parlour_id, table.c.consultant_id == consultant_id, table.c.name == name)
+        increment = table.update().where(row).values(count=table.c.count + delta, modified_at=datetime.now())
+        if connection.execute(increment).rowcount:
+            continue
+
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(
+                    parlour_id=parlour_id, consultant_id=consultant_id, name=name, count=delta, modified_at=datetime.now()
+                ))
+        except IntegrityError:
+            # a concurrent writer created it first
+            connection.execute(increment)
+
+
+def record_flush(session, flush_context):
+    """
+    after_flush: moves the counters of the parlours whose main members or
+    applicants changed in this flush by the difference, in the same
+    transaction, touching only the counter rows involved.
+    """
+    applicants, main_members = {}, {}
+    applicant_fields = ('state', 'status', 'consultant_id', 'parlour_id')
+
+    for target in list(session.new) + list(session.deleted) + list(session.dirty):
+        if isinstance(target, MainMember):
+            if target in session.dirty and not _changed(target, 'state', 'applicant_id'):
+                continue
+            before = None if target in session.new else (_before(target, 'state'), _before(target, 'applicant_id'))
+            after = None if target in session.deleted else (target.state, target.applicant_id)
+            main_members[target.id] = (before, after)
+
+        elif isinstance(target, Applicant):
+            if target in session.dirty and not _changed(target, *applicant_fields):
+                continue
+            before = None if target in session.new else tuple(_before(target, name) for name in applicant_fields)
+            after = None if target in session.deleted else tuple(getattr(target, name) for name in applicant_fields)
+            applicants[target.id] = (before, after)
+
+    if applicants or main_members:
+        record_changes(session, applicants, main_members)
+
+
+def mark_parlour_dirty(session, parlour_id):
+    """
+    Recounts parlour_id at commit, for bulk inserts the flush listener does
+    not see. Bulk updates with known before and after values should go
+    through record_changes instead, which only touches the rows involved.
+    """
+    session.info.setdefault(DIRTY_PARLOURS, set()).add(parlour_id)
+
+
+def refresh_dirty(session):
+    """ before_commit: recounts the parlours touched by this transaction. """
+    session.flush()
+    for parlour_id in session.info.pop(DIRTY_PARLOURS, set()):
+        MemberCounter.refresh(session, parlour_id)
+
+
+def forget_dirty(session):
+    session.info.pop(DIRTY_PARLOURS, None)
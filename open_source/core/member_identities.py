@@ -0,0 +1,212 @@
+from typing import Optional
+
+from open_source import db
+from open_source.core.applicants import Applicant
+from open_source.core.extended_members import ExtendedMember
+from open_source.core.main_members import MainMember
+from sqlalchemy import Column, Integer, String, UniqueConstraint, and_, inspect, literal, select
+
+
+# members in these states hold their ID number
+STATES = (MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED)
+
+# attributes that move a member's identity
+FIELDS = ('state', 'id_number', 'parlour_id', 'applicant_id')
+
+
+def ignoring(insert):
+    """ insert, skipping rows that would duplicate an identity, on MySQL and SQLite alike. """
+    return insert.prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite')
+
+
+class MemberIdentity(db.Base):
+    """
+    Which member holds an ID number inside a parlour.
+
+    Covers main and extended members that are active or archived, the same
+    members the duplicate checks consider, so a duplicate check is a single
+    lookup on the (parlour_id, id_number) unique key. Rows are kept in step
+    by the sync listener below; nothing writes them directly.
+    """
+    __tablename__ = 'member_identities'
+    __table_args__ = (
+        UniqueConstraint('parlour_id', 'id_number', name='uq_member_identities_parlour_id_id_number'),
+        UniqueConstraint('member_type', 'member_id', name='uq_member_identities_member'),
+    )
+
+    TYPE_MAIN_MEMBER = 'main'
+    TYPE_EXTENDED_MEMBER = 'extended'
+
+    id = Column(Integer, primary_key=True)
+    parlour_id = Column(Integer, nullable=False)
+    id_number = Column(String(length=15), nullable=False)
+    member_type = Column(String(length=10), nullable=False)
+    member_id = Column(Integer, nullable=False)
+    applicant_id = Column(Integer)
+
+    @property
+    def is_main_member(self):
+        return self.member_type == self.TYPE_MAIN_MEMBER
+
+    @classmethod
+    def find(cls, session, parlour_id, id_number, main_member_id=None, extended_member_id=None) -> Optional['MemberIdentity']:
+        """
+        Returns the identity holding id_number in the parlour, ignoring the
+        member being edited when its id is passed.
+
+        Usage::
+
+            if MemberIdentity.find(session, parlour.id, req.get("id_number"), main_member_id=main_member.id):
+                raise falcon.HTTPBadRequest(...)
+        """
+        if not id_number or not parlour_id:
+            return None
+
+        identity = session.query(cls).filter(
+            cls.parlour_id == parlour_id,
+            cls.id_number == '{}'.format(id_number).strip()
+        ).one_or_none()
+
+        if identity and (
+            (main_member_id and identity.is_main_member and identity.member_id == int(main_member_id)) or
+            (extended_member_id and not identity.is_main_member and identity.member_id == int(extended_member_id))
+        ):
+            return None
+
+        return identity
+
+    @classmethod
+    def _member_selects(cls, parlour_id=None, applicant_ids=None):
+        """ (member_type, select) pairs reading the identities held by the member tables. """
+        main_members = select(
+            MainMember.parlour_id, MainMember.id_number, MainMember.id, MainMember.applicant_id
+        ).where(
+            MainMember.state.in_(STATES),
+            MainMember.id_number != None,
+            MainMember.id_number != ''
+        )
+        extended_members = select(
+            Applicant.parlour_id, ExtendedMember.id_number, ExtendedMember.id, ExtendedMember.applicant_id
+        ).select_from(ExtendedMember).join(
+            Applicant, ExtendedMember.applicant_id == Applicant.id
+        ).where(
+            ExtendedMember.state.in_(STATES),
+            ExtendedMember.id_number != None,
+            ExtendedMember.id_number != ''
+        )
+
+        if parlour_id:
+            main_members = main_members.where(MainMember.parlour_id == parlour_id)
+            extended_members = extended_members.where(Applicant.parlour_id == parlour_id)
+
+        if applicant_ids is not None:
+            main_members = main_members.where(MainMember.applicant_id.in_(applicant_ids))
+            extended_members = extended_members.where(ExtendedMember.applicant_id.in_(applicant_ids))
+
+        return ((cls.TYPE_MAIN_MEMBER, main_members), (cls.TYPE_EXTENDED_MEMBER, extended_members))
+
+    @classmethod
+    def _insert_from(cls, session, members, ignore=False):
+        table = cls.__table__
+        for member_type, select_members in members:
+            insert = table.insert().from_select(
+                ['parlour_id', 'id_number', 'member_id', 'applicant_id', 'member_type'],
+                select_members.add_columns(literal(member_type))
+            )
+            session.execute(ignoring(insert) if ignore else insert)
+
+    @classmethod
+    def rebuild(cls, session, parlour_id=None):
+        """
+        Recreates the identities from the member tables. Where legacy data has
+        the same ID number twice in a parlour the first member wins. Runs core
+        statements only, so session may also be a plain connection.
+        """
+        table = cls.__table__
+        delete = table.delete()
+        if parlour_id:
+            delete = delete.where(table.c.parlour_id == parlour_id)
+        session.execute(delete)
+
+        cls._insert_from(session, cls._member_selects(parlour_id=parlour_id), ignore=True)
+
+    @classmethod
+    def add_members(cls, session, applicant_ids):
+        """
+        Indexes the members of applicants written with bulk inserts, which the
+        flush listener does not see. Insertion is strict: callers check for
+        duplicates first, and a duplicate that slips through fails on the
+        unique key.
+        """
+        if applicant_ids:
+            cls._insert_from(session, cls._member_selects(applicant_ids=applicant_ids))
+
+
+def _moved(target) -> bool:
+    attrs = inspect(target).attrs
+    return any(attrs[name].history.has_changes() for name in FIELDS if name in attrs)
+
+
+def _identity(connection, target):
+    """ The (parlour_id, id_number) a member should hold, or None. """
+    if target.state not in STATES or not target.id_number:
+        return None
+
+    if isinstance(target, MainMember):
+        parlour_id = target.parlour_id
+    else:
+        parlour_id = connection.execute(
+            select(Applicant.parlour_id).where(Applicant.id == target.applicant_id)
+        ).scalar()
+
+    return (parlour_id, '{}'.format(target.id_number).strip()) if parlour_id else None
+
+
+def sync(session, flush_context):
+    """
+    after_flush: moves the identity rows of the members written in this flush.
+
+    Identities that are retired or moved are removed before any is added, so
+    an ID number handed from one member to another in the same flush, as on
+    a promotion, does not collide with itself. New members are inserted
+    strictly so a duplicate that slipped past the endpoint check fails the
+    transaction on the unique key. Existing members are re-synced leniently,
+    as legacy data may already hold duplicates.
+    """
+    table = MemberIdentity.__table__
+    connection = session.connection()
+    inserts = []
+
+    for target in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(target, MainMember):
+            member_type = MemberIdentity.TYPE_MAIN_MEMBER
+        elif isinstance(target, ExtendedMember):
+            member_type = MemberIdentity.TYPE_EXTENDED_MEMBER
+        else:
+            continue
+
+        if target in session.dirty and not _moved(target):
+            continue
+
+        member = and_(table.c.member_type == member_type, table.c.member_id == target.id)
+        identity = None if target in session.deleted else _identity(connection, target)
+
+        current = connection.execute(select(table.c.parlour_id, table.c.id_number).where(member)).first()
+        if current and identity and tuple(current) == identity:
+            continue
+
+        if current:
+            connection.execute(table.delete().where(member))
+
+        if identity:
+            insert = table.insert().values(
+                parlour_id=identity[0],
+                id_number=identity[1],
+                member_type=member_type,
+                member_id=target.id,
+                applicant_id=target.applicant_id
+            )
+            inserts.append(insert if target in session.new else ignoring(insert))
+
+    for insert in inserts:
+        connection.execute(insert)
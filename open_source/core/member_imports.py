@@ -0,0 +1,390 @@
+"""
+Bulk member imports from spreadsheets.
+
+Uploads arrive base64 encoded in the request body. They are decoded into
+memory and walked with a read-only workbook, which parses the sheet XML
+lazily instead of building every cell up front, so a large sheet is never
+written to disk or held as cell objects.
+
+MemberImport validates every row against reference data fetched once per
+import and an in-memory view of the ID numbers already taken, then writes
+the new families with chunked bulk inserts inside the caller's transaction.
+
+Sheet columns: first name, last name, ID number (or date of birth for
+extended members), contact, date joined, waiting period, address, policy
+number, extended member type and relation. A row with a type or relation
+is an extended member of the main member above it.
+
+Usage::
+
+    with db.transaction() as session:
+        member_import = MemberImport(session, consultant_id, plan_id)
+        error_data = member_import.run(spreadsheet_rows(rest_dict.pop('csv')))
+"""
+import io
+import logging
+
+from base64 import b64decode
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from open_source import id_numbers
+from open_source.core import age_limits, member_counters
+from open_source.core.applicants import Applicant
+from open_source.core.consultants import Consultant
+from open_source.core.extended_members import ExtendedMember
+from open_source.core.main_members import MainMember
+from open_source.core.member_identities import MemberIdentity
+from open_source.core.parlours import Parlour
+from open_source.core.plans import Plan
+from dateutil.parser import parse
+from sqlalchemy import func
+
+import openpyxl
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# ExtendedMember.type -> (Plan attribute holding the allowed number, plural, singular) for the errors
+MEMBER_SLOTS = {
+    ExtendedMember.TYPE_SPOUSE: ('spouse', 'a spouse', 'spouse'),
+    ExtendedMember.TYPE_DEPENDANT: ('beneficiaries', 'dependents', 'dependent'),
+    ExtendedMember.TYPE_EXTENDED_MEMBER: ('extended_members', 'extended-members', 'extended-member'),
+    ExtendedMember.TYPE_ADDITIONAL_EXTENDED_MEMBER: (
+        'additional_extended_members', 'additional-extended-members', 'additional-extended-member'
+    ),
+}
+
+
+def spreadsheet_rows(encoded: str, header_rows: int = 1) -> Iterator[List]:
+    """ read_rows for a base64 encoded upload. """
+    return read_rows(b64decode(encoded), header_rows)
+
+
+def read_rows(content: bytes, header_rows: int = 1) -> Iterator[List]:
+    """
+    Yields the cell values of each row of the active sheet after the header,
+    as a list padded to the sheet's width like the rows of a normal workbook.
+    """
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(min_row=header_rows + 1, values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def _chunks(items: List, size: int = BATCH_SIZE) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _cell(data: List, index: int):
+    return data[index] if index < len(data) else None
+
+
+class _Family:
+    """
+    An applicant that rows of the sheet add members to: a new one built from
+    a main member row, or an existing one whose main member was already on
+    file when the sheet repeats it.
+    """
+
+    def __init__(self, plan, applicant=None, main_member=None, applicant_id=None):
+        self.plan = plan
+        self.applicant = applicant
+        self.main_member = main_member
+        self.applicant_id = applicant_id
+        self.extended_members = []
+        self.counts = defaultdict(int)
+        self.names = {}
+        self.touched = False
+
+
+class MemberImport:
+    """
+    One spreadsheet import for a consultant and plan. Produces the same
+    error_data report as the row by row import: a {'data', 'error'} entry
+    for every row that was not imported.
+    """
+
+    def __init__(self, session, consultant_id, plan_id, today: date = None):
+        self.session = session
+        self.today = today or date.today()
+        self.now = datetime.now()
+        self.consultant = session.query(Consultant).get(consultant_id)
+        self.plan = session.query(Plan).get(plan_id) if plan_id else None
+        self.parlour = session.query(Parlour).filter(
+            Parlour.id == self.plan.parlour_id,
+            Parlour.state == Parlour.STATE_ACTIVE).first() if self.plan else None
+
+        self.error_data = []
+        self.families = []
+        self.identities = {}
+        self.existing = {}
+        self.updated = {}
+
+    @property
+    def applicant_ids(self) -> List[int]:
+        """ Applicants that gained members, known once run has inserted them. """
+        ids = [family.applicant['id'] for family in self.families]
+        return ids + [family.applicant_id for family in self.existing.values() if family.extended_members or family.touched]
+
+    def run(self, rows: Iterable[List]) -> List[Dict[str, Any]]:
+        rows = [list(data) for data in rows if any(data)]
+        self._prefetch(rows)
+
+        family = None
+        for data in rows:
+            if _cell(data, 8) or _cell(data, 9):
+                self._extended_member(data, family)
+            else:
+                family = self._main_member(data)
+
+        self._insert()
+        return self.error_data
+
+    def _error(self, data, error):
+        self.error_data.append({'data': data, 'error': error})
+
+    def _prefetch(self, rows: List[List]):
+        """ The parlour's identities for the ID numbers on the sheet and the families they belong to. """
+        if not self.parlour:
+            return
+
+        numbers = sorted({'{}'.format(data[2]).strip() for data in rows if data[2] and len('{}'.format(data[2]).strip()) == 13})
+        for chunk in _chunks(numbers):
+            for identity in self.session.query(MemberIdentity).filter(
+                MemberIdentity.parlour_id == self.parlour.id,
+                MemberIdentity.id_number.in_(chunk)
+            ):
+                self.identities[identity.id_number] = identity
+
+        applicant_ids = sorted({identity.applicant_id for identity in self.identities.values() if identity.is_main_member})
+        plans = {}
+        for chunk in _chunks(applicant_ids):
+            for applicant_id, plan_id in self.session.query(Applicant.id, Applicant.plan_id).filter(
+                Applicant.id.in_(chunk),
+                Applicant.state == Applicant.STATE_ACTIVE
+            ):
+                if plan_id not in plans:
+                    plans[plan_id] = self.session.query(Plan).get(plan_id)
+                self.existing[applicant_id] = _Family(plans[plan_id], applicant_id=applicant_id)
+
+            for applicant_id, member_type, count in self.session.query(
+                ExtendedMember.applicant_id, ExtendedMember.type, func.count(ExtendedMember.id)
+            ).filter(
+                ExtendedMember.applicant_id.in_(chunk),
+                ExtendedMember.state == ExtendedMember.STATE_ACTIVE
+            ).group_by(ExtendedMember.applicant_id, ExtendedMember.type):
+                if applicant_id in self.existing:
+                    self.existing[applicant_id].counts[member_type] = count
+
+            for member_id, applicant_id, first_name, last_name in self.session.query(
+                ExtendedMember.id, ExtendedMember.applicant_id, ExtendedMember.first_name, ExtendedMember.last_name
+            ).filter(
+                ExtendedMember.applicant_id.in_(chunk),
+                ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED))
+            ):
+                if applicant_id in self.existing:
+                    self.existing[applicant_id].names[((first_name or '').strip(), (last_name or '').strip())] = member_id
+
+    def _main_member(self, data: List) -> Optional[_Family]:
+        """ Validates a main member row and returns the family its extended member rows join. """
+        id_check = '{}'.format(data[2]).strip() if data[2] else None
+
+        if not id_check:
+            return self._error(data, "Missing id_number field.")
+        if not id_numbers.validate(id_check):
+            return self._error(data, "Incorrect id_number entered.")
+        if not data[0]:
+            return self._error(data, "Missing first name field.")
+        if not data[1]:
+            return self._error(data, "Missing last name field.")
+        if not _cell(data, 4):
+            return self._error(data, "Date joined is a required field.")
+        if not _cell(data, 3):
+            return self._error(data, "Contact number is a required field.")
+        if not self.consultant:
+            return self._error(data, "Consultant does not exist.")
+        if not self.plan:
+            return self._error(data, "Plan not found.")
+        if not self.parlour:
+            return self._error(data, "Parlour does not exist.")
+        if not _cell(data, 7):
+            return self._error(data, 'Missing policy number')
+
+        identity = self.identities.get(id_check)
+        if identity:
+            self._error(data, 'ID number already exists')
+            if isinstance(identity, _Family):
+                return identity
+            return self.existing.get(identity.applicant_id) if identity.is_main_member else None
+
+        dob = id_numbers.date_of_birth(id_check, self.today)
+        if not dob:
+            return self._error(data, 'Incorrect date formt on date of birth')
+
+        contact = '{}'.format(data[3])
+        family = _Family(
+            self.plan,
+            applicant=dict(
+                policy_num=data[7],
+                address=_cell(data, 6),
+                status='unpaid',
+                plan_id=self.plan.id,
+                consultant_id=self.consultant.id,
+                parlour_id=self.parlour.id,
+                old_url=False,
+                date=self.now,
+                state=Applicant.STATE_ACTIVE,
+                modified_at=self.now,
+                created_at=self.now
+            ),
+            main_member=dict(
+                first_name=data[0],
+                last_name=data[1],
+                id_number=id_check,
+                birthday=age_limits.birthday(id_check),
+                contact=contact if len(contact) == 10 else '0{}'.format(contact),
+                parlour_id=self.parlour.id,
+                date_joined=data[4],
+                waiting_period=_cell(data, 5) or 0,
+                age_limit_exceeded=bool(age_limits.exceeds(
+                    dob, self.plan.member_minimum_age, self.plan.member_maximum_age, self.today
+                )),
+                state=MainMember.STATE_ACTIVE,
+                modified_at=self.now,
+                created_at=self.now
+            )
+        )
+
+        self.identities[id_check] = family
+        self.families.append(family)
+        return family
+
+    def _extended_member(self, data: List, family: Optional[_Family]):
+        if not all([_cell(data, 8), _cell(data, 9)]):
+            return self._error(data, "Extended member type and relation to main member are requires fieds.")
+        if not family:
+            return self._error(data, "Main member to extended member has an issue.")
+        if not data[0]:
+            return self._error(data, "First name is a required field.")
+        if not data[1]:
+            return self._error(data, "Last name is a required field.")
+        if not data[2]:
+            return self._error(data, "ID number/dob is a required field.")
+        if not _cell(data, 4):
+            return self._error(data, "Date joined is a required field.")
+
+        id_check = '{}'.format(data[2]).strip()
+        is_id_number = len(id_check) == 13
+
+        if is_id_number:
+            if not id_numbers.validate(id_check):
+                return self._error(data, "Incorrect id_number entered.")
+            date_of_birth = id_numbers.date_of_birth(id_check, self.today)
+        else:
+            date_of_birth = id_numbers.parse_date_of_birth(data[2]) if isinstance(data[2], (date, datetime)) else None
+            try:
+                date_of_birth = date_of_birth or parse(id_check).date()
+            except (TypeError, ValueError, OverflowError):
+                date_of_birth = None
+
+        if not date_of_birth:
+            return self._error(data, 'Incorrect date format on date of birth or id_number')
+
+        member_type = ExtendedMember.text_to_type.get('_'.join('{}'.format(data[8]).lower().split(' ')))
+        relation = ExtendedMember.text_to_relation.get('_'.join('{}'.format(data[9]).lower().split(' ')))
+        if not member_type:
+            return self._error(data, "Unrecognized member type.")
+        if not relation:
+            return self._error(data, "Unrecognized member relation.")
+
+        name = ('{}'.format(data[0]).strip(), '{}'.format(data[1]).strip())
+        existing_id = family.names.get(name)
+
+        identity = self.identities.get(id_check) if is_id_number else None
+        if identity and not (
+            existing_id and isinstance(identity, MemberIdentity) and
+            not identity.is_main_member and identity.member_id == existing_id
+        ):
+            return self._error(data, 'ID number already exists')
+
+        attribute, plural, singular = MEMBER_SLOTS[member_type]
+        allowed = getattr(family.plan, attribute)
+        if not allowed:
+            return self._error(data, "This plan does not have {}.".format(plural))
+        if not existing_id and allowed <= family.counts[member_type]:
+            return self._error(data, "Limit for number of {} members has been reached.".format(singular))
+
+        minimum, maximum = age_limits.EXTENDED_LIMITS[member_type]
+        limits = [getattr(family.plan, column.key) for column in age_limits.EXTENDED_LIMIT_COLUMNS]
+        exceeded = bool(age_limits.exceeds(date_of_birth, limits[minimum], limits[maximum], self.today))
+
+        if existing_id:
+            self.updated[existing_id] = (id_check if is_id_number else None, exceeded)
+            family.touched = True
+            return
+
+        contact = '{}'.format(_cell(data, 3) or '')
+        family.counts[member_type] += 1
+        family.extended_members.append(dict(
+            first_name=data[0],
+            last_name=data[1],
+            number="".join(["+27", contact[1:]]) if len(contact) == 10 else contact,
+            date_of_birth=date_of_birth,
+            birthday=date_of_birth.strftime('%m%d'),
+            type=member_type,
+            id_number=id_check if is_id_number else None,
+            relation_to_main_member=relation,
+            applicant_id=family.applicant_id,
+            date_joined=data[4],
+            waiting_period=_cell(data, 5) or 0,
+            age_limit_exceeded=exceeded,
+            state=ExtendedMember.STATE_ACTIVE,
+            created_at=self.now,
+            modified_at=self.now
+        ))
+        if is_id_number:
+            self.identities[id_check] = family
+
+    def _insert(self):
+        """
+        New families go in with chunked bulk inserts. These skip the mapper
+        and flush listeners, so the identity index and the dashboard counters
+        are updated here. Members added to families already on file are few
+        and go through the ORM so the listeners see them.
+        """
+        for chunk in _chunks(self.families):
+            self.session.bulk_insert_mappings(Applicant, [family.applicant for family in chunk], return_defaults=True)
+
+            main_members, extended_members = [], []
+            for family in chunk:
+                family.main_member['applicant_id'] = family.applicant['id']
+                main_members.append(family.main_member)
+                for member in family.extended_members:
+                    member['applicant_id'] = family.applicant['id']
+                    extended_members.append(member)
+
+            self.session.bulk_insert_mappings(MainMember, main_members)
+            self.session.bulk_insert_mappings(ExtendedMember, extended_members)
+            MemberIdentity.add_members(self.session, [family.applicant['id'] for family in chunk])
+
+        for family in self.existing.values():
+            for member in family.extended_members:
+                self.session.add(ExtendedMember(**member))
+
+        for chunk in _chunks(sorted(self.updated)):
+            for extended_member in self.session.query(ExtendedMember).filter(ExtendedMember.id.in_(chunk)):
+                extended_member.id_number, extended_member.age_limit_exceeded = self.updated[extended_member.id]
+
+        self.session.flush()
+
+        if self.families:
+            member_counters.mark_parlour_dirty(self.session, self.parlour.id)
+
+        logger.info("Imported {} families, {} error rows.".format(len(self.families), len(self.error_data)))
@@ -1,25 +1,56 @@
 import datetime
 
-import smtplib, ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from open_source import config, db, utils
+from open_source import config, db, mail, utils
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from typing import Dict, List
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, and_, func
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
-from open_source.core.applicants import Applicant
 from open_source.core.consultants import Consultant
-from open_source.core.payments import Payment
-from open_source.core.invoices import Invoice
+from open_source.core.financial_rollups import FinancialRollup
 
 from open_source.core.resources import DAILY_FINANCIAL_REPORT_PER_CONSULTANT_EMAIL_TEMPLATE
 
 conf = config.get_config()
 
 
+def daily_financial_report(session, parlour_id, consultant_ids: List[int], day: datetime.date = None) -> List[Dict]:
+    """
+    What each of consultant_ids collected for a parlour on day (today by
+    default), with one grouped query over the daily rollups. Active
+    consultants without collections are reported with 0, in the order of
+    consultant_ids.
+    """
+    day = day or datetime.date.today()
+    amount = func.coalesce(func.sum(FinancialRollup.amount), 0)
+
+    rows = session.query(
+        Consultant.id,
+        Consultant.first_name,
+        Consultant.last_name,
+        amount
+    ).outerjoin(FinancialRollup, and_(
+        FinancialRollup.consultant_id == Consultant.id,
+        FinancialRollup.parlour_id == parlour_id,
+        FinancialRollup.period == FinancialRollup.PERIOD_DAY,
+        FinancialRollup.period_start == day
+    )).filter(
+        Consultant.id.in_(consultant_ids),
+        Consultant.state == Consultant.STATE_ACTIVE
+    ).group_by(Consultant.id, Consultant.first_name, Consultant.last_name).all()
+
+    order = {consultant_id: i for i, consultant_id in enumerate(consultant_ids)}
+    return [
+        {'consultant_id': id, 'first_name': first_name, 'last_name': last_name, 'amount': amount}
+        for id, first_name, last_name, amount in sorted(rows, key=lambda row: order[row[0]])
+    ]
+
+
 class Notification(db.Base):
     STATE_DELETED = 0
     STATE_ACTIVE = 1
@@ -59,6 +90,11 @@ class Notification(db.Base):
         self.make_deleted()
         session.commit()
 
+    @property
+    def consultant_ids(self) -> List[int]:
+        """ The selected consultants; the "all" entry adds none of its own. """
+        return [int(id) for id in self.consultants.split(", ") if id != "all"] if self.consultants else []
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -70,45 +106,31 @@ class Notification(db.Base):
 
     @staticmethod
     def get_money_collected(session, consultant=None):
-        applicants = session.query(Applicant).filter(Applicant.consultant_id == consultant.id, Applicant.state == Applicant.STATE_ACTIVE).all()
-        applicant_ids = [applicant.id for applicant in applicants]
+        """ Today's collections of a consultant, read from the daily rollup. """
+        return FinancialRollup.collected(session, consultant.parlour_id, datetime.date.today(), consultant_id=consultant.id)
 
-        payments = session.query(Payment).filter(Payment.applicant_id.in_(applicant_ids), Payment.created >= datetime.datetime.today().date()).all()
-
-        if len(payments) > 0:
-            payment_ids = [payment.id for payment in payments]
-            invoices =  session.query(Invoice).filter(Invoice.payment_id.in_(payment_ids), Invoice.state == Invoice.STATE_ACTIVE).all()
-            return sum([invoice.amount for invoice in invoices])
-        return 0
-
-    def send_email(self, session, parlour):
-        port = 465  # For SSL
-        smtp_server = "mail.osource.co.za"
+    def build_email(self, session, parlour) -> MIMEMultipart:
+        """ Today's report for the recipients, ready for mail.Mailer. """
         sender_email = conf.SENDER_EMAIL
-        password = conf.SENDER_PASSWORD
         to_list = [x.strip() for x in self.recipients.split(",")]
 
         message = MIMEMultipart("alternative")
         message["Subject"] = "Daily Financial Report"
         message["From"] = sender_email
+        message["To"] = ", ".join(to_list)
 
-        consultant = None
         consultants = []
         sum = 0
 
-        for id in self.consultants.split(", "):
-            if id != "all":
-                consultant = session.query(Consultant).filter(Consultant.id == int(id), Consultant.state == Consultant.STATE_ACTIVE).first()
-                amount = self.get_money_collected(session, consultant=consultant)
+        for row in daily_financial_report(session, parlour.id, self.consultant_ids):
+            entry = """
+                <tr>
+                    <td>{} {}</td>
+                    <td>R{}</td>
+                </try>""".format(row['first_name'], row['last_name'], row['amount'])
 
-                entry = """
-                    <tr>
-                        <td>{} {}</td>
-                        <td>R{}</td>
-                    </try>""".format(consultant.first_name, consultant.last_name, amount)
-
-                consultants.append(entry)
-                sum += amount
+            consultants.append(entry)
+            sum += row['amount']
 
         html = {"html": """
             {}
@@ -134,8 +156,14 @@ class Notification(db.Base):
         # The email client will try to render the last part first
         # message.attach(part1)
         message.attach(part2)
-        context = ssl.create_default_context()
+        return message
+
+    def send_email(self, session, parlour, mailer: mail.Mailer = None):
+        """ Sends the report at once, over mailer's pooled connections when given. """
+        message = self.build_email(session, parlour)
 
-        with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, to_list, message.as_string())
\ No newline at end of file
+        if mailer:
+            mailer.send(message)
+        else:
+            with mail.Mailer(size=1) as mailer:
+                mailer.send(message)
\ No newline at end of file
@@ -0,0 +1,209 @@
+import base64
+import json
+import logging
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, and_, or_
+from sqlalchemy.engine import Row
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+TRUTHY = ('yes', 'y', 't', 'true', '1')
+
+
+def is_paginated(params: Dict[str, Any]) -> bool:
+    """ True when the caller asked for a page (offset/limit or cursor) instead of a plain list. """
+    return 'offset' in params or 'limit' in params or is_keyset(params)
+
+
+def is_keyset(params: Dict[str, Any]) -> bool:
+    """ True when the caller walks the list with a cursor. An empty cursor asks for the first page. """
+    return 'cursor' in params
+
+
+def strip(query):
+    """
+    Returns query without the parts that do not change the number of rows:
+    ORDER BY, eager loads, LIMIT and OFFSET.
+    """
+    return query.enable_eagerloads(False).order_by(None).limit(None).offset(None)
+
+
+def count(query, estimate=False) -> int:
+    """
+    Counts the rows of query with ``SELECT COUNT(*)`` instead of loading them.
+
+    With estimate set the optimizer's row estimate is used when the database
+    can provide one, which avoids scanning very large parlours. Only plans
+    that read a single table have a meaningful estimate; joined list queries
+    are counted exactly.
+    """
+    query = strip(query)
+
+    if estimate:
+        estimated = estimated_count(query)
+        if estimated is not None:
+            return estimated
+
+    return query.count()
+
+
+def estimated_count(query) -> Optional[int]:
+    """
+    MySQL's EXPLAIN estimate of the rows query returns, or None when there is
+    none to trust. EXPLAIN reports one row per table in the plan and the
+    first only estimates the rows read from that table, not the rows the
+    join returns, so plans over several tables return None.
+    """
+    session = query.session
+    dialect = session.get_bind().dialect
+
+    if dialect.name != 'mysql':
+        return None
+
+    try:
+        statement = query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        rows = session.connection().exec_driver_sql('EXPLAIN {}'.format(statement)).fetchall()
+    except Exception:
+        logger.exception("Error, failed to estimate row count. Falling back to COUNT(*).")
+        return None
+
+    if len(rows) != 1:
+        return None
+
+    plan = rows[0]._mapping
+    filtered = plan.get('filtered')
+    estimated = (plan['rows'] or 0) * (float(filtered) / 100 if filtered is not None else 1)
+    return int(round(estimated))
+
+
+def page_params(params: Dict[str, Any]) -> Tuple[int, int, bool]:
+    """ Pops offset, limit and estimate from the request params. """
+    offset = max(int(params.pop('offset', 0) or 0), 0)
+    limit = min(max(int(params.pop('limit', DEFAULT_LIMIT) or DEFAULT_LIMIT), 1), MAX_LIMIT)
+    estimate = params.pop('estimate', 'no') in TRUTHY
+    return offset, limit, estimate
+
+
+def paginate_empty(params: Dict[str, Any]) -> Dict[str, Any]:
+    offset, limit, _ = page_params(params)
+    return {
+        "offset": offset,
+        "limit": limit,
+        "count": 0,
+        "total": 0,
+        "result": []
+    }
+
+
+def paginate(query, params: Dict[str, Any], render: Callable[[List], List[dict]], keys: Sequence = None) -> Dict[str, Any]:
+    """
+    Applies offset/limit to query in SQL and renders only the requested page.
+    When the caller passes a cursor the page is fetched with paginate_keyset
+    instead, ordered by keys (the primary key of the queried entity by default).
+
+    Usage::
+
+        paginate(query, req.params, lambda rows: MainMember.to_dicts(session, rows))
+        >> {"offset": 0, "limit": 20, "count": 20, "total": 5310, "result": [...]}
+    """
+    if is_keyset(params):
+        return paginate_keyset(query, params, render, keys or default_keys(query))
+
+    offset, limit, estimate = page_params(params)
+
+    total = count(query, estimate)
+    result = render(query.offset(offset).limit(limit).all())
+
+    return {
+        "offset": offset,
+        "limit": limit,
+        "count": len(result),
+        "total": total,
+        "result": result
+    }
+
+
+def default_keys(query) -> Tuple:
+    entity = query.column_descriptions[0]['entity']
+    return (entity.id,)
+
+
+def encode_cursor(values: Sequence) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values), default=str).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str, keys: Sequence) -> Optional[List]:
+    """ Returns the key values stored in cursor, or None for the first page. """
+    if not cursor:
+        return None
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor {}.".format(cursor))
+
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("Invalid cursor {}.".format(cursor))
+
+    return [
+        datetime.fromisoformat(value) if value is not None and isinstance(key.type, DateTime) else value
+        for key, value in zip(keys, values)
+    ]
+
+
+def after(keys: Sequence, values: Sequence):
+    """
+    Builds the WHERE clause selecting rows that sort after values when
+    ordering by keys descending, e.g. for (modified_at, id)::
+
+        modified_at < :modified_at OR (modified_at = :modified_at AND id < :id)
+    """
+    clauses = []
+    for i, key in enumerate(keys):
+        equal = [k == v for k, v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*equal, key < values[i]))
+    return or_(*clauses)
+
+
+def paginate_keyset(query, params: Dict[str, Any], render: Callable[[List], List[dict]], keys: Sequence) -> Dict[str, Any]:
+    """
+    Walks query newest first by keys, starting after the position stored in
+    the cursor param. Each page is a range scan on the keys index, so deep
+    pages cost the same as the first one. next_cursor is None on the last page.
+
+    Usage::
+
+        paginate_keyset(query, {"cursor": "", "limit": 50}, MainMember.to_dicts, (MainMember.modified_at, MainMember.id))
+        >> {"limit": 50, "count": 50, "next_cursor": "WyIyMDIxLTA...", "result": [...]}
+    """
+    cursor = params.pop('cursor', None)
+    _, limit, _ = page_params(params)
+    values = decode_cursor(cursor, keys)
+
+    query = query.order_by(None).order_by(*[key.desc() for key in keys])
+    if values is not None:
+        query = query.filter(after(keys, values))
+
+    rows = query.limit(limit + 1).all()
+    rows, more = rows[:limit], len(rows) > limit
+
+    next_cursor = None
+    if more:
+        last = rows[-1][0] if isinstance(rows[-1], Row) else rows[-1]
+        next_cursor = encode_cursor([getattr(last, key.key) for key in keys])
+
+    result = render(rows)
+
+    return {
+        "limit": limit,
+        "count": len(result),
+        "next_cursor": next_cursor,
+        "result": result
+    }
@@ -0,0 +1,247 @@
+"""
+Derives applicants' payment status (paid, unpaid, skipped or lapsed) in bulk.
+
+Applicants carry the first day of the last month their payments cover in
+``paid_through_month``, and the capture time of their latest payment in
+``last_payment_date``. ``refresh_paid_through`` recomputes both from
+``payments`` with one grouped query per chunk whenever a payment or its
+invoice is added or deleted, so the status run reads ``applicants`` only.
+
+Every applicant in scope is read into a DataFrame. The status rules
+are evaluated on the whole frame at once and only the applicants whose
+status changes are written, with one UPDATE per status and chunk of ids.
+Lapsed applicants are archived together with their main members.
+
+Statuses count calendar months between today and the paid through month,
+or the month the applicant joined when nothing was paid yet:
+
+    ======================  ===========  ==========
+    months behind           paid before  never paid
+    ======================  ===========  ==========
+    0 or less (in advance)  paid         unpaid
+    1                       unpaid       skipped
+    2                       skipped      skipped
+    3                       skipped      lapsed
+    more than 3             lapsed       lapsed
+    ======================  ===========  ==========
+
+Usage::
+
+    with db.transaction() as session:
+        payment_status.refresh_paid_through(session, [applicant.id])
+        payment_status.recompute(session, parlour_id=parlour.id)
+        >> {'paid': 10, 'unpaid': 4, 'skipped': 2, 'lapsed': 1}
+"""
+import logging
+
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional
+
+from open_source.core import member_counters
+from open_source.core.applicants import Applicant
+from open_source.core.invoices import Invoice
+from open_source.core.main_members import MainMember
+from open_source.core.payments import Payment
+from sqlalchemy import and_, bindparam, exists, func, select
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+STATUS_PAID = 'paid'
+STATUS_UNPAID = 'unpaid'
+STATUS_SKIPPED = 'skipped'
+STATUS_LAPSED = 'lapsed'
+
+STATUSES = (STATUS_PAID, STATUS_UNPAID, STATUS_SKIPPED, STATUS_LAPSED)
+
+
+def _chunks(ids: List[int], size: int = BATCH_SIZE) -> Iterable[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _scope(query, parlour_id=None, applicant_ids=None):
+    if parlour_id:
+        query = query.filter(Applicant.parlour_id == parlour_id)
+    if applicant_ids is not None:
+        query = query.filter(Applicant.id.in_(applicant_ids))
+    return query
+
+
+def _paid_through(connection, applicant_ids: List[int]) -> Dict[int, Dict]:
+    """ The columns to store for each of applicant_ids, from their active payments whose invoice was not deleted. """
+    payments, invoices = Payment.__table__, Invoice.__table__
+    deleted_invoice = exists().where(and_(
+        invoices.c.payment_id == payments.c.id,
+        invoices.c.state == Invoice.STATE_DELETED
+    ))
+
+    rows = connection.execute(select([
+        payments.c.applicant_id,
+        func.max(payments.c.created),
+        func.max(payments.c.date)
+    ]).where(and_(
+        payments.c.applicant_id.in_(applicant_ids),
+        payments.c.state == Payment.STATE_ACTIVE,
+        ~deleted_invoice
+    )).group_by(payments.c.applicant_id))
+
+    result = {
+        applicant_id: {'applicant_id': applicant_id, 'last_payment_date': None, 'paid_through_month': None}
+        for applicant_id in applicant_ids
+    }
+    for applicant_id, created, paid_through in rows:
+        result[applicant_id]['last_payment_date'] = created
+        result[applicant_id]['paid_through_month'] = paid_through.date().replace(day=1) if paid_through else None
+    return result
+
+
+def refresh_paid_through(connection, applicant_ids: List[int]) -> int:
+    """
+    Recomputes last_payment_date and paid_through_month of applicant_ids with
+    one grouped query and one batched UPDATE per chunk. Runs core statements
+    only, so connection may also be a session; the caller commits.
+    """
+    table = Applicant.__table__
+    update = table.update().where(table.c.id == bindparam('applicant_id')).values(
+        last_payment_date=bindparam('last_payment_date'),
+        paid_through_month=bindparam('paid_through_month')
+    )
+
+    for chunk in _chunks(list(applicant_ids)):
+        connection.execute(update, list(_paid_through(connection, chunk).values()))
+    return len(applicant_ids)
+
+
+def backfill_paid_through(connection, parlour_id=None, progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """ Refreshes every applicant, or those of one parlour, for the migration and the backfill job. """
+    table = Applicant.__table__
+    query = select([table.c.id]).order_by(table.c.id)
+    if parlour_id:
+        query = query.where(table.c.parlour_id == parlour_id)
+    applicant_ids = [applicant_id for applicant_id, in connection.execute(query)]
+
+    for done, chunk in enumerate(_chunks(applicant_ids), 1):
+        refresh_paid_through(connection, chunk)
+        if progress:
+            progress(min(done * BATCH_SIZE, len(applicant_ids)), len(applicant_ids))
+    return len(applicant_ids)
+
+
+def _rows(session, **scope):
+    return _scope(session.query(
+        Applicant.id,
+        Applicant.parlour_id,
+        Applicant.state,
+        Applicant.status,
+        Applicant.consultant_id,
+        Applicant.date,
+        Applicant.paid_through_month
+    ).filter(
+        Applicant.state != Applicant.STATE_DELETED
+    ), **scope)
+
+
+def _months_behind(dates: pd.Series, today: date) -> pd.Series:
+    dates = pd.to_datetime(dates, errors='coerce')
+    return (today.year - dates.dt.year) * 12 + (today.month - dates.dt.month)
+
+
+def statuses(paid_through_month: pd.Series, joined: pd.Series, today: date) -> pd.Series:
+    """ The status rules over whole columns; None where an applicant has neither date. """
+    paid = _months_behind(paid_through_month, today)
+    joined = _months_behind(joined, today)
+
+    # NaN compares False, so each rule only matches applicants that have its date
+    result = pd.Series(np.select(
+        [paid > 3, paid > 1, paid == 1, paid.notna(), joined >= 3, joined > 0, joined.notna()],
+        [STATUS_LAPSED, STATUS_SKIPPED, STATUS_UNPAID, STATUS_PAID, STATUS_LAPSED, STATUS_SKIPPED, STATUS_UNPAID],
+        default=''
+    ), index=paid_through_month.index, dtype=object)
+    return result.where(result != '', None)
+
+
+def changes(session, today: date = None, **scope) -> pd.DataFrame:
+    """ The applicants in scope whose status, or archived state when lapsed, has to change. """
+    today = today or date.today()
+    frame = pd.DataFrame.from_records(
+        _rows(session, **scope).all(),
+        columns=['id', 'parlour_id', 'state', 'status', 'consultant_id', 'date', 'paid_through_month']
+    )
+    if frame.empty:
+        return frame
+
+    frame['new_status'] = statuses(frame['paid_through_month'], frame['date'], today)
+    lapsing = (frame['new_status'] == STATUS_LAPSED) & (frame['state'] != Applicant.STATE_ARCHIVED)
+    changed = frame['new_status'].notna() & ((frame['new_status'] != frame['status']) | lapsing)
+    return frame[changed]
+
+
+def _counter_changes(session, frame: pd.DataFrame):
+    """ Moves the member counters by what apply is about to change, before it does. """
+    applicants = {}
+    for row in frame.itertuples(index=False):
+        consultant_id = int(row.consultant_id) if pd.notna(row.consultant_id) else None
+        parlour_id = int(row.parlour_id) if pd.notna(row.parlour_id) else None
+        state = Applicant.STATE_ARCHIVED if row.new_status == STATUS_LAPSED else row.state
+        applicants[int(row.id)] = (
+            (row.state, row.status, consultant_id, parlour_id),
+            (state, row.new_status, consultant_id, parlour_id)
+        )
+
+    main_members = {}
+    lapsing = [int(id) for id in frame['id'][frame['new_status'] == STATUS_LAPSED]]
+    for chunk in _chunks(lapsing):
+        archived = session.query(MainMember.id, MainMember.applicant_id).filter(
+            MainMember.applicant_id.in_(chunk),
+            MainMember.state == MainMember.STATE_ACTIVE
+        )
+        for id, applicant_id in archived:
+            main_members[id] = ((MainMember.STATE_ACTIVE, applicant_id), (MainMember.STATE_ARCHIVED, applicant_id))
+
+    member_counters.record_changes(session, applicants, main_members)
+
+
+def apply(session, frame: pd.DataFrame) -> Dict[str, int]:
+    """ Writes the changes with a few bulk UPDATEs and returns how many applicants got each status. """
+    if not frame.empty:
+        _counter_changes(session, frame)
+
+    counts = {}
+    for status in STATUSES:
+        ids = [int(id) for id in frame['id'][frame['new_status'] == status]] if not frame.empty else []
+        counts[status] = len(ids)
+
+        values = {Applicant.status: status}
+        if status == STATUS_LAPSED:
+            values[Applicant.state] = Applicant.STATE_ARCHIVED
+
+        for chunk in _chunks(ids):
+            session.query(Applicant).filter(Applicant.id.in_(chunk)).update(values, synchronize_session=False)
+
+            if status == STATUS_LAPSED:
+                session.query(MainMember).filter(
+                    MainMember.applicant_id.in_(chunk),
+                    MainMember.state == MainMember.STATE_ACTIVE
+                ).update({MainMember.state: MainMember.STATE_ARCHIVED}, synchronize_session=False)
+
+    return counts
+
+
+def recompute(session, parlour_id=None, applicant_ids=None, today: date = None) -> Dict[str, int]:
+    """
+    Brings the payment status of every applicant in scope (all applicants by
+    default) up to date and returns the counts of changed applicants per
+    status. The caller commits.
+    """
+    counts = apply(session, changes(session, today, parlour_id=parlour_id, applicant_ids=applicant_ids))
+
+    if applicant_ids is None:
+        logger.info("Payment statuses recomputed for parlour {}: {}.".format(parlour_id or 'all', counts))
+
+    return counts
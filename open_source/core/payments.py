@@ -1,17 +1,15 @@
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-
 from open_source import db
-from open_source.core.applicants import Applicant
-from open_source.core.main_members import MainMember
 
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, func, String
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index, func, String
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import relationship
 
 
 class Payment(db.Base):
     __tablename__ = 'payments'
+    __table_args__ = (
+        Index('ix_payments_applicant_id_id', 'applicant_id', 'id'),
+    )
 
     STATE_ACTIVE = 1
     STATE_DELETED = 0
@@ -85,32 +83,13 @@ class Payment(db.Base):
 
     @staticmethod
     def update_payment_status(session, applicant=None):
-        last_payment = Payment.get_last_payment(session, applicant.id)
-        applicant_date = applicant.date.date() or None
-        NOW = datetime.now()
-
-        if last_payment:
-            last_payment_date = last_payment.date.date() or None
-            if relativedelta(NOW, last_payment_date.replace(day=1)).months > 3 and NOW.date() > last_payment.date.date():
-                Payment.set_status(session, 'lapsed', applicant.id)
-                applicant.state = Applicant.STATE_ARCHIVED
-                main_member = session.query(MainMember).filter(MainMember.applicant_id == applicant.id).order_by(MainMember.id.desc()).first()
-                if main_member:
-                    main_member.state = MainMember.STATE_ARCHIVED
-            elif relativedelta(NOW, last_payment_date.replace(day=1)).months > 1 and NOW.date() > last_payment.date.date():
-                Payment.set_status(session, 'skipped', applicant.id)
-            elif relativedelta(NOW, last_payment_date.replace(day=1)).months > 0 and NOW.date() > last_payment.date.date():
-                Payment.set_status(session, 'unpaid', applicant.id)
-            elif relativedelta(NOW, last_payment_date.replace(day=1)).months == 0 or relativedelta(NOW, last_payment.date).months < 0:
-                Payment.set_status(session, 'paid', applicant.id)
-        else:
-            if relativedelta(NOW, applicant_date.replace(day=1)).months > 3:
-                Payment.set_status(session, 'lapsed', applicant.id)
-                applicant.state = Applicant.STATE_ARCHIVED
-                main_member = session.query(MainMember).filter(MainMember.applicant_id == applicant.id).order_by(MainMember.id.desc()).first()
-                if main_member:
-                    main_member.state = MainMember.STATE_ARCHIVED
-            elif relativedelta(NOW, applicant_date.replace(day=1)).months > 0:
-                Payment.set_status(session, 'skipped', applicant.id)
-            else:
-                Payment.set_status(session, 'unpaid', applicant.id)
+        """
+        Refreshes one applicant's paid through month after a payment or invoice
+        changed and recomputes its status with the rules of the nightly run in
+        core/payment_status.py.
+        """
+        from open_source.core import payment_status
+
+        payment_status.refresh_paid_through(session, [applicant.id])
+        payment_status.recompute(session, applicant_ids=[applicant.id])
+        session.expire(applicant, ['status', 'state', 'last_payment_date', 'paid_through_month'])
@@ -0,0 +1,113 @@
+"""
+Payment receipts, drawn in one pass at the size they are printed.
+
+Receipts used to be laid out as an A4 borb table, written out, read back
+with PyPDF2 and scaled down to 360x480. They are now drawn with reportlab
+straight onto a 360x480 page at the sizes the scaled A4 layout ended up
+with, so one canvas produces the final document in memory.
+
+Usage::
+
+    invoice.document = storage.receipts.save(file_name, receipt.render(invoice))
+"""
+import io
+
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+
+
+PAGE_SIZE = (360, 480)
+
+MARGIN = 10
+VALUE_X = 100
+VALUE_WIDTH = PAGE_SIZE[0] - VALUE_X - MARGIN
+
+FONT_SIZE = 7.5
+HEADING_SIZE = 8
+LEADING = 11
+
+# addresses and emails used to be broken after this many characters
+WRAP_AT = 23
+
+
+def _wrap(text: str):
+    text = text or ' '
+    return [text[:WRAP_AT], text[WRAP_AT:]] if len(text) > WRAP_AT else [text]
+
+
+def rows(invoice):
+    """
+    The receipt as (label, value lines, value font size) rows, in the order
+    they are printed. None is a blank row, '-' the separator and a row
+    without value lines a bold heading.
+    """
+    created = invoice.created
+    return [
+        None,
+        ("Date: ", ["%d/%d/%d" % (created.day, created.month, created.year)], FONT_SIZE),
+        None,
+        ("Address: ", _wrap(invoice.address), FONT_SIZE),
+        None,
+        ("Contact: ", [invoice.contact or ' '], FONT_SIZE),
+        None,
+        ("Email: ", _wrap(invoice.email), FONT_SIZE),
+        None,
+        '-',
+        ("Customer Details ", None, FONT_SIZE),
+        None,
+        ("Invoice: ", ["#{}".format(invoice.number)], FONT_SIZE),
+        None,
+        ("Policy Number: ", ["{}".format(invoice.policy_number)], FONT_SIZE),
+        None,
+        ("Premium: ", ["R {}".format(invoice.premium)], FONT_SIZE),
+        None,
+        ("Initial and Surname: ", [invoice.customer or ' '], 9),
+        None,
+        ("ID Number: ", [invoice.id_number or ' '], 8),
+        None,
+        ("Amount Paid: ", ["R {}".format(invoice.amount or ' ')], FONT_SIZE),
+        None,
+        ("Month Paid: ", [invoice.number_of_months or ' '], FONT_SIZE),
+        None,
+        ("Months Paid For: ", simpleSplit(invoice.months_paid or ' ', 'Helvetica', FONT_SIZE, VALUE_WIDTH), FONT_SIZE),
+        None,
+        ("Type of Payment: ", [invoice.payment_type or ' '], FONT_SIZE),
+        None,
+        ("Captured by: ", [invoice.assisted_by or ' '], FONT_SIZE),
+    ]
+
+
+def render(invoice) -> bytes:
+    """ The receipt of an invoice as a one page PDF. Only reads attributes, so snapshots work too. """
+    buffer = io.BytesIO()
+    can = canvas.Canvas(buffer, pagesize=PAGE_SIZE, bottomup=0)
+
+    y = 2 * LEADING
+    can.setFont('Helvetica-Bold', HEADING_SIZE)
+    can.drawString(MARGIN, y, invoice.parlour.parlourname)
+    y += LEADING
+
+    for row in rows(invoice):
+        y += LEADING
+        if row is None:
+            continue
+
+        if row == '-':
+            can.line(MARGIN, y - FONT_SIZE / 2, VALUE_X - MARGIN, y - FONT_SIZE / 2)
+            continue
+
+        label, lines, size = row
+        can.setFont('Helvetica-Bold' if lines is None else 'Helvetica', FONT_SIZE)
+        can.drawString(MARGIN, y, label)
+        if lines is None:
+            continue
+
+        can.setFont('Helvetica', size)
+        for i, line in enumerate(lines):
+            if i:
+                y += LEADING
+            can.drawString(VALUE_X, y, line)
+
+    can.showPage()
+    can.save()
+    return buffer.getvalue()
@@ -36,6 +36,13 @@ def create_table(cls, checkfirst=True):
 def create_tables(checkfirst=True):
     assert_initialized()
     Base.metadata.create_all(engine, checkfirst=checkfirst)
+    migrate()
+
+
+def migrate():
+    assert_initialized()
+    from open_source.db import migrations
+    migrations.migrate(engine)
 
 
 def drop_tables():
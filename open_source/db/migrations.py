@@ -0,0 +1,202 @@
+"""
+Versioned schema migrations for databases created before a model change.
+
+``Base.metadata.create_all`` only creates missing tables, so indexes and
+columns added to existing tables are applied here. Every migration is
+idempotent and recorded in ``schema_migrations`` once it has run.
+
+Usage::
+
+    from open_source import db
+    db.migrate()
+"""
+import logging
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(length=250)),
+    Column('applied_at', DateTime)
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def ensure_indexes(connection, table):
+    """
+    Creates the indexes declared on table that the database does not have yet.
+    Indexes over columns a later migration adds are left for that migration.
+    """
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    columns = {column['name'] for column in inspect(connection).get_columns(table.name)}
+
+    for index in table.indexes:
+        if index.name not in existing and all(column.name in columns for column in index.columns):
+            logger.info("Creating index {} on {}.".format(index.name, table.name))
+            index.create(connection)
+
+
+def add_column(connection, table, column):
+    """ Adds a model column that the database table does not have yet. """
+    existing = {c['name'] for c in inspect(connection).get_columns(table.name)}
+
+    if column.name not in existing:
+        logger.info("Adding column {} to {}.".format(column.name, table.name))
+        connection.execute(text('ALTER TABLE {} ADD COLUMN {} {}'.format(
+            table.name, column.name, column.type.compile(dialect=connection.dialect)
+        )))
+
+
+@migration(1, 'Composite indexes for the member, applicant, payment and invoice list filters')
+def add_list_indexes(connection):
+    from open_source.core.applicants import Applicant
+    from open_source.core.extended_members import ExtendedMember
+    from open_source.core.invoices import Invoice
+    from open_source.core.main_members import MainMember
+    from open_source.core.payments import Payment
+
+    for model in (MainMember, Applicant, ExtendedMember, Payment, Invoice):
+        ensure_indexes(connection, model.__table__)
+
+
+@migration(2, 'Indexed member birthdays and the age limit run log for the incremental age limit run')
+def add_birthdays(connection):
+    from open_source.core import age_limits
+    from open_source.core.age_limits import AgeLimitRun
+    from open_source.core.extended_members import ExtendedMember
+    from open_source.core.main_members import MainMember
+
+    for model in (MainMember, ExtendedMember):
+        add_column(connection, model.__table__, model.__table__.c.birthday)
+
+    for model in (MainMember, ExtendedMember):
+        age_limits.backfill_birthdays(connection, model.__table__)
+        ensure_indexes(connection, model.__table__)
+
+    AgeLimitRun.__table__.create(connection, checkfirst=True)
+
+
+@migration(3, 'Per parlour member identity index for ID number duplicate checks')
+def add_member_identities(connection):
+    from open_source.core.member_identities import MemberIdentity
+
+    MemberIdentity.__table__.create(connection, checkfirst=True)
+    MemberIdentity.rebuild(connection)
+
+
+@migration(4, 'Background job queue')
+def add_jobs(connection):
+    from open_source.core.jobs import Job
+
+    Job.__table__.create(connection, checkfirst=True)
+
+
+@migration(5, 'Deferred certificate rendering flag on applicants')
+def add_certificate_dirty_at(connection):
+    from open_source.core.applicants import Applicant
+
+    add_column(connection, Applicant.__table__, Applicant.__table__.c.certificate_dirty_at)
+    ensure_indexes(connection, Applicant.__table__)
+
+
+@migration(6, 'Certificate content hash on applicants')
+def add_certificate_hash(connection):
+    from open_source.core.applicants import Applicant
+
+    add_column(connection, Applicant.__table__, Applicant.__table__.c.certificate_hash)
+
+
+@migration(7, 'Per parlour invoice number sequences')
+def add_invoice_sequences(connection):
+    from open_source.core.invoices import InvoiceSequence
+
+    InvoiceSequence.__table__.create(connection, checkfirst=True)
+    InvoiceSequence.rebuild(connection)
+
+
+@migration(8, 'Materialised last payment date and paid through month on applicants')
+def add_paid_through(connection):
+    from open_source.core import payment_status
+    from open_source.core.applicants import Applicant
+
+    for column in (Applicant.__table__.c.last_payment_date, Applicant.__table__.c.paid_through_month):
+        add_column(connection, Applicant.__table__, column)
+    ensure_indexes(connection, Applicant.__table__)
+
+    payment_status.backfill_paid_through(connection)
+
+
+@migration(9, 'Daily and monthly collection rollups')
+def add_financial_rollups(connection):
+    from open_source.core.financial_rollups import FinancialRollup
+
+    # filled by migration 11 once invoices carry the consultant the rollups read
+    FinancialRollup.__table__.create(connection, checkfirst=True)
+
+
+@migration(10, 'Per parlour member counters for the dashboard')
+def add_member_counters(connection):
+    from open_source.core.member_counters import MemberCounter
+
+    MemberCounter.__table__.create(connection, checkfirst=True)
+    MemberCounter.rebuild(connection)
+
+
+@migration(11, 'Consultant a receipt was counted under on invoices')
+def add_invoice_consultant(connection):
+    from open_source.core.applicants import Applicant
+    from open_source.core.financial_rollups import FinancialRollup
+    from open_source.core.invoices import Invoice
+    from open_source.core.payments import Payment
+
+    invoices, payments, applicants = Invoice.__table__, Payment.__table__, Applicant.__table__
+    add_column(connection, invoices, invoices.c.consultant_id)
+
+    # the rollups counted existing receipts under the applicant's consultant so far
+    connection.execute(invoices.update().where(invoices.c.consultant_id.is_(None)).values(
+        consultant_id=select(applicants.c.consultant_id).select_from(
+            payments.join(applicants, applicants.c.id == payments.c.applicant_id)
+        ).where(payments.c.id == invoices.c.payment_id).scalar_subquery()
+    ))
+    FinancialRollup.rebuild(connection)
+
+
+def applied_versions(connection):
+    return {row.version for row in connection.execute(schema_migrations.select())}
+
+
+def migrate(engine):
+    """ Applies the migrations that have not run on this database, oldest first. """
+    metadata.create_all(engine, checkfirst=True)
+
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+
+        logger.info("Applying migration {}: {}.".format(version, description))
+        with engine.begin() as connection:
+            fn(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.now()
+            ))
@@ -0,0 +1,100 @@
+"""
+South African ID number parsing shared by the endpoints, imports and age limit runs.
+
+An ID number starts with the holder's date of birth as YYMMDD. The century
+is inferred from the current year: a YY up to this year's two digits is read
+as 20YY, anything later as 19YY. Results are memoized, so imports and sweeps
+that see the same ID numbers again only pay for the first parse.
+
+Usage::
+
+    date_of_birth('8001015009087')
+    >> datetime.date(1980, 1, 1)
+
+    validate('8001015009087')
+    >> True
+
+    dates_of_birth(['8001015009087', '0502290000000', 'garbage'])
+    >> [datetime.date(1980, 1, 1), None, None]
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+from za_id_number.za_id_number import SouthAfricanIdentityValidate
+
+
+CACHE_SIZE = 1 << 16
+
+
+def pivot_year(today: date = None) -> int:
+    """ Two digit years up to and including this one belong to the 2000s. """
+    return (today or date.today()).year % 100
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _date_of_birth(id_number: str, pivot: int) -> Optional[date]:
+    if len(id_number) < 6 or not id_number[:6].isdigit():
+        return None
+
+    year = int(id_number[0:2])
+    century = 2000 if year <= pivot else 1900
+    try:
+        return date(century + year, int(id_number[2:4]), int(id_number[4:6]))
+    except ValueError:
+        return None
+
+
+def date_of_birth(id_number, today: date = None) -> Optional[date]:
+    """ Date of birth encoded in id_number, or None when it has none. """
+    if not id_number:
+        return None
+    return _date_of_birth('{}'.format(id_number).strip(), pivot_year(today))
+
+
+def dates_of_birth(id_numbers: Iterable, today: date = None) -> List[Optional[date]]:
+    """ date_of_birth for many ID numbers, parsing each distinct value once. """
+    pivot = pivot_year(today)
+    parsed = {}
+    result = []
+    for id_number in id_numbers:
+        if id_number not in parsed:
+            parsed[id_number] = _date_of_birth('{}'.format(id_number).strip(), pivot) if id_number else None
+        result.append(parsed[id_number])
+    return result
+
+
+def parse_date_of_birth(value=None, id_number=None, today: date = None) -> Optional[date]:
+    """
+    A member's date of birth: value when given (a date or an ISO string, with
+    or without a time part), otherwise the one encoded in id_number.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+
+    if isinstance(value, date):
+        return value
+
+    if value:
+        try:
+            return datetime.strptime('{}'.format(value).replace('T', ' ')[:10].replace('/', '-'), "%Y-%m-%d").date()
+        except ValueError:
+            pass
+
+    return date_of_birth(id_number, today)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _validate(id_number: str) -> bool:
+    try:
+        return bool(SouthAfricanIdentityValidate(id_number).validate())
+    except Exception:
+        return False
+
+
+def validate(id_number) -> bool:
+    """ True for a 13 digit ID number with a valid date of birth and checksum. """
+    if not id_number:
+        return False
+    id_number = '{}'.format(id_number).strip()
+    return len(id_number) == 13 and id_number.isdigit() and _validate(id_number)
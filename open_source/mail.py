@@ -0,0 +1,184 @@
+"""
+Outgoing mail over a small pool of reused SMTP connections.
+
+A ``Mailer`` keeps up to ``size`` authenticated connections open. Each
+send borrows one, so the TLS handshake and login happen once per
+connection rather than once per message, and ``send_all`` delivers a batch
+over that many threads. smtplib connections are not thread safe, so a
+connection is only ever used by the thread that borrowed it.
+
+Transient failures (dropped connections, timeouts, 4xx replies) are retried
+on a fresh connection up to ``attempts`` times with a linear backoff;
+permanent ones (5xx replies, refused recipients) fail at once. ``send_all``
+never raises for a single message: it returns each key's error, or None
+once delivered.
+
+Host, port and SSL come from the config, so a local stand-in such as
+``python -m aiosmtpd -n -l localhost:8025`` with ``SMTP_PORT=8025
+SMTP_SSL=0`` receives everything; login is skipped when the server does not
+offer AUTH.
+
+Usage::
+
+    with mail.Mailer() as mailer:
+        errors = mailer.send_all({notification.id: message for notification, message in messages})
+        >> {12: None, 13: 'Error, (550, b"Mailbox unavailable")'}
+"""
+import logging
+import queue
+import smtplib
+import ssl
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Dict, Hashable, Optional
+
+from open_source import config
+
+
+logger = logging.getLogger(__name__)
+
+conf = config.get_config()
+
+ATTEMPTS = 3
+
+BACKOFF = 2
+
+TIMEOUT = 30
+
+
+def is_transient(error: Exception) -> bool:
+    """ Whether sending again on a fresh connection may succeed. """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # timeouts, refused and reset sockets
+    return isinstance(error, OSError)
+
+
+class Mailer:
+    """ A pool of up to size SMTP connections shared by the threads of send_all. """
+
+    def __init__(self, host: str = None, port: int = None, use_ssl: bool = None, username: str = None,
+                 password: str = None, size: int = None, attempts: int = ATTEMPTS, backoff: float = BACKOFF,
+                 timeout: float = TIMEOUT):
+        self.host = host or conf.SMTP_HOST
+        self.port = port or conf.SMTP_PORT
+        self.use_ssl = conf.SMTP_SSL if use_ssl is None else use_ssl
+        self.username = conf.SENDER_EMAIL if username is None else username
+        self.password = conf.SENDER_PASSWORD if password is None else password
+        self.size = size or conf.SMTP_POOL_SIZE
+        self.attempts = attempts
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        server.ehlo()
+        if self.username and self.password and server.has_extn('auth'):
+            server.login(self.username, self.password)
+        return server
+
+    def _borrow(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            grow = self._open < self.size
+            if grow:
+                self._open += 1
+
+        if not grow:
+            return self._idle.get()
+
+        try:
+            return self._connect()
+        except:
+            with self._lock:
+                self._open -= 1
+            raise
+
+    def _release(self, server: smtplib.SMTP):
+        self._idle.put(server)
+
+    def _discard(self, server: smtplib.SMTP):
+        with self._lock:
+            self._open -= 1
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def send(self, message: Message):
+        """ Delivers one message to its To header, retrying transient failures. Raises the last error. """
+        for attempt in range(1, self.attempts + 1):
+            try:
+                server = self._borrow()
+            except Exception as e:
+                if attempt == self.attempts or not is_transient(e):
+                    raise
+                logger.warning("Connecting to {} failed, attempt {} of {}: {}.".format(self.host, attempt, self.attempts, e))
+                time.sleep(self.backoff * attempt)
+                continue
+
+            try:
+                server.send_message(message)
+            except Exception as e:
+                # a failed exchange can leave the connection mid command, so it is not reused
+                self._discard(server)
+                if attempt == self.attempts or not is_transient(e):
+                    raise
+                logger.warning("Sending {} failed, attempt {} of {}: {}.".format(message['Subject'], attempt, self.attempts, e))
+                time.sleep(self.backoff * attempt)
+            else:
+                self._release(server)
+                return
+
+    def send_all(self, messages: Dict[Hashable, Message]) -> Dict[Hashable, Optional[str]]:
+        """ Delivers messages over the pool in parallel and returns each key's error, None when sent. """
+        def deliver(key):
+            try:
+                self.send(messages[key])
+                return key, None
+            except Exception as e:
+                logger.exception("Error, failed to send message {}.".format(key))
+                return key, "Error, {}".format(e)
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return dict(executor.map(deliver, list(messages)))
+
+    def close(self):
+        """ Quits every idle connection. """
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+            with self._lock:
+                self._open -= 1
+            try:
+                server.quit()
+            except Exception:
+                server.close()
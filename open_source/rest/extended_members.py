@@ -1,33 +1,35 @@
 from datetime import datetime
-from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from open_source.core.main_members import MainMember
 
+from open_source.core import jobs, pagination
 from open_source.core.extended_members import ExtendedMember
+from open_source.core.graphs import EXTENDED_MEMBER_LIST
+from open_source.core.jobs import Job
+from open_source.core.member_identities import MemberIdentity
 from open_source.core.applicants import Applicant
-from open_source.core.certificate import Certificate
-from open_source.core.parlours import Parlour
+from open_source.core import certificate, certificate_batches
 from open_source.core.plans import Plan
 from falcon_cors import CORS
 
 import falcon
-import os
 import json
 import logging
 import uuid
 import pendulum
 
-from open_source import db
+from open_source import db, id_numbers, storage
 
 from open_source.core.applicants import Applicant
 
-from za_id_number.za_id_number import SouthAfricanIdentityValidate
 
 
 logger = logging.getLogger(__name__)
 public_cors = CORS(allow_all_origins=True)
 
+CERTIFICATE_BATCH_SIZE = 200
+
 
 def check_age_limit(extended_members, plan):
     result = []
@@ -109,28 +111,20 @@ class ExtendedMembersGetAllEndpoint:
                 if not applicant:
                     raise falcon.HTTPBadRequest()
 
-                plan = applicant.plan
-                extended_members = session.query(ExtendedMember).filter(
+                extended_members = EXTENDED_MEMBER_LIST.query(session).filter(
                     ExtendedMember.state == ExtendedMember.STATE_ACTIVE,
                     ExtendedMember.applicant_id == applicant.id
-                ).all()
+                ).order_by(ExtendedMember.id)
 
                 if notice:
-                     extended_members = session.query(ExtendedMember).filter(
-                        ExtendedMember.state == ExtendedMember.STATE_ACTIVE,
-                        ExtendedMember.age_limit_exceeded == True,
-                        ExtendedMember.applicant_id == applicant.id
-                    ).all()
-                if not extended_members:
-                    extended_members = session.query(ExtendedMember).filter(
-                        ExtendedMember.state == ExtendedMember.STATE_ACTIVE,
-                        ExtendedMember.applicant_id == applicant.id
-                    ).all()
+                    exceeded = extended_members.filter(ExtendedMember.age_limit_exceeded == True)
+                    if session.query(exceeded.exists()).scalar():
+                        extended_members = exceeded
 
-                if not extended_members:
-                    resp.body = json.dumps([])
+                if pagination.is_paginated(req.params):
+                    resp.body = json.dumps(pagination.paginate(extended_members, req.params, EXTENDED_MEMBER_LIST.render), default=str)
                 else:
-                    resp.body = json.dumps([extended_member.to_dict() for extended_member in extended_members], default=str)
+                    resp.body = json.dumps(EXTENDED_MEMBER_LIST.render(extended_members.all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -161,20 +155,21 @@ class ExtendedMembersGetAllArchivedEndpoint:
                     raise falcon.HTTPBadRequest()
 
                 if applicant.state != Applicant.STATE_ACTIVE:
-                    extended_members = session.query(ExtendedMember).filter(
+                    extended_members = EXTENDED_MEMBER_LIST.query(session).filter(
                         ExtendedMember.state != ExtendedMember.STATE_DELETED,
                         ExtendedMember.applicant_id == applicant.id
-                    ).all()
+                    )
                 else:
-                    extended_members = session.query(ExtendedMember).filter(
+                    extended_members = EXTENDED_MEMBER_LIST.query(session).filter(
                         ExtendedMember.state == ExtendedMember.STATE_ARCHIVED,
                         ExtendedMember.applicant_id == applicant.id
-                    ).all()
+                    )
+                extended_members = extended_members.order_by(ExtendedMember.id)
 
-                if not extended_members:
-                    resp.body = json.dumps([])
+                if pagination.is_paginated(req.params):
+                    resp.body = json.dumps(pagination.paginate(extended_members, req.params, EXTENDED_MEMBER_LIST.render), default=str)
                 else:
-                    resp.body = json.dumps([extended_member.to_dict() for extended_member in extended_members], default=str)
+                    resp.body = json.dumps(EXTENDED_MEMBER_LIST.render(extended_members.all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -229,17 +224,6 @@ class ExtendedMembersPostEndpoint:
     def is_not_secure(self):
         return not self.secure
 
-    def get_date_of_birth(self, date_of_birth=None, id_number=None):
-        current_year = datetime.now().year
-        year_string = str(current_year)[2:]
-        century = 19
-        if date_of_birth:
-            return date_of_birth.replace('T', " ")[:10]
-        if id_number:
-            if 0 <= int(id_number[:2]) <= int(year_string):
-                century = 20
-            return '{}{}-{}-{}'.format(century,id_number[:2], id_number[2:4], id_number[4:-6])[:10]
-
     def get_date_joined(self, date_joined):
         return date_joined.replace('T', " ")[:10]
 
@@ -274,24 +258,7 @@ class ExtendedMembersPostEndpoint:
                     raise falcon.HTTPNotFound(title="Error", description="Date joined is a required field.")
 
                 if req.get("id_number"):
-                    applicants = session.query(Applicant).filter(Applicant.plan_id == applicant.plan_id).all()
-                    applicant_ids = [applicant.id for applicant in applicants]
-                    id_number = session.query(MainMember).filter(
-                        MainMember.id_number == req.get("id_number"),
-                        MainMember.applicant_id.in_(applicant_ids),
-                        MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED))
-                    ).first()
-
-                    if not id_number:
-                        applicants = session.query(Applicant).filter(Applicant.plan_id == applicant.plan_id).all()
-                        applicant_ids = [applicant.id for applicant in applicants]
-                        id_number = session.query(ExtendedMember).filter(
-                            ExtendedMember.id_number == req.get("id_number"),
-                            ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                            ExtendedMember.applicant_id.in_(applicant_ids)
-                        ).first()
-
-                    if id_number:
+                    if MemberIdentity.find(session, applicant.parlour_id, req.get("id_number")):
                         raise falcon.HTTPBadRequest(title="Error", description="ID number already exists for either main member or extended member.")
 
                 date_of_birth = None
@@ -361,17 +328,9 @@ class ExtendedMembersPostEndpoint:
                     min_age_limit = plan.additional_extended_minimum_age
                     max_age_limit = plan.additional_extended_maximum_age
 
-                if not date_of_birth:
-                    id_number = req.get("id_number")
-                    if int(id_number[0:2]) > 21:
-                        number = '19{}'.format(id_number[0:2])
-                    else:
-                        number = '20{}'.format(id_number[0:2])
-                    date_of_birth = '{}-{}-{}'.format(number, id_number[2:4], id_number[4:6])
-                if req.get('id_number'):
-                    dob = pendulum.parse(date_of_birth).date()
-                else:
-                    dob = date_of_birth
+                dob = id_numbers.parse_date_of_birth(date_of_birth, req.get("id_number"))
+                if not dob:
+                    raise falcon.HTTPBadRequest(title="Error", description="Invalid date of birth or ID number.")
                 extended_member.date_of_birth = dob
                 now = datetime.now().date()
 
@@ -393,11 +352,7 @@ class ExtendedMembersPostEndpoint:
 
                 applicant.extended_members.append(extended_member)
                 extended_member.save(session)
-                old_file = applicant.document
-                update_certificate(applicant)
-
-                if old_file and os.path.exists(old_file):
-                    os.remove(old_file)
+                defer_certificate(session, applicant)
 
                 resp.body = json.dumps(extended_member.to_dict(), default=str)
 
@@ -419,17 +374,6 @@ class ExtendedMemberCheckAgeLimitEndpoint:
     def is_not_secure(self):
         return not self.secure
 
-    def get_date_of_birth(self, date_of_birth=None, id_number=None):
-        current_year = datetime.now().year
-        year_string = str(current_year)[2:]
-        century = 19
-        if date_of_birth:
-            return date_of_birth.replace('T', " ")[:10]
-        if id_number:
-            if 0 <= int(id_number[:2]) <= int(year_string):
-                century = 20
-            return '{}{}-{}-{}'.format(century,id_number[:2], id_number[2:4], id_number[4:-6])[:10]
-
     def on_get(self, req, resp, id):
 
         with db.no_transaction() as session:
@@ -458,20 +402,7 @@ class ExtendedMemberCheckAgeLimitEndpoint:
                 raise falcon.HTTPBadRequest(title="Applicant not found", description="Applicant does not exist.")
 
             if id_number:
-                is_ID_number = session.query(MainMember).filter(
-                    MainMember.id_number == id_number,
-                    MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED)),
-                    MainMember.parlour_id == applicant.parlour.id
-                ).first()
-
-                if not is_ID_number:
-                    applicants = session.query(Applicant).filter(Applicant.parlour_id == applicant.parlour.id).all()
-                    applicant_ids = [applicant.id for applicant in applicants]
-                    is_ID_number = session.query(ExtendedMember).filter(
-                        ExtendedMember.id_number == id_number,
-                        ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                        ExtendedMember.applicant_id.in_(applicant_ids)
-                    ).first()
+                is_ID_number = MemberIdentity.find(session, applicant.parlour_id, id_number)
 
             plan = applicant.plan
 
@@ -504,13 +435,9 @@ class ExtendedMemberCheckAgeLimitEndpoint:
                 min_age_limit = plan.additional_extended_minimum_age
                 max_age_limit = plan.additional_extended_maximum_age
 
-            if not date_of_birth:
-                if int(id_number[0:2]) > 21:
-                    number = '19{}'.format(id_number[0:2])
-                else:
-                    number = '20{}'.format(id_number[0:2])
-                date_of_birth = '{}-{}-{}'.format(number, id_number[2:4], id_number[4:6])
-            dob = datetime.strptime(self.get_date_of_birth(date_of_birth, id_number), "%Y-%m-%d").date()
+            dob = id_numbers.parse_date_of_birth(date_of_birth, id_number)
+            if not dob:
+                raise falcon.HTTPBadRequest(title="Error", description="Invalid date of birth or ID number.")
             now = datetime.now().date()
 
             age = relativedelta(now, dob)
@@ -548,17 +475,6 @@ class ExtendedMemberCheckAgeLimitUpdateEndpoint:
     def is_not_secure(self):
         return not self.secure
 
-    def get_date_of_birth(self, date_of_birth=None, id_number=None):
-        current_year = datetime.now().year
-        year_string = str(current_year)[2:]
-        century = 19
-        if date_of_birth:
-            return date_of_birth.replace('T', " ")[:10]
-        if id_number:
-            if 0 <= int(id_number[:2]) <= int(year_string):
-                century = 20
-            return '{}{}-{}-{}'.format(century,id_number[:2], id_number[2:4], id_number[4:-6])[:10]
-
     def on_get(self, req, resp, id):
 
         with db.no_transaction() as session:
@@ -607,17 +523,6 @@ class ExtendedMemberPutEndpoint:
     def is_not_secure(self):
         return not self.secure
 
-    def get_date_of_birth(self, date_of_birth=None, id_number=None):
-        current_year = datetime.now().year
-        year_string = str(current_year)[2:]
-        century = 19
-        if id_number:
-            if 0 <= int(id_number[:2]) <= int(year_string):
-                century = 20
-            return '{}{}-{}-{}'.format(century,id_number[:2], id_number[2:4], id_number[4:-6])[:10]
-        if date_of_birth:
-            return date_of_birth.replace('T', " ")[:10]
-
     def get_date_joined(self, date_joined):
         return date_joined.replace('T', " ")[:10]
 
@@ -627,7 +532,6 @@ class ExtendedMemberPutEndpoint:
 
         with db.transaction() as session:
             applicant_id = req.get("applicant_id")
-            id_number = None
 
             applicant = session.query(Applicant).filter(
                 Applicant.id == applicant_id).one_or_none()
@@ -650,30 +554,7 @@ class ExtendedMemberPutEndpoint:
             if not req.get("date_joined"):
                 raise falcon.HTTPNotFound(title="Error", description="Date joined is a required field.")
 
-            if req.get("id_number"):
-                id_number = session.query(MainMember).filter(MainMember.id_number == req.get("id_number"), MainMember.parlour_id == applicant.parlour_id).first()
-
-            if req.get("id_number") and not id_number:
-                applicants = session.query(Applicant).filter(Applicant.parlour_id == applicant.parlour_id).all()
-                applicant_ids = [applicant.id for applicant in applicants]
-
-                id_number = session.query(MainMember).filter(
-                    MainMember.id_number == req.get("id_number"),
-                    MainMember.applicant_id.in_(applicant_ids),
-                    MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED))
-                ).first()
-
-                if not id_number:
-                    applicants = session.query(Applicant).filter(Applicant.parlour_id == applicant.parlour_id).all()
-                    applicant_ids = [applicant.id for applicant in applicants]
-                    id_number = session.query(ExtendedMember).filter(
-                        ExtendedMember.id_number == req.get("id_number"),
-                        ExtendedMember.id != id,
-                        ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                        ExtendedMember.applicant_id.in_(applicant_ids)
-                    ).first()
-
-            if id_number:
+            if MemberIdentity.find(session, applicant.parlour_id, req.get("id_number"), extended_member_id=id):
                 raise falcon.HTTPBadRequest(title="Error", description="ID number already exists for either main member or extended member.")
 
             plan = applicant.plan
@@ -751,12 +632,7 @@ class ExtendedMemberPutEndpoint:
                     max_age_limit = plan.additional_extended_maximum_age
 
                 if not date_of_birth:
-                    if int(extended_member.id_number[0:2]) > 21:
-                        number = '19{}'.format(extended_member.id_number[0:2])
-                    else:
-                        number = '20{}'.format(extended_member.id_number[0:2])
-                    birth = '{}-{}-{}'.format(number, extended_member.id_number[2:4], extended_member.id_number[4:6])
-                    date_of_birth = datetime.strptime(birth, "%Y-%m-%d")
+                    date_of_birth = id_numbers.date_of_birth(extended_member.id_number)
 
                 dob = date_of_birth
                 now = datetime.now().date()
@@ -778,11 +654,7 @@ class ExtendedMemberPutEndpoint:
                         extended_member.age_limit_exceeded = True
 
                 extended_member.save(session)
-                old_file = applicant.document
-                update_certificate(applicant)
-
-                if old_file and os.path.exists(old_file):
-                    os.remove(old_file)
+                defer_certificate(session, applicant)
 
                 resp.body = json.dumps(applicant.to_dict(), default=str)
             except Exception as e:
@@ -819,7 +691,7 @@ class ExtendedMemberRestorePutEndpoint:
                 applicant = session.query(Applicant).get(extended_member.applicant_id)
 
                 extended_member.save(session)
-                applicant = update_certificate(applicant)
+                defer_certificate(session, applicant)
                 resp.body = json.dumps(extended_member.to_dict(), default=str)
         except:
             logger.exception(
@@ -885,11 +757,7 @@ class ExtededMemberArchiveEndpoint:
                 applicant_id = extended_member.applicant_id
                 applicant = session.query(Applicant).get(applicant_id)
 
-                old_file = applicant.document
-                update_certificate(applicant)
-
-                if old_file and os.path.exists(old_file):
-                    os.remove(old_file)
+                defer_certificate(session, applicant)
 
                 resp.body = json.dumps(extended_member.to_dict(), default=str)
         except:
@@ -960,14 +828,7 @@ class MainMemberPromoteEndpoint:
                 min_age_limit = plan.member_minimum_age
                 max_age_limit = plan.member_maximum_age
 
-                id_number = main_member.id_number
-                if int(id_number[0:2]) > 21:
-                    number = '19{}'.format(id_number[0:2])
-                else:
-                    number = '20{}'.format(id_number[0:2])
-                dob = '{}-{}-{}'.format(number, id_number[2:4], id_number[4:6])
-                # dob = main_member.date_of_birth
-                dob = datetime.strptime(dob, "%Y-%m-%d")
+                dob = id_numbers.parse_date_of_birth(main_member.date_of_birth, main_member.id_number)
                 now = datetime.now()
 
                 age = relativedelta(now, dob)
@@ -990,7 +851,7 @@ class MainMemberPromoteEndpoint:
                     pass
                 main_member.save(session)
 
-                applicant = update_certificate(applicant)
+                defer_certificate(session, applicant)
 
                 resp.body = json.dumps(main_member.to_dict(), default=str)
             except MultipleResultsFound as e:
@@ -1036,268 +897,138 @@ def update_deceased_member(session, applicant, extended_member):
         created_at=datetime.now()
     )
 
-    main_member.save(session)
+    # retired in the same flush that adds the main member, which takes over its ID number
     for x in extended_members:
         if x.id == extended_member.id:
             x.make_deleted()
         else:
             x.applicant_id = new_applicant.id
             x.is_main_member_deceased = False
+    main_member.save(session)
+    defer_certificate(session, new_applicant)
     session.commit()
-    update_certificate(new_applicant)
     return main_member
 
 
-def update_certificate(applicant):
+def update_certificate(session, applicant):
+    """
+    Draws applicant's certificate unless its content hash shows nothing on it
+    changed, reading through the caller's session. Returns False when there
+    is no active main member to draw it for or drawing failed, leaving the
+    old file in place.
+    """
+    main_member = session.query(MainMember).filter(MainMember.applicant_id == applicant.id, MainMember.state == MainMember.STATE_ACTIVE).first()
+    if not main_member:
+        return False
+
+    extended_members = session.query(ExtendedMember).filter(
+        ExtendedMember.applicant_id == applicant.id,
+        ExtendedMember.state == ExtendedMember.STATE_ACTIVE).all()
+
+    content_hash = certificate.content_hash(applicant.parlour, applicant.plan, applicant, main_member, extended_members)
+    if content_hash == applicant.certificate_hash and storage.certificates.exists(applicant.document):
+        return True
+
+    try:
+        applicant.document = certificate.draw(uuid.uuid4(), applicant.parlour, applicant.plan, applicant, main_member, extended_members)
+        applicant.certificate_hash = content_hash
+    except Exception:
+        logger.exception("Error, experienced an error while creating certificate of applicant {}.".format(applicant.id))
+        return False
+
+    return True
+
+
+def render_certificate(session, applicant):
+    """
+    Renders applicant's certificate now, replacing the previous file, and
+    clears its dirty mark unless a newer change marked it again meanwhile.
+    A failed render keeps the mark so it is tried again; returns whether it
+    succeeded.
+    """
+    dirty_at = applicant.certificate_dirty_at
+    old_file = applicant.document
+    if not update_certificate(session, applicant):
+        return False
+
+    if old_file != applicant.document:
+        storage.certificates.delete(old_file)
+
+    if dirty_at:
+        session.query(Applicant).filter(
+            Applicant.id == applicant.id,
+            Applicant.certificate_dirty_at == dirty_at
+        ).update({Applicant.certificate_dirty_at: None}, synchronize_session=False)
+    return True
+
+
+def defer_certificates(session, applicant_ids):
+    """
+    Marks the certificates of applicant_ids stale instead of rendering them in
+    the request. Repeated marks coalesce: a single queued render_certificates
+    job renders each marked applicant once, as does the next download.
+    """
+    now = datetime.now()
+    applicant_ids = list(applicant_ids)
+    for i in range(0, len(applicant_ids), CERTIFICATE_BATCH_SIZE):
+        session.query(Applicant).filter(
+            Applicant.id.in_(applicant_ids[i:i + CERTIFICATE_BATCH_SIZE])
+        ).update({Applicant.certificate_dirty_at: now}, synchronize_session=False)
+
+    pending = session.query(Job.id).filter(
+        Job.kind == 'render_certificates',
+        Job.state == Job.STATE_PENDING
+    ).first()
+    if applicant_ids and not pending:
+        Job.submit(session, 'render_certificates')
+
+
+def defer_certificate(session, applicant):
+    defer_certificates(session, [applicant.id])
+
+
+def render_certificates(applicant_ids, progress=None):
+    """ Renders the certificates of applicant_ids now, committing as it goes, and returns the ids that failed. """
+    failed = []
     with db.transaction() as session:
-        parlour = session.query(Parlour).filter(Parlour.id == applicant.parlour.id).one_or_none()
-        plan = session.query(Plan).filter(Plan.id == applicant.plan.id).one_or_none()
-        main_member = session.query(MainMember).filter(MainMember.applicant_id == applicant.id, MainMember.state == MainMember.STATE_ACTIVE).first()
-
-        if main_member:
-            extended_members = session.query(ExtendedMember).filter(
-                ExtendedMember.applicant_id == applicant.id,
-                ExtendedMember.state == ExtendedMember.STATE_ACTIVE).all()
-
-            try:
-                canvas = Certificate(uuid.uuid4())
-                canvas.set_title(parlour.parlourname)
-                canvas.set_address(parlour.address if parlour.address else '')
-                canvas.set_contact(parlour.number)
-                canvas.set_email(parlour.email)
-                canvas.membership_certificate()
-                canvas.set_member("Main Member")
-                canvas.set_name(' '.join([main_member.first_name, main_member.last_name]))
-                canvas.set_id_number(main_member.id_number)
-                canvas.set_date_joined(main_member.date_joined)
-                canvas.set_date_created(main_member.created_at.date())
-                canvas.set_waiting_period(main_member.waiting_period)
-                canvas.set_member_contact(main_member.contact)
-                canvas.set_current_plan(plan.plan)
-                canvas.set_current_premium(plan.premium)
-                canvas.set_physical_address(applicant.address if applicant.address else '')
-
-                for extended_member in extended_members:
-                    canvas.add_other_members(extended_member)
-
-                if plan.benefits:
-                    canvas.set_benefits(plan.benefits)
-                canvas.save()
-                applicant.document = canvas.get_file_path()
-
-            except Exception as e:
-                logger.exception("Error, experienced an error while creating certificate.")
-                print(e)
-
-    return applicant
-
-
-def get_date_of_birth(id_number=None):
-    current_year = datetime.now().year
-    year_string = str(current_year)[2:]
-    century = 19
-    if 0 <= int(id_number[:2]) <= int(year_string):
-        century = 20
-    return '{}{}/{}/{}'.format(century,id_number[:2], id_number[2:4], id_number[4:6])
-
-
-def bulk_insert_extended_members(csv_data, error_data, applicant_id, session):
-    ext_data = []
-    ext_data.append(csv_data)
-
-    for data in ext_data:
-        applicant = session.query(Applicant).filter(
-            Applicant.id == applicant_id,
-            Applicant.state == Applicant.STATE_ACTIVE).one_or_none()
-
-        if not applicant:
-            error_data.append({'data': data, 'error': "Applicant not found."})
-            continue
-
-        if not data[0]:
-            error_data.append({'data': data, 'error': "First name is a required field."})
-            continue
-
-        if not data[1]:
-            error_data.append({'data': data, 'error': "Last name is a required field."})
-            continue
-
-        if not data[2]:
-            error_data.append({'data': data, 'error': "ID number/dob is a required field."})
-            continue
-
-        if not data[8]:
-            error_data.append({'data': data, 'error': "Type of member is a required field."})
-            continue
-
-        if not data[9]:
-            error_data.append({'data': data, 'error': "Relationship to main member is a required field."})
-            continue
-
-        if not data[4]:
-            error_data.append({'data': data, 'error': "Date joined is a required field."})
-            continue
-
-        id_check = '{}'.format(data[2])
-        id_number = None
-        if not id_check:
-            error_data.append({'data': data, 'error': "ID Number is a required field."})
-            continue
-        if len(id_check) == 13:
-            za_validation = SouthAfricanIdentityValidate(id_check)
-            valid = za_validation.validate()
-            if not valid:
-                error_data.append({'data': data, 'error': "Incorrect id_number entered."})
-                continue
-        if id_check and len(id_check) == 13:
-            applicants = session.query(Applicant).filter(Applicant.parlour_id == applicant.parlour_id).all()
-            applicant_ids = [applicant.id for applicant in applicants]
-            id_number = session.query(MainMember).filter(
-                MainMember.id_number == id_check,
-                MainMember.applicant_id.in_(applicant_ids),
-                MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED))
-            ).first()
-
-            if not id_number:
-                applicants = session.query(Applicant).filter(Applicant.parlour_id == applicant.parlour_id).all()
-                applicant_ids = [applicant.id for applicant in applicants]
-                id_number = session.query(ExtendedMember).filter(
-                    ExtendedMember.id_number == id_check,
-                    ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                    ExtendedMember.applicant_id.in_(applicant_ids)
-                ).first()
-
-
-        if len(id_check) != 13:
-            try:
-                date_of_birth = parse(id_check)
-            except:
-                error_data.append({'data': data, 'error': 'Incorrect date format on date of birth or id_number'})
-                continue
-        else:
-            try:
-                date_of_birth = parse(get_date_of_birth(id_check))
-            except ValueError:
-                error_data.append({'data': data, 'error': 'Incorrect date format on date of birth or id_number'})
-                continue
-
-        date_joined = data[4]
-        member_type = '_'.join('{}'.format(data[8]).lower().split(' '))
-        member_relation = '_'.join('{}'.format(data[9]).lower().split(' '))
-        member_type_value = ExtendedMember.text_type(member_type) if ExtendedMember.text_type(member_type) != 'Undefined' else None
-        member_relation_value = ExtendedMember.text_relation(member_relation)
-        if not member_type_value:
-            error_data.append({'data': data, 'error': "Unrecognized member type."})
-            continue
-        if not member_relation_value:
-            error_data.append({'data': data, 'error': "Unrecognized member relation."})
-            continue
-        contact = data[3]
-        
-        member_exists = session.query(ExtendedMember).filter(
-            ExtendedMember.first_name == data[0].strip(),
-            ExtendedMember.last_name == data[1].strip(),
-            ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED))
-        ).first()
-
-        if member_exists:
-            extended_member = member_exists
-            extended_member.id_number = id_check if len(id_check) == 13 else None
-        else:
-            extended_member = ExtendedMember(
-                first_name = data[0],
-                last_name = data[1],
-                number = "".join(["+27", contact[1:]]) if len(str(contact)) == 10 else contact,
-                date_of_birth = date_of_birth,
-                type = member_type_value,
-                id_number = id_check if len(id_check) == 13 else None,
-                relation_to_main_member = member_relation_value,
-                applicant_id = applicant.id,
-                date_joined = date_joined,
-                waiting_period=data[5] if data[5] else 0,
-                state=ExtendedMember.STATE_ACTIVE,
-                created_at = datetime.now(),
-                modified_at = datetime.now()
-            )
-        plan = applicant.plan
-
-        if extended_member:
-            if extended_member.type == 4:
-                if not plan.spouse:
-                    error_data.append({'data': data, 'error': "This plan does not have a spouse."})
-                    continue
-
-                if plan.spouse <= len([member for member in applicant.extended_members if member.type == 4 and member.state == 1]):
-                    error_data.append({'data': data, 'error': "Limit for number of spouse members has been reached."})
-                    continue
-
-            elif extended_member.type == 1:
-                if not plan.beneficiaries:
-                    error_data.append({'data': data, 'error': "This plan does not have dependents."})
-                    continue
-
-                if plan.beneficiaries <= len([member for member in applicant.extended_members if member.type == 1 and member.state == 1]):
-                    error_data.append({'data': data, 'error': "Limit for number of dependent members has been reached."})
-                    continue
-
-            elif extended_member.type == 2:
-                if not plan.extended_members:
-                    error_data.append({'data': data, 'error': "This plan does not have extended-members."})
-                    continue
-
-                if plan.extended_members <= len([member for member in applicant.extended_members if member.type == 2 and member.state == 1]):
-                    error_data.append({'data': data, 'error': "Limit for number of extended-member members has been reached."})
-                    continue
-
-            elif extended_member.type == 3:
-                if not plan.additional_extended_members:
-                    error_data.append({'data': data, 'error': "This plan does not have additional-extended-members."})
-                    continue
-
-                if plan.additional_extended_members <= len([member for member in applicant.extended_members if member.type == 3 and member.state == 1]):
-                    error_data.append({'data': data, 'error': "Limit for number of additional-extended-member members has been reached."})
-                    continue
-
-
-        member_type = extended_member.type
-        min_age_limit = 0
-        max_age_limit = 120
-
-        if member_type == 4:
-            min_age_limit = plan.spouse_minimum_age
-            max_age_limit = plan.spouse_maximum_age
-        elif member_type == 1:
-            min_age_limit = plan.dependant_minimum_age
-            max_age_limit = plan.dependant_maximum_age
-        elif member_type == 2:
-            min_age_limit = plan.extended_minimum_age
-            max_age_limit = plan.extended_maximum_age
-        elif member_type == 3:
-            min_age_limit = plan.additional_extended_minimum_age
-            max_age_limit = plan.additional_extended_maximum_age
-
-        now = datetime.now().date()
-        age = relativedelta(now, date_of_birth)
-
-        years = "{}".format(age.years)
-
-        if max_age_limit and int(max_age_limit):
-            if len(years) > 2 and int(years[2:4]) > int(max_age_limit):
-                extended_member.age_limit_exceeded = True
-            elif int(years) > int(max_age_limit):
-                extended_member.age_limit_exceeded = True
-
-        if min_age_limit and int(min_age_limit):
-            if len(years) > 2 and int(years[2:4]) < int(min_age_limit):
-                extended_member.age_limit_exceeded = True
-            elif int(years) < int(min_age_limit):
-                extended_member.age_limit_exceeded = True
-
-        applicant.extended_members.append(extended_member)
-        extended_member.save(session)
-        old_file = applicant.document
-        update_certificate(applicant)
-
-        if old_file and os.path.exists(old_file):
-            os.remove(old_file)
-    return error_data
+        applicants = session.query(Applicant).filter(Applicant.id.in_(applicant_ids)).all()
+        for done, applicant in enumerate(applicants, 1):
+            if not render_certificate(session, applicant):
+                failed.append(applicant.id)
+            session.commit()
+            if progress and done % 50 == 0:
+                progress(done, len(applicants))
+    return failed
+
+
+@jobs.handler('render_certificates')
+def render_certificates_job(job, params):
+    """
+    Renders every certificate marked stale, oldest mark first, until none are
+    left. Failed ones keep their mark for the next run but are not retried in
+    this one.
+    """
+    rendered, failed = 0, []
+    while True:
+        with db.no_transaction() as session:
+            query = session.query(Applicant.id).filter(Applicant.certificate_dirty_at != None)
+            if failed:
+                query = query.filter(Applicant.id.notin_(failed))
+            applicant_ids = [applicant_id for applicant_id, in query.order_by(Applicant.certificate_dirty_at).limit(CERTIFICATE_BATCH_SIZE)]
+
+        if not applicant_ids:
+            return {'certificates': rendered, 'failed': failed}
+
+        errors = render_certificates(applicant_ids)
+        rendered += len(applicant_ids) - len(errors)
+        failed += errors
+
+
+@jobs.handler('generate_certificates')
+def generate_certificates_job(job, params):
+    return certificate_batches.render_all(
+        parlour_id=params['parlour_id'],
+        start_after=params.get('start_after', 0),
+        force=params.get('force', False),
+        progress=job.set_progress
+    )
@@ -0,0 +1,110 @@
+import falcon
+import json
+import logging
+
+from base64 import b64decode
+
+from open_source import db
+from open_source.core.jobs import HANDLERS, Job
+# the endpoints modules register the import, export, certificate and payment handlers
+from open_source.rest import extended_members, main_members, payments  # noqa: F401
+from falcon_cors import CORS
+
+
+logger = logging.getLogger(__name__)
+public_cors = CORS(allow_all_origins=True)
+
+
+class JobPostEndpoint:
+
+    def __init__(self, secure=False, basic_secure=False):
+        self.secure = secure
+        self.basic_secure = basic_secure
+
+    def is_basic_secure(self):
+        return self.basic_secure
+
+    def is_not_secure(self):
+        return not self.secure
+
+    def on_post(self, req, resp):
+        rest_dict = json.load(req.bounded_stream)
+        kind = rest_dict.get('kind')
+        params = rest_dict.get('params') or {}
+
+        if kind not in HANDLERS:
+            raise falcon.HTTPBadRequest(title="Error", description="Unknown job kind.")
+
+        # uploads travel base64 encoded like the synchronous import
+        payload = b64decode(params.pop('csv')) if params.get('csv') else None
+
+        try:
+            with db.transaction() as session:
+                job = Job.submit(
+                    session, kind, params, payload=payload,
+                    parlour_id=rest_dict.get('parlour_id'),
+                    consultant_id=rest_dict.get('consultant_id')
+                )
+                resp.status = falcon.HTTP_202
+                resp.body = json.dumps(job.to_dict(), default=str)
+        except:
+            logger.exception("Error, experienced error while submitting a {} job.".format(kind))
+            raise falcon.HTTPBadRequest(title="Error", description="Error, experienced error while submitting the job.")
+
+
+class JobGetEndpoint:
+    cors = public_cors
+
+    def __init__(self, secure=False, basic_secure=False):
+        self.secure = secure
+        self.basic_secure = basic_secure
+
+    def is_basic_secure(self):
+        return self.basic_secure
+
+    def is_not_secure(self):
+        return not self.secure
+
+    def on_get(self, req, resp, id):
+        with db.no_transaction() as session:
+            job = session.query(Job).get(id)
+
+            if not job:
+                raise falcon.HTTPNotFound(title="Error", description="Job not found.")
+
+            resp.body = json.dumps(job.to_dict(), default=str)
+
+
+class JobResultGetEndpoint:
+    cors = public_cors
+
+    def __init__(self, secure=False, basic_secure=False):
+        self.secure = secure
+        self.basic_secure = basic_secure
+
+    def is_basic_secure(self):
+        return self.basic_secure
+
+    def is_not_secure(self):
+        return not self.secure
+
+    def on_get(self, req, resp, id):
+        with db.no_transaction() as session:
+            job = session.query(Job).get(id)
+
+            if not job:
+                raise falcon.HTTPNotFound(title="Error", description="Job not found.")
+
+            if not job.is_finished:
+                raise falcon.HTTPConflict(title="Error", description="Job has not finished yet.")
+
+            if job.state == Job.STATE_FAILED:
+                raise falcon.HTTPBadRequest(title="Error", description=job.error or "Job failed.")
+
+            if job.output_name:
+                resp.downloadable_as = job.output_name
+                resp.content_type = job.output_type
+                resp.stream = [job.output]
+                resp.status = falcon.HTTP_200
+            else:
+                resp.body = json.dumps(json.loads(job.result) if job.result else None, default=str)
@@ -1,4 +1,6 @@
+from base64 import b64decode
 from datetime import datetime
+import io
 import os
 import csv
 import uuid
@@ -11,26 +13,35 @@ import pendulum
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
 
-from open_source import config, db
+from open_source import config, db, id_numbers, storage
 
+from open_source.core import jobs, member_imports, pagination
 from open_source.core.applicants import Applicant
 from open_source.core.consultants import Consultant
 from open_source.core.plans import Plan
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
-from sqlalchemy import or_
+from sqlalchemy import extract, or_
 from open_source.core.main_members import MainMember
+from open_source.core.member_counters import MemberCounter
+from open_source.core.member_identities import MemberIdentity
 from open_source.core.extended_members import ExtendedMember
+from open_source.core.graphs import MAIN_MEMBER_LIST
+from open_source.core.jobs import Job
 from open_source.rest import extended_members
-from open_source.rest.extended_members import update_certificate, bulk_insert_extended_members
+from open_source.rest.extended_members import defer_certificate, render_certificate
 from open_source.core.parlours import Parlour
-from open_source.utils import localize_contact
+from open_source.utils import collect, localize_contact
 
 from falcon_cors import CORS
-from za_id_number.za_id_number import SouthAfricanIdentityValidate
 
 logger = logging.getLogger(__name__)
 public_cors = CORS(allow_all_origins=True)
 
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Archived lists are shown most recently changed first, so their cursor walks (modified_at, id).
+ARCHIVED_KEYS = (MainMember.modified_at, MainMember.id)
+
 conf = config.get_config()
 
 class MainMemberGetEndpoint:
@@ -85,19 +96,11 @@ class MainMemberCountEndpoint:
 
                 if "permission" in req.params and req.params["permission"] == "Consultant":
                     consultant = session.query(Consultant).filter(Consultant.id == req.params["user_id"]).one_or_none()
-                applicants = session.query(Applicant).filter(
-                    Applicant.state == Applicant.STATE_ACTIVE,
-                    Applicant.parlour_id == parlour.id
-                ).order_by(Applicant.id.desc())
+                consultant_id = consultant.id if consultant else None
+                main_member_count = MemberCounter.get(session, parlour.id, MemberCounter.NAME_ACTIVE, consultant_id)
 
-                if consultant:
-                    applicants = applicants.filter(Applicant.consultant_id == consultant.id)
-
-                applicant_ids = [applicant.id for applicant in applicants.all()]
-                main_member_count = session.query(MainMember).filter(
-                    MainMember.state == MainMember.STATE_ACTIVE,
-                    MainMember.applicant_id.in_(applicant_ids)
-                ).count()
+                if main_member_count is None:
+                    main_member_count = MemberCounter.active_count(session, parlour.id, consultant_id)
 
                 resp.body = json.dumps({"count": main_member_count}, default=str)
 
@@ -134,18 +137,11 @@ class MainMemberArchivedCountEndpoint:
 
                 if "permission" in req.params and req.params["permission"] == "Consultant":
                     consultant = session.query(Consultant).filter(Consultant.id == req.params["user_id"]).one_or_none()
-                applicants = session.query(Applicant).filter(
-                    or_(Applicant.state == Applicant.STATE_ARCHIVED, Applicant.status == "lapsed"),
-                    Applicant.parlour_id == parlour.id
-                ).order_by(Applicant.id.desc())
+                consultant_id = consultant.id if consultant else None
+                main_member_count = MemberCounter.get(session, parlour.id, MemberCounter.NAME_ARCHIVED, consultant_id)
 
-                if consultant:
-                    applicants = applicants.filter(Applicant.consultant_id == consultant.id)
-
-                applicant_ids = [applicant.id for applicant in applicants.all()]
-                main_member_count = session.query(MainMember).filter(
-                    MainMember.applicant_id.in_(applicant_ids)
-                ).count()
+                if main_member_count is None:
+                    main_member_count = MemberCounter.archived_count(session, parlour.id, consultant_id)
 
                 resp.body = json.dumps({"count": main_member_count}, default=str)
 
@@ -154,7 +150,7 @@ class MainMemberArchivedCountEndpoint:
             raise falcon.HTTPUnprocessableEntity(title="Uprocessable entity", description="Failed to get Applicants for user with ID {}.".format(id))
 
 
-class MainGetAllParlourEndpoint:
+class MainMemberCountersEndpoint:
     cors = public_cors
 
     def __init__(self, secure=False, basic_secure=False):
@@ -170,6 +166,49 @@ class MainGetAllParlourEndpoint:
     def on_get(self, req, resp, id):
         try:
             with db.transaction() as session:
+                parlour = session.query(Parlour).filter(
+                    Parlour.state == Parlour.STATE_ACTIVE,
+                    Parlour.id == id
+                ).one_or_none()
+
+                if not parlour:
+                    raise falcon.HTTPNotFound(title="Not Found", description="Parlour Not Found")
+
+                counters = session.query(MemberCounter).filter(MemberCounter.parlour_id == parlour.id).all()
+                if not counters:
+                    MemberCounter.refresh(session, parlour.id)
+                    counters = session.query(MemberCounter).filter(MemberCounter.parlour_id == parlour.id).all()
+
+                result = {"parlour": {}, "consultants": {}}
+                for counter in counters:
+                    if counter.consultant_id:
+                        result["consultants"].setdefault(counter.consultant_id, {})[counter.name] = counter.count
+                    else:
+                        result["parlour"][counter.name] = counter.count
+
+                resp.body = json.dumps(result, default=str)
+
+        except:
+            logger.exception("Error, Failed to get member counters for parlour with ID {}.".format(id))
+            raise falcon.HTTPUnprocessableEntity(title="Uprocessable entity", description="Failed to get member counters for parlour with ID {}.".format(id))
+
+
+class MainGetAllParlourEndpoint:
+    cors = public_cors
+
+    def __init__(self, secure=False, basic_secure=False):
+        self.secure = secure
+        self.basic_secure = basic_secure
+
+    def is_basic_secure(self):
+        return self.basic_secure
+
+    def is_not_secure(self):
+        return not self.secure
+
+    def on_get(self, req, resp, id):
+        try:
+            with db.no_transaction() as session:
                 try:
                     status = None
                     search_field = None
@@ -213,14 +252,16 @@ class MainGetAllParlourEndpoint:
                 if search_date:
                     search = parse(search_date)
 
-                    main_members = session.query(MainMember).filter(MainMember.state == MainMember.STATE_ACTIVE, MainMember.parlour_id == parlour.id).all()
-                    main_count = len(main_members)
-                    main_members = [m for m in main_members if m.date_joined and m.date_joined.year == search.date().year and m.date_joined.month == search.date().month]
-                    month_count = len(main_members)
+                    main_members = session.query(MainMember).filter(MainMember.state == MainMember.STATE_ACTIVE, MainMember.parlour_id == parlour.id)
+                    main_count = pagination.count(main_members)
+                    month_count = pagination.count(main_members.filter(
+                        extract('year', MainMember.date_joined) == search.date().year,
+                        extract('month', MainMember.date_joined) == search.date().month
+                    ))
 
                     resp.body = json.dumps({"original": main_count, "month": month_count, "period": '-'.join([str(search.date().year), str(search.date().month)])}, default=str)
                 elif search_field:
-                    main_members = session.query(MainMember).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
+                    main_members = MAIN_MEMBER_LIST.query(session).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
                         MainMember.state == MainMember.STATE_ACTIVE,
                         MainMember.parlour_id == parlour.id,
                         or_(
@@ -231,10 +272,12 @@ class MainGetAllParlourEndpoint:
                         )
                     )
 
-                    if not main_members:
-                        resp.body = json.dumps({})
+                    main_members = main_members.order_by(MainMember.id.desc())
+
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members), default=str)
                     else:
-                        resp.body = json.dumps([m.to_dict() for m in main_members.order_by(MainMember.id.desc()).all()], default=str)
+                        resp.body = json.dumps(MainMember.to_dicts(session, main_members.all()), default=str)
                 else:
                     applicants = session.query(Applicant).filter(
                         Applicant.state == Applicant.STATE_ACTIVE,
@@ -251,38 +294,9 @@ class MainGetAllParlourEndpoint:
                     if status:
                         applicants = applicants.filter(Applicant.status == status.lower())
 
-                    applicant_res = [(applicant, applicant.plan) for applicant in applicants.order_by(Applicant.id.desc()).limit(100).all()]
-                    if applicant_res:
-                        for applicant in applicant_res:
-                            if applicant[0].plan.id == applicant[1].id:
-                                max_age_limit = applicant[1].member_maximum_age
-                                min_age_limit = applicant[1].member_minimum_age
-                                main_member = session.query(MainMember).filter(
-                                    MainMember.state == MainMember.STATE_ACTIVE,
-                                    MainMember.applicant_id == applicant[0].id
-                                ).first()
-                                if main_member:
-                                    id_number = main_member.id_number
-                                    number = int(id_number[0:2])
-                                    if number == 0:
-                                        number = 2000
-                                    try:
-                                        dob = datetime(number, int(id_number[2:4]), int(id_number[4:6]),0,0,0,0)
-                                    except:
-                                        dob = datetime(number, int(id_number[2:4]),1,0,0,0,0)
-                                    now = datetime.now()
-                                    age = relativedelta(now, dob)
-
-                                    years = str(age.years)[2:] if str(age.years)[2:].isdigit() else str(age.years)
-                                    if max_age_limit and int(years) > max_age_limit:
-                                        main_member.age_limit_exceeded = True
-                                    if min_age_limit and int(years) < min_age_limit:
-                                        main_member.age_limit_exceeded = True
-                                    session.commit()
-                    applicant_ids = [applicant.id for applicant in applicants.all()]
-                    main_members = session.query(MainMember).filter(
+                    main_members = MAIN_MEMBER_LIST.query(session).filter(
                         MainMember.state == MainMember.STATE_ACTIVE,
-                        MainMember.applicant_id.in_(applicant_ids)
+                        MainMember.applicant_id.in_(applicants.with_entities(Applicant.id))
                     )
 
                     if start_date:
@@ -294,10 +308,13 @@ class MainGetAllParlourEndpoint:
                         main_members = main_members.filter(
                             MainMember.created_at <= end_date
                         )
-                    if not main_members.all():
-                        resp.body = json.dumps({})
+                    main_members = main_members.order_by(MainMember.id.desc())
+
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members), default=str)
                     else:
-                        resp.body = json.dumps([m.to_dict() for m in main_members.order_by(MainMember.id.desc()).limit(100).all()], default=str)
+                        result = MainMember.to_dicts(session, main_members.limit(100).all())
+                        resp.body = json.dumps(result if result else {}, default=str)
 
         except:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -319,7 +336,7 @@ class MainGetAllConsultantEndpoint:
 
     def on_get(self, req, resp, id):
         try:
-            with db.transaction() as session:
+            with db.no_transaction() as session:
                 try:
                     status = None
                     search_field = None
@@ -356,7 +373,7 @@ class MainGetAllConsultantEndpoint:
                     raise falcon.HTTPBadRequest(title="Error", description="No results found.")
 
                 if search_field:
-                    main_members = session.query(MainMember).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
+                    main_members = MAIN_MEMBER_LIST.query(session).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
                         MainMember.state == MainMember.STATE_ACTIVE,
                         MainMember.parlour_id == parlour.id,
                         or_(
@@ -367,10 +384,12 @@ class MainGetAllConsultantEndpoint:
                         )
                     )
 
-                    if not main_members:
-                        resp.body = json.dumps({})
+                    main_members = main_members.order_by(MainMember.id.desc())
+
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members), default=str)
                     else:
-                        resp.body = json.dumps([m.to_dict() for m in main_members.order_by(MainMember.id.desc()).limit(100).all()], default=str)
+                        resp.body = json.dumps(MainMember.to_dicts(session, main_members.limit(100).all()), default=str)
                 else:
                     applicants = session.query(Applicant).filter(
                         Applicant.state == Applicant.STATE_ACTIVE,
@@ -379,59 +398,21 @@ class MainGetAllConsultantEndpoint:
 
                     if status :
                         applicants = applicants.filter(Applicant.consultant_id == consultant.id, Applicant.status == status.lower())
-                    applicants  = applicants.order_by(Applicant.id.desc()).limit(100).all()
-                    applicant_res = [(applicant, applicant.plan) for applicant in applicants]
-                    if applicant_res:
-                        for applicant in applicant_res:
-                            if applicant[0].plan.id == applicant[1].id:
-                                max_age_limit = applicant[1].member_maximum_age if applicant[1].member_maximum_age else 0
-                                min_age_limit = applicant[1].member_minimum_age if applicant[1].member_minimum_age else 0
-                                main_member = session.query(MainMember).filter(
-                                    MainMember.state == MainMember.STATE_ACTIVE,
-                                    MainMember.applicant_id == applicant[0].id
-                                ).first()
-                                if main_member:
-                                    id_number = main_member.id_number
-
-                                    number = int(id_number[0:2])
-                                    if number == 0:
-                                        number = 2000
-                                    try:
-                                        dob = datetime(number, int(id_number[2:4]), int(id_number[4:6]),0,0,0,0)
-                                    except:
-                                        dob = datetime(number, int(id_number[2:4]), 1,0,0,0,0)
-                                    now = datetime.now()
-                                    age = relativedelta(now, dob)
-
-                                    years = "{}".format(age.years)
-
-                                    if len(years) > 2:
-                                        years = years[2:]
-
-                                    if max_age_limit and int(years) > max_age_limit:
-                                        main_member.age_limit_exceeded = True
-                                    elif min_age_limit and int(years) < min_age_limit:
-                                        main_member.age_limit_exceeded = True
-                                    session.commit()
-                    applicant_ids = [applicant.id for applicant in applicants]
+                    main_members = MAIN_MEMBER_LIST.query(session).filter(
+                        MainMember.state == MainMember.STATE_ACTIVE,
+                        MainMember.parlour_id == parlour.id,
+                        MainMember.applicant_id.in_(applicants.with_entities(Applicant.id))
+                    )
+
                     if notice:
-                        main_members = session.query(MainMember).filter(
-                            MainMember.state == MainMember.STATE_ACTIVE,
-                            MainMember.parlour_id == parlour.id,
-                            MainMember.age_limit_exceeded == True,
-                            MainMember.applicant_id.in_(applicant_ids)
-                        ).order_by(MainMember.id.desc())
-                    else:
-                        main_members = session.query(MainMember).filter(
-                            MainMember.state == MainMember.STATE_ACTIVE,
-                            MainMember.parlour_id == parlour.id,
-                            MainMember.applicant_id.in_(applicant_ids)
-                        ).order_by(MainMember.id.desc())
-
-                    if not main_members:
-                        resp.body = json.dumps({})
+                        main_members = main_members.filter(MainMember.age_limit_exceeded == True)
+
+                    main_members = main_members.order_by(MainMember.id.desc())
+
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members), default=str)
                     else:
-                        resp.body = json.dumps([m.to_dict() for m in main_members.all()], default=str)
+                        resp.body = json.dumps(MainMember.to_dicts(session, main_members.limit(100).all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -475,7 +456,7 @@ class MainGetAllArchivedParlourEndpoint:
                 if search_field:
                     extended_members = session.query(ExtendedMember).filter(ExtendedMember.state == ExtendedMember.STATE_ARCHIVED).all()
                     applicant_ids = [ext.applicant_id for ext in extended_members]
-                    main_members = session.query(MainMember).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
+                    main_members = MAIN_MEMBER_LIST.query(session).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
                         or_(MainMember.state == MainMember.STATE_ARCHIVED,
                         MainMember.applicant_id.in_(applicant_ids)),
                         MainMember.parlour_id == parlour.id,
@@ -485,12 +466,12 @@ class MainGetAllArchivedParlourEndpoint:
                             MainMember.id_number.ilike('{}%'.format(search_field)),
                             Applicant.policy_num.ilike('{}%'.format(search_field))
                         )
-                    ).order_by(MainMember.modified_at.desc()).limit(100).all()
+                    ).order_by(MainMember.modified_at.desc())
 
-                    if not main_members:
-                        resp.body = json.dumps([])
-
-                    resp.body = json.dumps([main_member.to_dict() for main_member in main_members], default=str)
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members, ARCHIVED_KEYS), default=str)
+                    else:
+                        resp.body = json.dumps(MainMember.to_dicts(session, main_members.limit(100).all()), default=str)
                 else:
                     extended_members = session.query(ExtendedMember).filter(
                         or_(ExtendedMember.state == ExtendedMember.STATE_ARCHIVED,
@@ -507,16 +488,16 @@ class MainGetAllArchivedParlourEndpoint:
                         applicants = applicants.filter(Applicant.status == status.lower()).all()
 
                     applicant_ids = [applicant.id for applicant in applicants]
-                    main_members = session.query(MainMember).filter(
+                    main_members = MAIN_MEMBER_LIST.query(session).filter(
                         or_(MainMember.state == Applicant.STATE_ARCHIVED,
                             MainMember.applicant_id.in_(applicant_ids)),
                             MainMember.parlour_id == parlour.id
-                    ).order_by(MainMember.modified_at.desc()).limit(100).all()
+                    ).order_by(MainMember.modified_at.desc())
 
-                    if not main_members:
-                        resp.body = json.dumps([])
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members, ARCHIVED_KEYS), default=str)
                     else:
-                        resp.body = json.dumps([main_member.to_dict() for main_member in main_members], default=str)
+                        resp.body = json.dumps(MainMember.to_dicts(session, main_members.limit(100).all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -559,10 +540,10 @@ class MainGetAllArchivedConsultantEndpoint:
                 if search_field:
                     extended_members = session.query(ExtendedMember).filter(ExtendedMember.state == ExtendedMember.STATE_ARCHIVED).all()
                     applicant_ids = [ext.applicant_id for ext in extended_members]
-                    main_members = session.query(
+                    main_members = MAIN_MEMBER_LIST.apply(session.query(
                         MainMember,
                         Applicant
-                    ).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
+                    )).join(Applicant, (MainMember.applicant_id==Applicant.id)).filter(
                         or_(MainMember.state == MainMember.STATE_ARCHIVED,
                         MainMember.applicant_id.in_(applicant_ids)),
                         or_(
@@ -572,12 +553,12 @@ class MainGetAllArchivedConsultantEndpoint:
                             Applicant.policy_num.ilike('{}%'.format(search_field))
                         ),
                         Applicant.consultant_id == consultant.id
-                    ).order_by(MainMember.modified_at.desc()).limit(100).all()
+                    ).order_by(MainMember.modified_at.desc())
 
-                    if not main_members:
-                        resp.body = json.dumps([])
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_search_results(req.params, main_members, ARCHIVED_KEYS), default=str)
                     else:
-                        resp.body = json.dumps([main_member[0].to_dict() for main_member in main_members], default=str)
+                        resp.body = json.dumps(MainMember.to_dicts(session, [main_member[0] for main_member in main_members.limit(100).all()]), default=str)
                 else:
                     extended_members = session.query(ExtendedMember).filter(
                         or_(ExtendedMember.state == ExtendedMember.STATE_ARCHIVED,
@@ -594,14 +575,14 @@ class MainGetAllArchivedConsultantEndpoint:
                         applicants = applicants.filter(Applicant.status == status.lower()).all()
 
                     applicant_ids = [applicant.id for applicant in applicants]
-                    main_members = session.query(MainMember).filter(
+                    main_members = MAIN_MEMBER_LIST.query(session).filter(
                         MainMember.applicant_id.in_(applicant_ids)
-                    ).order_by(MainMember.modified_at.desc()).limit(100).all()
+                    ).order_by(MainMember.modified_at.desc())
 
-                    if not main_members:
-                        resp.body = json.dumps([])
+                    if pagination.is_paginated(req.params):
+                        resp.body = json.dumps(MainMember._paginated_results(req.params, main_members, ARCHIVED_KEYS), default=str)
                     else:
-                        resp.body = json.dumps([main_member.to_dict() for main_member in main_members], default=str)
+                        resp.body = json.dumps(MainMember.to_dicts(session, main_members.limit(100).all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -639,12 +620,20 @@ class MemberCertificateGetEndpoint:
                 if applicant is None:
                     raise falcon.HTTPNotFound(title="Error", description="Applicant not found")
 
-                with open(applicant.document, 'rb') as f:
-                    resp.downloadable_as = applicant.document
-                    resp.content_type = 'application/pdf'
-                    resp.stream = [f.read()]
-                    resp.status = falcon.HTTP_200
+                # render a certificate still waiting in the queue now rather than serve a stale one
+                if applicant.certificate_dirty_at or not applicant.document:
+                    render_certificate(session, applicant)
+
+                if not applicant.document:
+                    raise falcon.HTTPNotFound(title="Error", description="Certificate not found")
 
+                resp.downloadable_as = applicant.document
+                resp.content_type = 'application/pdf'
+                resp.set_stream(*storage.certificates.stream(applicant.document))
+                resp.status = falcon.HTTP_200
+
+        except falcon.HTTPNotFound:
+            raise
         except:
             logger.exception("Error, Failed to get Payment with ID {}.".format(id))
             raise falcon.HTTPUnprocessableEntity(title="Uprocessable entity", description="Failed to get Invoice with ID {}.".format(id))
@@ -809,23 +798,7 @@ class MainMemberPostEndpoint:
             if not req.get("policy_num"):
                 raise falcon.HTTPBadRequest(title="Error", description="Missing policy number field.")
 
-            applicants = session.query(Applicant).filter(Applicant.plan_id == plan.id).all()
-            applicant_ids = [applicant.id for applicant in applicants]
-
-            id_number = session.query(MainMember).filter(
-                MainMember.id_number == req.get("id_number"),
-                MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED)),
-                MainMember.applicant_id.in_(applicant_ids)
-            ).first()
-
-            if not id_number:
-                id_number = session.query(ExtendedMember).filter(
-                    ExtendedMember.id_number == req.get("id_number"),
-                    ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                    ExtendedMember.applicant_id.in_(applicant_ids)
-                ).first()
-
-            if id_number:
+            if MemberIdentity.find(session, plan.parlour_id, req.get("id_number")):
                 raise falcon.HTTPBadRequest(title="Error", description="ID number already exists for either main member or extended member.")
 
             try:
@@ -844,7 +817,6 @@ class MainMemberPostEndpoint:
                 )
 
                 applicant.save(session)
-                date_of_birth = self.get_date(req.get("date_of_birth"))
                 main_member = MainMember(
                     first_name = req.get("first_name"),
                     last_name = req.get("last_name"),
@@ -863,12 +835,9 @@ class MainMemberPostEndpoint:
                 min_age_limit = plan.member_minimum_age
                 max_age_limit = plan.member_maximum_age
 
-                id_number = main_member.id_number
-                if int(id_number[0:2]) > 21:
-                    number = '19{}'.format(id_number[0:2])
-                else:
-                    number = '20{}'.format(id_number[0:2])
-                dob = parse('{}-{}-{}'.format(number, id_number[2:4], id_number[4:6]))
+                dob = id_numbers.parse_date_of_birth(main_member.date_of_birth, main_member.id_number)
+                if dob is None:
+                    raise falcon.HTTPBadRequest(title="Error", description="Encountered error while formating date. Make sure you've entered a valid date or ID number.")
 
                 now = datetime.now()
 
@@ -892,7 +861,7 @@ class MainMemberPostEndpoint:
                     pass
                 main_member.save(session)
 
-                applicant = update_certificate(applicant)
+                defer_certificate(session, applicant)
 
                 resp.body = json.dumps(main_member.to_dict(), default=str)
             except Exception as e:
@@ -932,209 +901,20 @@ class MainMemberBulkPostEndpoint:
         return result
 
     def on_post(self, req, resp, id):
-        import io
-        from base64 import b64decode
-        import openpyxl
         rest_dict = json.load(req.bounded_stream)
-        error_data = []
-        prev_applicant = None
-        is_main_member = False
-        plan_id = rest_dict.pop('plan')
-        csv_data = rest_dict.pop('csv')
-        filename = uuid.uuid4()
-
-        os.chdir('./assets/uploads/spreadsheets')
-        with open('{}.xlsx'.format(filename), "wb") as file:
-            file.write(b64decode(csv_data))
-
-        wookbook = openpyxl.load_workbook('{}.xlsx'.format(filename))
-
-        # Define variable to read the active sheet:
-        worksheet = wookbook.active
-        rows = []
-        # Iterate the loop to read the cell values
-        for i in range(0, worksheet.max_row):
-            if not i == 0:
-                rows.append([])
-                for col in worksheet.iter_cols(1, worksheet.max_column):
-                    rows[i-1].append(col[i].value)
-
-        os.remove('{}.xlsx'.format(filename))
-        os.chdir('../../..')
-
-        for data in rows:
+        content = b64decode(rest_dict.pop('csv'))
 
+        if rest_dict.get('background'):
             with db.transaction() as session:
-                id_check = '{}'.format(data[2])
-                if not any(data):
-                    continue
-                try:
-                    if data[8] or data[9]:
-                        is_main_member = False
-                        if not all([data[8], data[9]]):
-                            error_data.append({'data': data, 'error': "Extended member type and relation to main member are requires fieds."})
-                            continue
-                        if not prev_applicant:
-                            error_data.append({'data': data, 'error': "Main member to extended member has an issue."})
-                            continue
-                        error_data = bulk_insert_extended_members(data, error_data, prev_applicant, session)
-                        continue
-                    else:
-                        is_main_member = True
-                except IndexError:
-                    pass
-                if not id_check:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Missing id_number field."})
-                    continue
-
-                za_validation = SouthAfricanIdentityValidate(id_check)
-                valid = za_validation.validate()
-                if not valid:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Incorrect id_number entered."})
-                    continue
-
-                if not data[0]:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Missing first name field."})
-                    continue
-                if not data[1]:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Missing last name field."})
-                    continue
-                if not data[4]:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Date joined is a required field."})
-                    continue
-                if not data[3]:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Contact number is a required field."})
-                    continue
-
-                consultant = session.query(Consultant).get(id)
-
-                if not consultant:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Consultant does not exist."})
-                    continue
-
-                plan = session.query(Plan).get(plan_id)
-
-                if not plan:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Plan not found."})
-                    continue
-
-                parlour = session.query(Parlour).filter(
-                    Parlour.id == plan.parlour_id,
-                    Parlour.state == Parlour.STATE_ACTIVE).first()
-
-                if not parlour:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': "Parlour does not exist."})
-                    continue
-
-                if not data[7]:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': 'Missing policy number'})
-                    continue
-
-                id_number = session.query(MainMember).filter(
-                    MainMember.id_number == id_check,
-                    MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED)),
-                    MainMember.parlour_id == parlour.id
-                ).first()
-
-                if not id_number:
-                    applicants = session.query(Applicant).filter(Applicant.plan_id == plan.id).all()
-                    applicant_ids = [applicant.id for applicant in applicants]
-                    id_number = session.query(ExtendedMember).filter(
-                        ExtendedMember.id_number == id_check,
-                        ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                        ExtendedMember.applicant_id.in_(applicant_ids)
-                    ).first()
-
-                if id_number:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    if isinstance(id_number,MainMember):
-                        prev_applicant = id_number.applicant_id
-                    error_data.append({'data': data, 'error': 'ID number already exists'})
-                    continue
-
-                applicant = Applicant(
-                    policy_num=data[7],
-                    address=data[6],
-                    status='unpaid',
-                    plan_id=plan.id,
-                    consultant_id=consultant.id,
-                    parlour_id=parlour.id,
-                    old_url=False,
-                    date=datetime.now(),
-                    state=Applicant.STATE_ACTIVE,
-                    modified_at=datetime.now(),
-                    created_at=datetime.now()
-                )
-
-                applicant.save(session)
-                prev_applicant = applicant.id
-
-                date_joined = data[4]
-                main_member = MainMember(
-                    first_name = data[0],
-                    last_name = data[1],
-                    id_number = id_check,
-                    contact = data[3] if len(str(data[3])) == 10 else '0{}'.format(data[3]),
-                    parlour_id = parlour.id,
-                    date_joined = date_joined,
-                    waiting_period = data[5] if data[5] else 0,
-                    state=MainMember.STATE_ACTIVE,
-                    applicant_id = applicant.id,
-                    modified_at = datetime.now(),
-                    created_at = datetime.now()
+                job = Job.submit(
+                    session, 'import_members', {'consultant_id': id, 'plan': rest_dict.get('plan')},
+                    payload=content, consultant_id=id
                 )
+                resp.status = falcon.HTTP_202
+                resp.body = json.dumps(job.to_dict(), default=str)
+            return
 
-                min_age_limit = plan.member_minimum_age
-                max_age_limit = plan.member_maximum_age
-
-                id_number = main_member.id_number
-
-                if int(id_number[0:2]) > (int(str(datetime.now().year)[2:]) - 16):
-                    number = '19{}'.format(id_number[0:2])
-                else:
-                    number = '20{}'.format(id_number[0:2])
-
-                try:
-                    dob = parse('{}/{}/{}'.format(number, id_number[2:4], id_number[4:6]))
-                except ValueError:
-                    prev_applicant = None if is_main_member else prev_applicant
-                    error_data.append({'data': data, 'error': 'Incorrect date formt on date of birth'})
-                    continue
-
-                now = datetime.now()
-
-                age = relativedelta(now, dob)
-
-                years = "{}".format(age.years)
-                try:
-                    if max_age_limit and len(years) > 2 and int(years[2:4]) > max_age_limit:
-                        main_member.age_limit_exceeded = True
-                    elif max_age_limit and int(years) > max_age_limit:
-                        main_member.age_limit_exceeded = True
-                except:
-                    pass
-
-                try:
-                    if min_age_limit and len(years) > 2 and int(years[2:4]) < min_age_limit:
-                        main_member.age_limit_exceeded = True
-                    elif min_age_limit and int(years) < min_age_limit:
-                        main_member.age_limit_exceeded = True
-                except:
-                    pass
-                main_member.save(session)
-
-                applicant = update_certificate(applicant)
-
+        error_data = import_members(id, rest_dict.pop('plan'), content)
         resp.body = json.dumps(error_data, default=str)
 
 
@@ -1151,17 +931,6 @@ class MainMemberCheckAgeLimitEndpoint:
     def is_not_secure(self):
         return not self.secure
 
-    def get_date_of_birth(self, date_of_birth=None, id_number=None):
-        current_year = datetime.now().year
-        year_string = str(current_year)[2:]
-        century = 19
-        if date_of_birth:
-            return date_of_birth.replace('T', " ")[:10]
-        if id_number:
-            if 0 <= int(id_number[:2]) <= int(year_string):
-                century = 20
-            return '{}{}-{}-{}'.format(century,id_number[:2], id_number[2:4], id_number[4:-6])[:10]
-
     def on_get(self, req, resp, id):
 
         with db.no_transaction() as session:
@@ -1183,33 +952,14 @@ class MainMemberCheckAgeLimitEndpoint:
             if not plan:
                 raise falcon.HTTPBadRequest(title="Plan not found", description="Plan does not exist.")
  
-            is_ID_number = session.query(MainMember).filter(
-                MainMember.id_number == id_number_param,
-                MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED)),
-                MainMember.parlour_id == parlour.id
-            ).first()
-
-            if not is_ID_number:
-                applicants = session.query(Applicant).filter(Applicant.parlour_id == parlour.id).all()
-                applicant_ids = [applicant.id for applicant in applicants]
-                is_ID_number = session.query(ExtendedMember).filter(
-                    ExtendedMember.id_number == id_number_param,
-                    ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                    ExtendedMember.applicant_id.in_(applicant_ids)
-                ).first()
+            is_ID_number = MemberIdentity.find(session, parlour.id, id_number_param)
 
             min_age_limit = plan.member_minimum_age
             max_age_limit = plan.member_maximum_age
 
-            if int(id_number_param[0:2]) > 21:
-                number = '19{}'.format(id_number_param[0:2])
-            else:
-                number = '20{}'.format(id_number_param[0:2])
-            try:
-                date_of_birth = '{}-{}-{}'.format(number, id_number_param[2:4], id_number_param[4:6])
-                dob = parse(self.get_date_of_birth(date_of_birth, id_number_param)).date()
-            except:
-                raise falcon.HTTPBadRequest(title="Plan not found", description="Encountered error while formating date. Make sure you've entered a valid date.")
+            dob = id_numbers.date_of_birth(id_number_param)
+            if dob is None:
+                raise falcon.HTTPBadRequest(title="Error", description="Encountered error while formating date. Make sure you've entered a valid date.")
             now = datetime.now().date()
 
             age = relativedelta(now, dob)
@@ -1302,23 +1052,7 @@ class MainMemberPutEndpoint:
             applicant.address = req.get("address")
             applicant.document = req.get("document")
 
-            applicants = session.query(Applicant).filter(Applicant.plan_id == plan.id).all()
-            applicant_ids = [applicant.id for applicant in applicants]
-            id_number = session.query(MainMember).filter(
-                MainMember.id_number == req.get("id_number"),
-                MainMember.applicant_id.in_(applicant_ids),
-                MainMember.id != main_member.id,
-                MainMember.state.in_((MainMember.STATE_ACTIVE, MainMember.STATE_ARCHIVED))
-            ).first()
-
-            if not id_number:
-                id_number = session.query(ExtendedMember).filter(
-                    ExtendedMember.id_number == req.get("id_number"),
-                    ExtendedMember.state.in_((ExtendedMember.STATE_ACTIVE, ExtendedMember.STATE_ARCHIVED)),
-                    ExtendedMember.applicant_id.in_(applicant_ids)
-                ).first()
-
-            if id_number:
+            if MemberIdentity.find(session, applicant.parlour_id, req.get("id_number"), main_member_id=main_member.id):
                 raise falcon.HTTPBadRequest(title="Error", description="ID number already exists for either main member or extended member.")
 
             try:
@@ -1337,7 +1071,7 @@ class MainMemberPutEndpoint:
                     update_deceased_extended_members(session, main_member)
 
                 main_member.save(session)
-                applicant = update_certificate(applicant)
+                defer_certificate(session, applicant)
                 resp.body = json.dumps(main_member.to_dict(), default=str)
             except:
                 logger.exception(
@@ -1421,7 +1155,7 @@ class MainMemberRestorePutEndpoint:
                 applicant.state = Applicant.STATE_ACTIVE
 
                 main_member.save(session)
-                applicant = update_certificate(applicant)
+                defer_certificate(session, applicant)
                 resp.body = json.dumps(main_member.to_dict(), default=str)
         except:
             logger.exception(
@@ -1519,14 +1253,14 @@ class MainMemberDownloadCSVGetEndpoint:
                 if not parlour:
                     raise falcon.HTTPBadRequest("Parlour does not exist.")
 
-                main_members = session.query(MainMember).join(
+                main_members = MAIN_MEMBER_LIST.query(session).join(
                     Applicant, (MainMember.applicant_id==Applicant.id)
                 ).join(Plan, (Applicant.plan_id==Plan.id)).filter(MainMember.parlour_id==parlour.id).all()
 
                 if not main_members:
                     resp.body = json.dumps([])
                 else:
-                    resp.body = json.dumps([main_member.to_dict() for main_member in main_members], default=str)
+                    resp.body = json.dumps(MainMember.to_dicts(session, main_members), default=str)
         except:
             logger.exception(
                 "Error, experienced error while creating Applicant.")
@@ -1557,12 +1291,11 @@ class MainMemberDownloadCSVGetEndpoint:
                 'Premium'
             ])
 
-            main_members = session.query(MainMember).join(
+            main_members = MAIN_MEMBER_LIST.query(session).join(
                 Applicant, (MainMember.applicant_id==Applicant.id)
             ).join(Plan, (Applicant.plan_id==Plan.id)).filter(MainMember.parlour_id==parlour_id).all()
 
-            for main_member in main_members:
-                member_dict = main_member.to_dict()
+            for member_dict in MainMember.to_dicts(session, main_members):
                 writer.writerow([
                     member_dict.get("first_name"),
                     member_dict.get("last_name"),
@@ -1590,123 +1323,23 @@ class ApplicantExportToExcelEndpoint:
 
     def on_get(self, req, resp, id):
         try:
-            with db.transaction() as session:
-                try:
-                    status = None
-                    permission = None
-                    parlour = None
-                    consultant = None
-                    consultants = None
-                    print(req.params)
-                    if "status" in req.params:
-                        status = req.params.pop("status")
-
-                    if "permission" in req.params:
-                        permission = req.params.pop("permission")
-
-                    if permission.lower() == "parlour": 
-                        if 'consultant_id' in req.params:
-                            consultant_id = req.params.pop("consultant_id")
-                            consultant = session.query(Consultant).filter(
-                                Consultant.state == Consultant.STATE_ACTIVE,
-                                Consultant.id == consultant_id
-                            ).one_or_none()
-                        elif 'branch' in req.params:
-                            branch = req.params.pop("branch")
-                            consultants = session.query(Consultant).filter(
-                                Consultant.state == Consultant.STATE_ACTIVE,
-                                Consultant.branch == branch
-                            ).all()
-    
-                        parlour = session.query(Parlour).filter(
-                            Parlour.state == Parlour.STATE_ACTIVE,
-                            Parlour.id == id
-                        ).one_or_none()
-                    elif permission.lower() == "consultant":
-                        consultant = session.query(Consultant).filter(
-                                Consultant.state == Consultant.STATE_ACTIVE,
-                                Consultant.id == id
-                            ).one_or_none()
-                except MultipleResultsFound as e:
-                    raise falcon.HTTPBadRequest(title="Error", description="Error getting applicants")
-
-                if consultant:
-                    applicants = session.query(Applicant).filter(
-                        Applicant.state == Applicant.STATE_ACTIVE,
-                        Applicant.consultant_id == consultant.id
-                    ).order_by(Applicant.id.desc())
-                if consultants:
-                    consultant_ids = [con.id for con in consultants]
-                    applicants = session.query(Applicant).filter(
-                        Applicant.state == Applicant.STATE_ACTIVE,
-                        Applicant.consultant_id.in_(consultant_ids)
-                    ).order_by(Applicant.id.desc())
-                elif parlour:
-                    applicants = session.query(Applicant).filter(
-                        Applicant.state == Applicant.STATE_ACTIVE,
-                        Applicant.parlour_id == parlour.id
-                    ).order_by(Applicant.id.desc())
-
-                if status:
-                    applicants = applicants.filter(Applicant.status == status.lower()).all()
-
-                applicant_ids = [applicant.id for applicant in applicants]
-
-                if not applicant_ids:
-                    raise falcon.HTTPBadRequest(title="Error", description="No Applicants available")
-
-                main_members = session.query(MainMember).filter(
-                    MainMember.state == MainMember.STATE_ACTIVE,
-                    MainMember.applicant_id.in_(applicant_ids)
-                ).all()
-                results = []
+            if 'background' in req.params:
+                req.params.pop('background')
+                with db.transaction() as session:
+                    job = Job.submit(session, 'export_members', dict(req.params, id=id))
+                    resp.status = falcon.HTTP_202
+                    resp.body = json.dumps(job.to_dict(), default=str)
+                return
 
-                for main in main_members:
-                    d = main.to_short_dict()
-                    results.append(d)
+            with db.no_transaction() as session:
+                exported = export_applicants(session, id, req.params)
 
-                    extended_members = session.query(ExtendedMember).filter(
-                        ExtendedMember.state == ExtendedMember.STATE_ACTIVE,
-                        ExtendedMember.applicant_id == main.applicant.id
-                    ).all()
-                    for ex in extended_members:
-                       e = ex.to_short_dict()
-                       results.append(e)
-
-                if results:
-                    data = []
-                    for res in results:
-                        applicant = res.get('applicant')
-
-                        plan = applicant.get('plan')
-                        underwriter = float(plan.get('underwriter_premium')) if plan.get('underwriter_premium') else None
-                        data.append({
-                            'First Name': res.get('first_name'),
-                            'Last Name': res.get('last_name'),
-                            'ID Number': res.get('id_number') if res.get('id_number') else res.get('date_of_birth'),
-                            'Policy Number': applicant.get("policy_num"),
-                            'Contact Number': res.get('contact') if res.get('contact') else res.get('number'),
-                            'Date Joined': res.get('date_joined') if res.get('date_joined') else None,
-                            'Status': applicant.get('status') if res.get else None,
-                            'Premium': None if res.get('relation_to_main_member') else float(plan.get('premium')),
-                            'Underwriter': None if res.get('relation_to_main_member') else underwriter,
-                            'Relation to Main Member': ExtendedMember.relation_to_text.get(res.get('relation_to_main_member')) if res.get('relation_to_main_member') else None,
-                            })
-
-                    df = pd.DataFrame(data)
-                    filename = '{}_{}'.format(consultant.first_name, consultant.last_name) if consultant else parlour.parlourname
-                    writer = pd.ExcelWriter('{}.xlsx'.format(filename), engine='xlsxwriter')
-                    df.to_excel(writer, sheet_name='Sheet1', index=False)
-                    os.chdir('./assets/uploads/spreadsheets')
-                    path = os.getcwd()
-                    writer.save()
-                    os.chdir('../../..')
-
-                    with open('{}/{}.xlsx'.format(path, filename), 'rb') as f:
-                        resp.downloadable_as = '{}.xls'.format(filename)
-                        resp.content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                        resp.stream = [f.read()]
-                        resp.status = falcon.HTTP_200
+            if exported:
+                filename, content = exported
+                resp.downloadable_as = '{}.xls'.format(filename)
+                resp.content_type = XLSX_CONTENT_TYPE
+                resp.stream = [content]
+                resp.status = falcon.HTTP_200
 
         except Exception as e:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
@@ -1945,3 +1578,159 @@ def update_deceased_member(session, member):
     for x in extended_members:
         x.applicant_id = new_applicant.id
     session.commit()
+
+
+def import_members(consultant_id, plan_id, content: bytes):
+    """
+    Imports a member spreadsheet in one transaction and queues one
+    certificate render per family that gained members. Returns the
+    error_data report.
+    """
+    with db.transaction() as session:
+        member_import = member_imports.MemberImport(session, consultant_id, plan_id)
+        error_data = member_import.run(member_imports.read_rows(content))
+        extended_members.defer_certificates(session, member_import.applicant_ids)
+
+    return error_data
+
+
+def export_applicants(session, id, params):
+    """
+    The members spreadsheet of a parlour, branch or consultant as
+    (filename, xlsx bytes), or None when there is nothing to export.
+    """
+    params = dict(params)
+    status = None
+    permission = None
+    parlour = None
+    consultant = None
+    consultants = None
+
+    try:
+        if "status" in params:
+            status = params.pop("status")
+
+        if "permission" in params:
+            permission = params.pop("permission")
+
+        if permission.lower() == "parlour":
+            if 'consultant_id' in params:
+                consultant_id = params.pop("consultant_id")
+                consultant = session.query(Consultant).filter(
+                    Consultant.state == Consultant.STATE_ACTIVE,
+                    Consultant.id == consultant_id
+                ).one_or_none()
+            elif 'branch' in params:
+                branch = params.pop("branch")
+                consultants = session.query(Consultant).filter(
+                    Consultant.state == Consultant.STATE_ACTIVE,
+                    Consultant.branch == branch
+                ).all()
+
+            parlour = session.query(Parlour).filter(
+                Parlour.state == Parlour.STATE_ACTIVE,
+                Parlour.id == id
+            ).one_or_none()
+        elif permission.lower() == "consultant":
+            consultant = session.query(Consultant).filter(
+                    Consultant.state == Consultant.STATE_ACTIVE,
+                    Consultant.id == id
+                ).one_or_none()
+    except MultipleResultsFound as e:
+        raise falcon.HTTPBadRequest(title="Error", description="Error getting applicants")
+
+    if consultant:
+        applicants = session.query(Applicant).filter(
+            Applicant.state == Applicant.STATE_ACTIVE,
+            Applicant.consultant_id == consultant.id
+        ).order_by(Applicant.id.desc())
+    if consultants:
+        consultant_ids = [con.id for con in consultants]
+        applicants = session.query(Applicant).filter(
+            Applicant.state == Applicant.STATE_ACTIVE,
+            Applicant.consultant_id.in_(consultant_ids)
+        ).order_by(Applicant.id.desc())
+    elif parlour:
+        applicants = session.query(Applicant).filter(
+            Applicant.state == Applicant.STATE_ACTIVE,
+            Applicant.parlour_id == parlour.id
+        ).order_by(Applicant.id.desc())
+
+    if status:
+        applicants = applicants.filter(Applicant.status == status.lower()).all()
+
+    applicant_ids = [applicant.id for applicant in applicants]
+
+    if not applicant_ids:
+        raise falcon.HTTPBadRequest(title="Error", description="No Applicants available")
+
+    main_members = MAIN_MEMBER_LIST.query(session).filter(
+        MainMember.state == MainMember.STATE_ACTIVE,
+        MainMember.applicant_id.in_(applicant_ids)
+    ).all()
+    results = []
+
+    extended_by_applicant = collect('applicant_id', session.query(ExtendedMember).filter(
+        ExtendedMember.state == ExtendedMember.STATE_ACTIVE,
+        ExtendedMember.applicant_id.in_([main.applicant_id for main in main_members])
+    ).all())
+
+    limits = MainMember.extended_member_limits(session, [main.applicant_id for main in main_members])
+
+    for main in main_members:
+        d = main.to_short_dict(limits.get(main.applicant_id, 0))
+        results.append(d)
+
+        for ex in extended_by_applicant.get(main.applicant_id, []):
+            e = ex.to_short_dict()
+            results.append(e)
+
+    if not results:
+        return None
+
+    data = []
+    for res in results:
+        applicant = res.get('applicant')
+
+        plan = applicant.get('plan')
+        underwriter = float(plan.get('underwriter_premium')) if plan.get('underwriter_premium') else None
+        data.append({
+            'First Name': res.get('first_name'),
+            'Last Name': res.get('last_name'),
+            'ID Number': res.get('id_number') if res.get('id_number') else res.get('date_of_birth'),
+            'Policy Number': applicant.get("policy_num"),
+            'Contact Number': res.get('contact') if res.get('contact') else res.get('number'),
+            'Date Joined': res.get('date_joined') if res.get('date_joined') else None,
+            'Status': applicant.get('status') if res.get else None,
+            'Premium': None if res.get('relation_to_main_member') else float(plan.get('premium')),
+            'Underwriter': None if res.get('relation_to_main_member') else underwriter,
+            'Relation to Main Member': ExtendedMember.relation_to_text.get(res.get('relation_to_main_member')) if res.get('relation_to_main_member') else None,
+            })
+
+    output = io.BytesIO()
+    df = pd.DataFrame(data)
+    writer = pd.ExcelWriter(output, engine='xlsxwriter')
+    df.to_excel(writer, sheet_name='Sheet1', index=False)
+    writer.save()
+
+    filename = '{}_{}'.format(consultant.first_name, consultant.last_name) if consultant else parlour.parlourname
+    return filename, output.getvalue()
+
+
+@jobs.handler('import_members')
+def import_members_job(job, params):
+    error_data = import_members(params['consultant_id'], params.get('plan'), job.payload)
+    return {'error_data': error_data}
+
+
+@jobs.handler('export_members')
+def export_members_job(job, params):
+    with db.no_transaction() as session:
+        exported = export_applicants(session, params.pop('id'), params)
+
+    if not exported:
+        return {'rows': 0}
+
+    filename, content = exported
+    job.attach('{}.xls'.format(filename), XLSX_CONTENT_TYPE, content)
+    return {'filename': '{}.xls'.format(filename)}
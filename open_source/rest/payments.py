@@ -1,5 +1,4 @@
 from datetime import datetime
-from borb.pdf.canvas.layout.text.heading import Heading
 import falcon
 import json
 import logging
@@ -8,28 +7,20 @@ import uuid
 
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
-from open_source import db
+from open_source import db, storage
 
 from open_source.core.applicants import Applicant
 from open_source.core.main_members import MainMember
-from open_source.core.invoices import Invoice
+from open_source.core.financial_rollups import FinancialRollup
+from open_source.core.invoices import Invoice, InvoiceSequence
 from open_source.core.parlours import Parlour
 from open_source.core.consultants import Consultant
 from open_source.core.plans import Plan
 from open_source.core.payments import Payment
+from open_source.core import jobs, pagination, payment_status, receipt
+from open_source.core.graphs import INVOICE_LIST, MAIN_MEMBER_LIST, PAYMENT_LIST
 from falcon_cors import CORS
 
-from borb.pdf.canvas.layout.table.fixed_column_width_table import FixedColumnWidthTable as Table
-from borb.pdf.canvas.layout.text.paragraph import Paragraph
-
-from borb.pdf.document import Document
-from borb.pdf.page.page import Page
-from borb.pdf.canvas.layout.page_layout.multi_column_layout import SingleColumnLayout
-from borb.pdf.canvas.layout.text.paragraph import Paragraph
-from borb.pdf.canvas.layout.layout_element import Alignment
-from decimal import Decimal
-from borb.pdf.pdf import PDF
-import PyPDF2
 import pandas as pd
 
 from open_source.config import get_config
@@ -134,15 +125,15 @@ class PaymentsGetAllEndpoint:
                 if not applicant:
                     raise falcon.HTTPBadRequest()
 
-                payments = session.query(Payment).filter(
+                payments = PAYMENT_LIST.query(session).filter(
                     Payment.state == Payment.STATE_ACTIVE,
                     Payment.applicant_id == applicant.id
-                ).all()
+                ).order_by(Payment.id)
 
-                if not payments:
-                    resp.body = json.dumps([])
+                if pagination.is_paginated(req.params):
+                    resp.body = json.dumps(pagination.paginate(payments, req.params, PAYMENT_LIST.render), default=str)
                 else:
-                    resp.body = json.dumps([payment.to_dict() for payment in payments], default=str)
+                    resp.body = json.dumps(PAYMENT_LIST.render(payments.all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Parlour for user with ID {}.".format(id))
@@ -255,11 +246,10 @@ class RecieptGetEndpoint:
                 if not invoice:
                     raise falcon.HTTPNotFound(title="Error", description="Invoice not found")
 
-                with open(invoice.document, 'rb') as f:
-                    resp.downloadable_as = invoice.document
-                    resp.content_type = 'application/pdf'
-                    resp.stream = [f.read()]
-                    resp.status = falcon.HTTP_200
+                resp.downloadable_as = invoice.document
+                resp.content_type = 'application/pdf'
+                resp.set_stream(*storage.receipts.stream(invoice.document))
+                resp.status = falcon.HTTP_200
 
                 # resp.body = json.dumps(invoice.document, default=str)
         except:
@@ -318,8 +308,7 @@ class PaymentPutEndpoint:
 def print_invoice(session, payment, applicant, user, amount, dates):
 
     main_member = session.query(MainMember).filter(MainMember.applicant_id == applicant.id).first()
-    last_invoice = session.query(Invoice).filter(Invoice.parlour_id == applicant.parlour.id).order_by(Invoice.id.desc()).first()
-    invoice_number = str(int(last_invoice.number) + 1) if last_invoice else "1" 
+    invoice_number = InvoiceSequence.next_number(session, applicant.parlour_id)
 
     if main_member:
         if user.get("first_name"):
@@ -349,45 +338,17 @@ def print_invoice(session, payment, applicant, user, amount, dates):
             assisted_by = assisted_by,
             number_of_months = str(len(dates)),
             months_paid = ", ".join([d.strftime("%b") for d in dates]),
-            payment_type=payment.payment_type
+            payment_type=payment.payment_type,
+            consultant_id=applicant.consultant_id
         )
 
-    # Create document
-    pdf = Document()
-
-    # Add page
-    page = Page()
-    pdf.append_page(page)
-    page_layout = SingleColumnLayout(page, Decimal(0), Decimal(0))
-
-    page_layout.vertical_margin = page.get_page_info().get_height() * Decimal(0.02)
-    page_layout.add(Heading("       {}".format(invoice.parlour.parlourname), font="Helvetica-Bold", font_size=Decimal(13)))
-    # Invoice information table
-    page_layout.add(_build_invoice_information(invoice))
-
-    # Empty paragraph for spacing
-    page_layout.add(Paragraph(" "))
-
-    os.chdir('./assets/uploads/receipts')
     filename = "{uuid}.{ext}".format(uuid=uuid.uuid4(), ext='pdf')
-    path = '/'.join([os.getcwd(), filename])
-    os.chdir('../../..')
-
-    with open(path, "wb") as pdf_file_handle:
-        PDF.dumps(pdf_file_handle, pdf)
-
-    pdf = PyPDF2.PdfFileReader(path)
-    page0 = pdf.getPage(0)
-    page0.scaleTo(360, 480)  # float representing scale factor - this happens in-place
-    writer = PyPDF2.PdfFileWriter()  # create a writer to save the updated results
-    writer.addPage(page0)
-
-    with open(path, "wb+") as file:
-        writer.write(file)
-
-    invoice.document = path
-    invoice.save(session)
+    invoice.document = storage.receipts.save(filename, receipt.render(invoice))
+    # the invoice and its collection totals commit together
+    session.add(invoice)
+    session.flush()
     invoice.path = "invoices/{}".format(invoice.id)
+    FinancialRollup.add(session, invoice)
     session.commit()
     return invoice
 
@@ -398,7 +359,7 @@ class PaymentDeleteEndpoint:
         try:
             with db.transaction() as session:
 
-                payment = session.query(Payment).filter(Payment.payment_id == id).first()
+                payment = session.query(Payment).filter(Payment.id == id).first()
 
                 if payment is None:
                     raise falcon.HTTPNotFound(title="Payment Not Found")
@@ -406,133 +367,15 @@ class PaymentDeleteEndpoint:
                 if payment.is_deleted():
                     falcon.HTTPNotFound("Payment does not exist.")
 
+                FinancialRollup.remove_payment(session, payment)
                 payment.delete(session)
+                Payment.update_payment_status(session, payment.applicant)
                 resp.body = json.dumps(payment.to_dict(), default=str)
         except:
             logger.exception("Error, Failed to delete Payment with ID {}.".format(id))
             raise falcon.HTTPBadRequest(title="Error", description="Failed to delete Payment with ID {}.".format(id))
 
 
-def _build_invoice_information(invoice):
-
-    table_001 = Table(number_of_rows=33, number_of_columns=2, column_widths= [Decimal(2), Decimal(6)], horizontal_alignment=Alignment.LEFT)
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    paragraph = Paragraph("Date: ", font="Helvetica", font_size=Decimal(13))
-    table_001.add(paragraph)
-    now = datetime.now()
-    table_001.add(Paragraph("%d/%d/%d" % (now.day, now.month, now.year), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT,))
-
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-
-    address = invoice.address if invoice.address else " "
-    table_001.add(Paragraph("Address: ", font="Helvetica", font_size=Decimal(13)))
-    address = '{}\n{}'.format(address[:23], address[23:]) if len(address) > 23 else address
-    table_001.add(Paragraph(address, respect_newlines_in_text=True, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Contact: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph(invoice.contact, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Email: ", font="Helvetica", font_size=Decimal(13)))
-    email = invoice.email if invoice.email else " "
-    email = '{}\n{}'.format(email[:23], email[23:]) if len(email) > 23 else email
-    table_001.add(Paragraph('{}\n'.format(email), respect_newlines_in_text=True, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("---------------------------------------------------------------"))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Customer Details ", font="Helvetica-Bold", font_size=Decimal(13)))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Invoice: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph("#{}".format(invoice.number), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Policy Number: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph("{}".format(invoice.policy_number), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Premium: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph("R {}".format(invoice.premium), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Initial and Surname: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph(invoice.customer, font="Helvetica", font_size=Decimal(16), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("ID Number: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph(invoice.id_number, font="Helvetica", font_size=Decimal(14), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Amount Paid: ", font="Helvetica", font_size=Decimal(13)))
-    amount = str(invoice.amount) if invoice.amount else " "
-    table_001.add(Paragraph("R {}".format(amount), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Month Paid: ", font="Helvetica", font_size=Decimal(13)))
-    months = invoice.number_of_months if invoice.number_of_months else " "
-    table_001.add(Paragraph(months, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Months Paid For: ", font="Helvetica", font_size=Decimal(13)))
-    months_paid = invoice.months_paid if invoice.months_paid else " "
-    table_001.add(Paragraph(months_paid, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Type of Payment: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph(invoice.payment_type, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.add(Paragraph(" "))
-    table_001.add(Paragraph(" "))
-
-    table_001.add(Paragraph("Captured by: ", font="Helvetica", font_size=Decimal(13)))
-    table_001.add(Paragraph(invoice.assisted_by, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
-
-    table_001.set_padding_on_all_cells(Decimal(2), Decimal(1), Decimal(2), Decimal(1))
-    table_001.no_borders()
-    return table_001
-
-
 class InvoicesGetAllEndpoint:
     cors = public_cors
     def __init__(self, secure=False, basic_secure=False):
@@ -557,22 +400,16 @@ class InvoicesGetAllEndpoint:
                 except NoResultFound:
                     raise falcon.HTTPBadRequest(title="Error", description="No applicant fount with this ID.")
 
-                payments = session.query(Payment).filter(
+                invoices = INVOICE_LIST.query(session).join(Payment, Invoice.payment_id == Payment.id).filter(
+                    Invoice.state == Invoice.STATE_ACTIVE,
                     Payment.state == Payment.STATE_ACTIVE,
                     Payment.applicant_id == applicant.id
-                ).all()
-
-                invoices = None
-                if payments:
-                    invoices = session.query(Invoice).filter(
-                        Invoice.state == Invoice.STATE_ACTIVE,
-                        Invoice.payment_id.in_([p.id for p in payments])
-                    ).all()
+                ).order_by(Invoice.id)
 
-                if not invoices:
-                    resp.body = json.dumps([])
+                if pagination.is_paginated(req.params):
+                    resp.body = json.dumps(pagination.paginate(invoices, req.params, INVOICE_LIST.render), default=str)
                 else:
-                    resp.body = json.dumps([invoice.to_dict() for invoice in invoices], default=str)
+                    resp.body = json.dumps(INVOICE_LIST.render(invoices.all()), default=str)
 
         except:
             logger.exception("Error, Failed to get Invoices for user with ID {}.".format(id))
@@ -636,13 +473,59 @@ class InvoiceDeleteEndpoint:
                 if invoice.is_deleted():
                     falcon.HTTPNotFound("Invoice does not exist.")
 
+                if not invoice.is_deleted() and invoice.payment and not invoice.payment.is_deleted():
+                    FinancialRollup.remove(session, invoice)
                 invoice.delete(session)
+                if invoice.payment:
+                    Payment.update_payment_status(session, invoice.payment.applicant)
                 resp.body = json.dumps(invoice.to_dict(), default=str)
         except:
             logger.exception("Error, Failed to delete invoice with ID {}.".format(id))
             raise falcon.HTTPBadRequest(title="Error", description="Failed to delete invoice with ID {}.".format(id))
 
 
+class PaymentTotalsGetEndpoint:
+    cors = public_cors
+    def __init__(self, secure=False, basic_secure=False):
+        self.secure = secure
+        self.basic_secure = basic_secure
+
+    def is_basic_secure(self):
+        return self.basic_secure
+
+    def is_not_secure(self):
+        return not self.secure
+
+    def on_get(self, req, resp, id):
+        """
+        Collections of a parlour from the rollups: ?period=day|month, optional
+        start and end as dd/mm/yyyy, consultant_id and a comma separated
+        group_by of consultant_id, branch and payment_type.
+        """
+        period = req.params.get("period", FinancialRollup.PERIOD_MONTH)
+        if period not in FinancialRollup.PERIODS:
+            raise falcon.HTTPBadRequest(title="Error", description="Period must be day or month.")
+
+        try:
+            start = datetime.strptime(req.params["start"], "%d/%m/%Y").date() if req.params.get("start") else None
+            end = datetime.strptime(req.params["end"], "%d/%m/%Y").date() if req.params.get("end") else None
+        except ValueError:
+            raise falcon.HTTPBadRequest(title="Error", description="Dates must be formatted dd/mm/yyyy.")
+
+        group_by = [name.strip() for name in req.params.get("group_by", "").split(",") if name.strip()]
+
+        try:
+            with db.no_transaction() as session:
+                totals = FinancialRollup.totals(
+                    session, id, period, start=start, end=end,
+                    consultant_id=req.params.get("consultant_id"), group_by=group_by
+                )
+                resp.body = json.dumps(totals, default=str)
+        except:
+            logger.exception("Error, Failed to get payment totals for parlour with ID {}.".format(id))
+            raise falcon.HTTPUnprocessableEntity(title="Uprocessable entlity", description="Failed while getting payment totals.")
+
+
 class InvoiceExportToExcelEndpoint:
     cors = public_cors
     def __init__(self, secure=False, basic_secure=False):
@@ -706,24 +589,25 @@ class InvoiceExportToExcelEndpoint:
 
                 payment_ids = [payment.id for payment in payments]
 
-                invoices = session.query(Invoice).filter(
+                invoices = INVOICE_LIST.query(session).filter(
                     Invoice.parlour_id == parlour.id,
                     Invoice.state == Invoice.STATE_ACTIVE,
                     Invoice.payment_id.in_(payment_ids)
                 ).all()
 
+                main_members = MAIN_MEMBER_LIST.query(session).filter(
+                    MainMember.applicant_id.in_([invoice.payment.applicant_id for invoice in invoices])
+                ).all()
+                main_members_by_applicant = {main_member.applicant_id: main_member for main_member in main_members}
+                limits = MainMember.extended_member_limits(session, main_members_by_applicant.keys())
+
                 results = []
                 for invoice in invoices:
-                    applicant = invoice.payment.applicant
-
-                    try:
-                        main_member = session.query(MainMember).filter(
-                            MainMember.applicant_id == applicant.id
-                        ).one()
+                    main_member = main_members_by_applicant.get(invoice.payment.applicant_id)
 
-                    except NoResultFound:
+                    if not main_member:
                         continue
-                    d = main_member.to_dict()
+                    d = main_member.to_dict(limits.get(main_member.applicant_id, 0))
                     d.update({'assisted_by': invoice.assisted_by, 'payment_date': invoice.created, 'number_of_months': invoice.number_of_months})
                     results.append(d)
 
@@ -765,4 +649,13 @@ class InvoiceExportToExcelEndpoint:
 
         except Exception as e:
             logger.exception("Error, Failed to get Applicants for user with ID {}.".format(id))
-            raise e
\ No newline at end of file
+            raise e
+
+
+@jobs.handler('backfill_paid_through')
+def backfill_paid_through_job(job, params):
+    """ Recomputes the paid through months, of one parlour or all, and the statuses that follow from them. """
+    with db.transaction() as session:
+        applicants = payment_status.backfill_paid_through(session, parlour_id=params.get('parlour_id'), progress=job.set_progress)
+        statuses = payment_status.recompute(session, parlour_id=params.get('parlour_id'))
+    return {'applicants': applicants, 'statuses': statuses}
@@ -1,5 +1,5 @@
 import datetime
-from open_source.core import main_members
+from open_source.core import age_limits, main_members
 import falcon
 import json
 import logging
@@ -214,6 +214,8 @@ class PlanPutEndpoint:
                 plan.benefits = req["benefits"]
                 plan.modified_at = datetime.datetime.now()
                 plan.save(session)
+
+                age_limits.recompute(session, plan_id=plan.id)
                 resp.body = json.dumps(plan.to_dict(), default=str)
         except:
             logger.exception(
@@ -10,7 +10,7 @@ from open_source.rest import middleware
 from open_source.rest import (
     applicants, consultants, parlours, plans,
     main_members, extended_members, payments,
-    additional_extended_members, dependants, notifications, admins
+    additional_extended_members, dependants, notifications, admins, jobs
 )
 
 from falcon_multipart.middleware import MultipartMiddleware
@@ -101,6 +101,7 @@ api.add_route('/open-source/applicants/{id}/delete', applicants.ApplicantDeleteE
 api.add_route('/open-source/consultants/{id}/main-members/all', main_members.MainGetAllConsultantEndpoint())
 api.add_route('/open-source/parlours/{id}/main-members/actions/count', main_members.MainMemberCountEndpoint())
 api.add_route('/open-source/parlours/{id}/main-members/actions/count_archived', main_members.MainMemberArchivedCountEndpoint())
+api.add_route('/open-source/parlours/{id}/main-members/actions/counters', main_members.MainMemberCountersEndpoint())
 api.add_route('/open-source/consultants/{id}/main-members/archived', main_members.MainGetAllArchivedConsultantEndpoint())
 api.add_route('/open-source/parlours/{id}/main-members/all', main_members.MainGetAllParlourEndpoint())
 api.add_route('/open-source/parlours/{id}/main-members/archived', main_members.MainGetAllArchivedParlourEndpoint())
@@ -147,6 +148,7 @@ api.add_route('/open-source/additional_extended_members/{id}/delete', additional
 api.add_route('/open-source/applicants/{id}/payments/all', payments.PaymentsGetAllEndpoint())
 api.add_route('/open-source/applicants/{id}/payments/last', payments.PaymentGetLastEndpoint())
 api.add_route('/open-source/parlours/{id}/payments', payments.PaymentPostEndpoint())
+api.add_route('/open-source/parlours/{id}/payments/totals', payments.PaymentTotalsGetEndpoint())
 
 api.add_route('/open-source/applicants/{id}/invoices/all', payments.InvoicesGetAllEndpoint())
 api.add_route('/open-source/invoices/{id}', payments.RecieptGetEndpoint())
@@ -155,6 +157,10 @@ api.add_route('/open-source/invoice/{id}/delete', payments.InvoiceDeleteEndpoint
 
 api.add_route('/open-source/admins/signup', admins.AdminSignupEndpoint())
 
+api.add_route('/open-source/jobs', jobs.JobPostEndpoint())
+api.add_route('/open-source/jobs/{id}', jobs.JobGetEndpoint())
+api.add_route('/open-source/jobs/{id}/result', jobs.JobResultGetEndpoint())
+
 if __name__ == '__main__':
     from wsgiref.simple_server import make_server
     httpd = make_server('localhost', 8009, api)
@@ -0,0 +1,76 @@
+"""
+Storage for generated documents: membership certificates and receipts.
+
+Producers render into memory and hand the bytes to a store, which writes
+them once, atomically, under its root without touching the process working
+directory. Roots are absolute paths under ``UPLOADS_DIR`` from the config,
+resolved once, so endpoints that still ``os.chdir`` cannot redirect them. Rows keep the absolute path the store returns, as they always
+have, so documents written before this module still resolve.
+
+Downloads stream the stored file in chunks instead of reading it whole.
+
+Usage::
+
+    path = storage.certificates.save('{}.pdf'.format(uuid.uuid4()), buffer.getvalue())
+
+    resp.content_type = 'application/pdf'
+    resp.set_stream(*storage.certificates.stream(path))
+"""
+import os
+import tempfile
+
+from typing import BinaryIO, Tuple
+
+from open_source import config
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LocalStorage:
+    """ Documents kept as files under one directory. """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    @property
+    def path(self) -> str:
+        return self.root
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def save(self, name: str, content: bytes) -> str:
+        """ Writes content as name and returns its path; readers never see a partial file. """
+        path = self.path_for(name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def exists(self, path: str) -> bool:
+        return bool(path) and os.path.exists(path)
+
+    def delete(self, path: str):
+        if self.exists(path):
+            os.remove(path)
+
+    def stream(self, path: str) -> Tuple[BinaryIO, int]:
+        """
+        An open file and its length for ``resp.set_stream``. The WSGI server
+        sends it in chunks and closes it once the response is written.
+        """
+        return open(path, 'rb', buffering=CHUNK_SIZE), os.path.getsize(path)
+
+
+conf = config.get_config()
+
+certificates = LocalStorage(os.path.join(conf.UPLOADS_DIR, 'certificates'))
+
+receipts = LocalStorage(os.path.join(conf.UPLOADS_DIR, 'receipts'))
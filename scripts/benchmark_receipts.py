@@ -0,0 +1,213 @@
+"""
+Times receipt rendering: the borb layout rescaled with PyPDF2 that
+print_invoice used, against the single pass reportlab receipt.
+
+    python -m scripts.benchmark_receipts [renders]
+
+Needs no database; it renders a sample invoice in memory.
+"""
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import io
+import sys
+import timeit
+
+import PyPDF2
+
+from borb.pdf.canvas.layout.layout_element import Alignment
+from borb.pdf.canvas.layout.page_layout.multi_column_layout import SingleColumnLayout
+from borb.pdf.canvas.layout.table.fixed_column_width_table import FixedColumnWidthTable as Table
+from borb.pdf.canvas.layout.text.heading import Heading
+from borb.pdf.canvas.layout.text.paragraph import Paragraph
+from borb.pdf.document import Document
+from borb.pdf.page.page import Page
+from borb.pdf.pdf import PDF
+
+from open_source.core import receipt
+
+
+SAMPLE = SimpleNamespace(
+    parlour=SimpleNamespace(parlourname='Sample Funeral Parlour'),
+    created=datetime(2021, 11, 30, 9, 15),
+    number='10482',
+    address='12 Church Street, Polokwane, 0699',
+    contact='0151234567',
+    email='payments@samplefuneralparlour.co.za',
+    policy_number='SFP-004821',
+    premium='150',
+    customer='T. Mokoena',
+    id_number='8001015009087',
+    amount='450',
+    number_of_months='3',
+    months_paid='Sep, Oct, Nov',
+    payment_type='cash',
+    assisted_by='L. Dlamini'
+)
+
+
+def _build_invoice_information(invoice):
+
+    table_001 = Table(number_of_rows=33, number_of_columns=2, column_widths= [Decimal(2), Decimal(6)], horizontal_alignment=Alignment.LEFT)
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    paragraph = Paragraph("Date: ", font="Helvetica", font_size=Decimal(13))
+    table_001.add(paragraph)
+    now = datetime.now()
+    table_001.add(Paragraph("%d/%d/%d" % (now.day, now.month, now.year), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT,))
+
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+
+    address = invoice.address if invoice.address else " "
+    table_001.add(Paragraph("Address: ", font="Helvetica", font_size=Decimal(13)))
+    address = '{}\n{}'.format(address[:23], address[23:]) if len(address) > 23 else address
+    table_001.add(Paragraph(address, respect_newlines_in_text=True, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Contact: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph(invoice.contact, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Email: ", font="Helvetica", font_size=Decimal(13)))
+    email = invoice.email if invoice.email else " "
+    email = '{}\n{}'.format(email[:23], email[23:]) if len(email) > 23 else email
+    table_001.add(Paragraph('{}\n'.format(email), respect_newlines_in_text=True, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("---------------------------------------------------------------"))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Customer Details ", font="Helvetica-Bold", font_size=Decimal(13)))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Invoice: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph("#{}".format(invoice.number), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Policy Number: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph("{}".format(invoice.policy_number), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Premium: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph("R {}".format(invoice.premium), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Initial and Surname: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph(invoice.customer, font="Helvetica", font_size=Decimal(16), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("ID Number: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph(invoice.id_number, font="Helvetica", font_size=Decimal(14), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Amount Paid: ", font="Helvetica", font_size=Decimal(13)))
+    amount = str(invoice.amount) if invoice.amount else " "
+    table_001.add(Paragraph("R {}".format(amount), font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Month Paid: ", font="Helvetica", font_size=Decimal(13)))
+    months = invoice.number_of_months if invoice.number_of_months else " "
+    table_001.add(Paragraph(months, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Months Paid For: ", font="Helvetica", font_size=Decimal(13)))
+    months_paid = invoice.months_paid if invoice.months_paid else " "
+    table_001.add(Paragraph(months_paid, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Type of Payment: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph(invoice.payment_type, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.add(Paragraph(" "))
+    table_001.add(Paragraph(" "))
+
+    table_001.add(Paragraph("Captured by: ", font="Helvetica", font_size=Decimal(13)))
+    table_001.add(Paragraph(invoice.assisted_by, font="Helvetica", font_size=Decimal(13), horizontal_alignment=Alignment.LEFT))
+
+    table_001.set_padding_on_all_cells(Decimal(2), Decimal(1), Decimal(2), Decimal(1))
+    table_001.no_borders()
+    return table_001
+
+
+def legacy_render(invoice) -> bytes:
+    """ The receipt as print_invoice drew it before receipt.render. """
+    pdf = Document()
+    page = Page()
+    pdf.append_page(page)
+    page_layout = SingleColumnLayout(page, Decimal(0), Decimal(0))
+
+    page_layout.vertical_margin = page.get_page_info().get_height() * Decimal(0.02)
+    page_layout.add(Heading("       {}".format(invoice.parlour.parlourname), font="Helvetica-Bold", font_size=Decimal(13)))
+    page_layout.add(_build_invoice_information(invoice))
+    page_layout.add(Paragraph(" "))
+
+    rendered = io.BytesIO()
+    PDF.dumps(rendered, pdf)
+    rendered.seek(0)
+
+    page0 = PyPDF2.PdfFileReader(rendered).getPage(0)
+    page0.scaleTo(360, 480)
+    writer = PyPDF2.PdfFileWriter()
+    writer.addPage(page0)
+
+    scaled = io.BytesIO()
+    writer.write(scaled)
+    return scaled.getvalue()
+
+
+def benchmark(renders=50):
+    results = {}
+    for name, render in (('borb + PyPDF2', legacy_render), ('reportlab', receipt.render)):
+        render(SAMPLE)  # warm up font and module caches
+        seconds = timeit.timeit(lambda: render(SAMPLE), number=renders)
+        results[name] = seconds / renders
+        print("{:<15} {:>8.2f} ms per receipt, {:>7} bytes".format(name, results[name] * 1000, len(render(SAMPLE))))
+
+    print("speedup: {:.1f}x".format(results['borb + PyPDF2'] / results['reportlab']))
+    return results
+
+
+def cli():
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
+
+
+if __name__ == '__main__':
+    cli()
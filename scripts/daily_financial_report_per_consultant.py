@@ -1,38 +1,68 @@
-
 from datetime import datetime
 
-from open_source import db
+from open_source import db, mail
 
 from open_source.core.parlours import Parlour
 from open_source.core.notifications import Notification
 
+import logging
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 
 def get_parlour(session, notice):
     parlour = session.query(Parlour).get(notice.parlour_id)
     return parlour
 
 
+def is_due(notification, now):
+    if str(now.weekday()) not in notification.week_days.split(", "):
+        return False
+    return not notification.last_run_date or now.date() > notification.last_run_date.date()
+
+
 def cli():
+    """
+    Builds every due report first, then sends them together over one pool
+    of SMTP connections and records the run of each notification that went
+    out. Returns the errors per notification.
+    """
+    now = datetime.now()
+    errors = []
+
     with db.no_transaction() as session:
         notifications = session.query(Notification).filter(Notification.state == Notification.STATE_ACTIVE).order_by(Notification.parlour_id).all()
-        errors = []
+
+        messages = {}
         for notification in notifications:
             try:
-                parlour = get_parlour(session, notification)
-                if str(datetime.now().weekday()) in  notification.week_days.split(", "):
-                    if not notification.last_run_date:
-                        notification.send_email(session, parlour)
-                        notification.modified_at = datetime.now()
-                        notification.last_run_date = datetime.now()
-                    elif datetime.now().date() > notification.last_run_date.date():
-                        notification.send_email(session, parlour)
-                        notification.modified_at = datetime.now()
-                        notification.last_run_date = datetime.now()
-                notification.save(session)
+                if is_due(notification, now):
+                    messages[notification.id] = notification.build_email(session, get_parlour(session, notification))
             except Exception as e:
+                logger.exception("Error, failed to build the report of notification {}.".format(notification.id))
                 errors.append({"notification_id": notification.id, "error": str(e)})
+
+        with mail.Mailer() as mailer:
+            results = mailer.send_all(messages)
+
+        for notification in notifications:
+            if notification.id not in results:
                 continue
 
+            if results[notification.id]:
+                errors.append({"notification_id": notification.id, "error": results[notification.id]})
+            else:
+                notification.modified_at = datetime.now()
+                notification.last_run_date = datetime.now()
+        session.commit()
+
+    logger.info("Daily financial reports: {} sent, {} failed.".format(
+        len([error for error in results.values() if not error]), len(errors)
+    ))
+    return errors
+
 
 if __name__ == "__main__":
     cli()
@@ -1,26 +1,19 @@
-from open_source import db
-from open_source.core.applicants import Applicant
-from open_source.rest import extended_members
+from open_source.core import certificate_batches
 
+import logging
+import sys
 
-def get_all_applicants(session):
-    applicants = session.query(Applicant).filter(Applicant.state != Applicant.STATE_DELETED).all()
-    return applicants
 
+logging.basicConfig(level=logging.INFO)
 
-def update_payments(applicant=None):
-    extended_members.update_certificate(applicant)
 
-
-def create_certificate():
-    with db.transaction() as session:
-        applicants = get_all_applicants(session)
-        for applicant in applicants:
-            update_payments(applicant)
+def create_certificate(start_after=0):
+    """ Re-issues changed certificates of every applicant, resuming after start_after. """
+    return certificate_batches.render_all(start_after=start_after)
 
 
 def cli():
-    create_certificate()
+    create_certificate(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
 
 
 if __name__ == '__main__':
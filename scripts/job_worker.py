@@ -0,0 +1,16 @@
+from open_source.core import jobs
+# the endpoints modules register the import, export, certificate and payment handlers
+from open_source.rest import extended_members, main_members, payments  # noqa: F401
+
+import logging
+
+
+logging.basicConfig(level=logging.INFO)
+
+
+def cli():
+    jobs.work()
+
+
+if __name__ == "__main__":
+    cli()
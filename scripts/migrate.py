@@ -0,0 +1,9 @@
+from open_source import db
+
+
+def cli():
+    db.migrate()
+
+
+if __name__ == '__main__':
+    cli()
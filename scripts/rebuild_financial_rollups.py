@@ -0,0 +1,21 @@
+from open_source import db
+from open_source.core.financial_rollups import FinancialRollup
+from open_source.core.parlours import Parlour
+
+
+def rebuild_financial_rollups():
+    db.create_table(FinancialRollup)
+
+    with db.transaction() as session:
+        parlour_ids = [parlour_id for parlour_id, in session.query(Parlour.id).filter(Parlour.state == Parlour.STATE_ACTIVE)]
+        for parlour_id in parlour_ids:
+            FinancialRollup.refresh(session, parlour_id)
+            session.commit()
+
+
+def cli():
+    rebuild_financial_rollups()
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,21 @@
+from open_source import db
+from open_source.core.member_counters import MemberCounter
+from open_source.core.parlours import Parlour
+
+
+def refresh_member_counters():
+    db.create_table(MemberCounter)
+
+    with db.transaction() as session:
+        parlour_ids = [parlour_id for parlour_id, in session.query(Parlour.id).filter(Parlour.state == Parlour.STATE_ACTIVE)]
+        for parlour_id in parlour_ids:
+            MemberCounter.refresh(session, parlour_id)
+            session.commit()
+
+
+def cli():
+    refresh_member_counters()
+
+
+if __name__ == '__main__':
+    cli()
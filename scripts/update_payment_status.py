@@ -1,62 +1,20 @@
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from open_source import db, utils
-from open_source.core.applicants import Applicant
-from open_source.core.payments import Payment
+from open_source import db
+from open_source.core import payment_status
+from open_source.core.parlours import Parlour
 
-def get_last_payment(session, applicant_id):
-    payment = session.query(Payment).filter(Payment.applicant_id == applicant_id).order_by(Payment.id.desc()).first()
-    return payment
+import logging
 
 
-def get_all_applicants(session):
-    payment = session.query(Applicant).filter(Applicant.state != Applicant.STATE_DELETED).all()
-    return payment
-
-
-def set_state(session, status, applicant_id, state):
-
-    if status == "lapsed":
-        state = 2
-        set_state_main_members(session, applicant_id, state)
-    result = session.execute("""
-        Update applicants set status=:status, state=:state where id=:applicant_id
-    """, {'status': status, 'applicant_id': applicant_id, 'state': state})
-    return result.rowcount
-
-def set_state_main_members(session, applicant_id, state):
-    result = session.execute("""
-        Update main_members set state=:state where applicant_id=:applicant_id
-    """, {'state': state, 'applicant_id': applicant_id})
-    return result.rowcount
-
-def update_payments(session, applicant=None):
-    last_payment = get_last_payment(session, applicant.id)
-    NOW = datetime.now()
-
-    if last_payment:
-        if relativedelta(NOW.date(), last_payment.date.replace(day=1).date()).months > 3:
-            set_state(session, 'lapsed', applicant.id, applicant.state)
-        elif relativedelta(NOW.date(), last_payment.date.replace(day=1).date()).months > 1:
-            set_state(session, 'skipped', applicant.id, applicant.state)
-        elif relativedelta(NOW.date(), last_payment.date.replace(day=1).date()).months > 0 or relativedelta(NOW.date(), last_payment.date.replace(day=1).date()).months == 0 and NOW.month > last_payment.date.month:
-            set_state(session, 'unpaid', applicant.id, applicant.state)
-        else:
-            set_state(session, 'paid', applicant.id, applicant.state)
-    else:
-        if relativedelta(NOW.date(), applicant.date.replace(day=1).date()).months > 3 or relativedelta(NOW.date(), applicant.date.replace(day=1).date()).months == 3 and NOW.month > applicant.date.month:
-            set_state(session, 'lapsed', applicant.id, applicant.state)
-        elif relativedelta(NOW.date(), applicant.date.replace(day=1).date()).months == 0:
-            set_state(session, 'unpaid', applicant.id, applicant.state)
-        else:
-            set_state(session, 'skipped', applicant.id, applicant.state)
+logger = logging.getLogger(__name__)
 
 
 def update_payment_status():
+    """ Recomputes payment statuses parlour by parlour, committing after each. """
     with db.transaction() as session:
-        applicants = get_all_applicants(session)
-        for applicant in applicants:
-            update_payments(session, applicant)
+        parlour_ids = [parlour_id for parlour_id, in session.query(Parlour.id).filter(Parlour.state == Parlour.STATE_ACTIVE)]
+        for parlour_id in parlour_ids:
+            payment_status.recompute(session, parlour_id=parlour_id)
+            session.commit()
 
 
 def cli():
@@ -1,8 +1,7 @@
 from open_source import db
-from open_source.core.applicants import Applicant
 from open_source.core.main_members import MainMember
 from open_source.core.extended_members import ExtendedMember
-from open_source.rest.extended_members import update_certificate
+from open_source.rest.extended_members import defer_certificates
 
 def get_all_members(session):
     members = session.query(MainMember).filter(MainMember.waiting_period > 0, MainMember.state != MainMember.STATE_DELETED).all()
@@ -22,9 +21,7 @@ def update_extended_members_waiting_period(session, applicant_id):
 def update_main_members_waiting_period(session, main_member):
     main_member.waiting_period -= 1
     applicant_id = main_member.applicant_id
-    applicant = session.query(Applicant).get(applicant_id)
     update_extended_members_waiting_period(session, applicant_id)
-    applicant = update_certificate(applicant)
 
 
 def update_waiting_period():
@@ -32,6 +29,8 @@ def update_waiting_period():
         main_members = get_all_members(session)
         for main_member in main_members:
             update_main_members_waiting_period(session, main_member)
+        # rendered by the job worker once the new waiting periods are committed
+        defer_certificates(session, {main_member.applicant_id for main_member in main_members})
         session.commit()
 
 def cli():